@@ -3,7 +3,23 @@ import os
 import threading
 import time
 import numpy as np
-import subprocess
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.q_learning import batch_q_update, flat_q_view
+from common.state_encoder import StateEncoder
+from common.metric_sampler import MetricSampler
+from common.procfs import ProcCollector
+from common.counters import cpu_percentages
+from common.tunables import CPU_GOVERNOR, DROP_CACHES, ZSWAP_ENABLED, read_ahead_path, shared_tunables
+from common.tuning_helper import run_privileged
+from common.psi import PressureEvents, psi_available
+from common.procfs import disk_usage
+from common.events import EventQueue, EventWorker
+from common.workloads import renice_workloads, start_workload, stop_all_workloads
+from common.settle import SettleDetector
+from common.dyna import DynaPlanner
+from common.qtable_store import QTableReader, load_agent_q_table, publish_q_table, stamp_q_meta
 
 NEGATIVE_ACTIONS_INFO = {
     "simulate_cpu_stress":        1,
@@ -19,55 +35,42 @@ NEGATIVE_ACTIONS_INFO = {
     "no_op":                      0,
 }
 
+PRESSURE_EVENTS = {
+    "cpu": "CPU Pressure Stall",
+    "memory": "Memory Pressure Stall",
+    "io": "I/O Pressure Stall",
+}
+
 NEGATIVE_ACTIONS = list(NEGATIVE_ACTIONS_INFO.keys())
+STRESS_INDEX = {name: i for i, name in enumerate(NEGATIVE_ACTIONS)}
+Q_TABLE_PATH = "First Scenario - Desktop/q_table.qtab"
 
 def get_negative_action_delay(action):
     return NEGATIVE_ACTIONS_INFO.get(action, 2)
 
+NEGATIVE_ACTION_MESSAGES = {
+    "simulate_cpu_stress": "Simulating CPU stress...",
+    "simulate_memory_stress": "Simulating memory stress...",
+    "simulate_disk_fill": "Simulating disk fill...",
+    "simulate_disk_latency": "Simulating disk latency...",
+    "stress_tmpfs": "Simulating tmpfs stress...",
+    "play_streaming_video": "Playing streaming video...",
+    "simulate_network_stress": "Simulating network stress...",
+    "simulate_swap_stress": "Simulating swap stress...",
+    "simulate_high_load": "Simulating high load...",
+    "simulate_temp_increase": "Simulating temperature increase...",
+}
+
 def apply_negative_action(action):
-    if action == "no_op":
+    """
+    Start the built-in workload of a negative action (common.workloads) and return it,
+    or None for no_op. Its wait() returns the load actually achieved.
+    """
+    if action not in NEGATIVE_ACTION_MESSAGES:
         print("No operation performed.")
         return None
-    if action == "simulate_cpu_stress":
-        print("Simulating CPU stress...")
-        return subprocess.Popen("stress-ng --cpu 2 --timeout 8", shell=True)
-    elif action == "simulate_memory_stress":
-        print("Simulating memory stress...")
-        return subprocess.Popen("stress-ng --vm 2 --vm-bytes 1G --timeout 8", shell=True)
-    elif action == "simulate_disk_fill":
-        print("Simulating disk fill...")
-        return subprocess.Popen("dd if=/dev/zero of=/tmp/fillfile bs=1M count=2048", shell=True)
-    elif action == "simulate_disk_latency":
-        print("Simulating disk latency...")
-        return subprocess.Popen("stress-ng --hdd 2 --hdd-bytes 1G --timeout 8", shell=True)
-    elif action == "stress_tmpfs":
-        print("Simulating tmpfs stress...")
-        return subprocess.Popen("dd if=/dev/zero of=/dev/shm/tmpfs_stress bs=1M count=1024", shell=True)
-    elif action == "play_streaming_video":
-        print("Playing streaming video...")
-        return subprocess.Popen(
-            "vlc --intf dummy --run-time=8 --play-and-exit https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4 vlc://quit",
-            shell=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-    elif action == "simulate_network_stress":
-        print("Simulating network stress...")
-        server_proc = subprocess.Popen("iperf3 -s", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        time.sleep(1)
-        client_proc = subprocess.Popen("iperf3 -c 127.0.0.1 -t 8", shell=True)
-        return (server_proc, client_proc)
-    elif action == "simulate_swap_stress":
-        print("Simulating swap stress...")
-        return subprocess.Popen("sudo stress-ng --swap 2 --timeout 8", shell=True)
-    elif action == "simulate_high_load":
-        print("Simulating high load...")
-        return subprocess.Popen("timeout 8s yes > /dev/null", shell=True)
-    elif action == "simulate_temp_increase":
-        print("Simulating temperature increase...")
-        return subprocess.Popen("stress-ng --cpu 4 --timeout 8", shell=True)
-    else:
-        return None
+    print(NEGATIVE_ACTION_MESSAGES[action])
+    return start_workload(action)
 
 def get_main_disk():
     """
@@ -79,29 +82,59 @@ def get_main_disk():
             return p.device
     return '/dev/sda'
 
+def normalize_metrics(state, stress=None):
+    """
+    Normalize raw metrics (a state dict) to [0, 1] and concat the one-hot stress.
+    """
+    base = np.array([
+        min(1, state["cpu_usage"] / 100),
+        min(1, state["memory_usage"] / 100),
+        min(1, state["swap_usage"] / 50),
+        min(1, state["load_average"] / 10),
+        min(1, state["disk_usage"] / 100),
+        min(1, state["temperature"] / 100),
+        min(1, state["io_wait"] / 20),
+    ])
+    stress_one_hot = get_stress_one_hot(stress) if stress else np.zeros(len(NEGATIVE_ACTIONS))
+    return np.concatenate([base, stress_one_hot])
+
 def get_param_actions():
-    disk = get_main_disk()
+    """
+    Return (action, {tunable: value}) pairs, applied through common.tunables.
+    Read-ahead values are in KB (blockdev --setra 128 sectors = 64 KB).
+    """
+    read_ahead = read_ahead_path(get_main_disk())
     return [
         # dirty_ratio
-        ("set_dirty_ratio_10", "sudo sysctl -w vm.dirty_ratio=10"),
-        ("set_dirty_ratio_20", "sudo sysctl -w vm.dirty_ratio=20"),
-        ("set_dirty_ratio_40", "sudo sysctl -w vm.dirty_ratio=40"),
+        ("set_dirty_ratio_10", {"vm.dirty_ratio": 10}),
+        ("set_dirty_ratio_20", {"vm.dirty_ratio": 20}),
+        ("set_dirty_ratio_40", {"vm.dirty_ratio": 40}),
         # swappiness
-        ("set_swappiness_10", "sudo sysctl -w vm.swappiness=10"),
-        ("set_swappiness_60", "sudo sysctl -w vm.swappiness=60"),
-        ("set_swappiness_100", "sudo sysctl -w vm.swappiness=100"),
+        ("set_swappiness_10", {"vm.swappiness": 10}),
+        ("set_swappiness_60", {"vm.swappiness": 60}),
+        ("set_swappiness_100", {"vm.swappiness": 100}),
         # read_ahead 
-        ("set_read_ahead_128", f"sudo blockdev --setra 128 {disk}"),
-        ("set_read_ahead_512", f"sudo blockdev --setra 512 {disk}"),
-        ("set_read_ahead_1024", f"sudo blockdev --setra 1024 {disk}"),
+        ("set_read_ahead_128", {read_ahead: 64}),
+        ("set_read_ahead_512", {read_ahead: 256}),
+        ("set_read_ahead_1024", {read_ahead: 512}),
         # cpu governor
-        ("set_cpu_powersave", "sudo sh -c 'echo powersave > /sys/devices/system/cpu/cpu0/cpufreq/scaling_governor'"),
-        ("set_cpu_performance", "sudo sh -c 'echo performance > /sys/devices/system/cpu/cpu0/cpufreq/scaling_governor'"),
+        ("set_cpu_powersave", {CPU_GOVERNOR: "powersave"}),
+        ("set_cpu_performance", {CPU_GOVERNOR: "performance"}),
         # zswap
-        ("enable_zswap", "sudo sh -c 'echo 1 > /sys/module/zswap/parameters/enabled'"),
-        ("disable_zswap", "sudo sh -c 'echo 0 > /sys/module/zswap/parameters/enabled'"),
+        ("enable_zswap", {ZSWAP_ENABLED: 1}),
+        ("disable_zswap", {ZSWAP_ENABLED: 0}),
     ]
 
+def get_default_params():
+    """Tunable values restored by reset_all_params."""
+    return {
+        "vm.dirty_ratio": 20,
+        "vm.swappiness": 60,
+        read_ahead_path(get_main_disk()): 64,
+        CPU_GOVERNOR: "performance",
+        ZSWAP_ENABLED: 0,
+    }
+
 def get_reaction_actions():
     return [
         "lower_process_priority",
@@ -114,9 +147,8 @@ def get_reaction_actions():
 
 def get_stress_one_hot(stress_name):
     one_hot = np.zeros(len(NEGATIVE_ACTIONS))
-    if stress_name in NEGATIVE_ACTIONS:
-        idx = NEGATIVE_ACTIONS.index(stress_name)
-        one_hot[idx] = 1
+    if stress_name in STRESS_INDEX:
+        one_hot[STRESS_INDEX[stress_name]] = 1
     return one_hot
 class EventAgent:
     def __init__(self):
@@ -138,7 +170,8 @@ class EventAgent:
         }
         self.last_stress = None
         self.actions = [a[0] for a in get_param_actions()] + get_reaction_actions()
-        self.action_cmds = {a[0]: a[1] for a in get_param_actions()}
+        self.action_settings = {a[0]: a[1] for a in get_param_actions()}
+        self.tunables = shared_tunables()
         self.bins = {
             "cpu_usage": np.linspace(0, 1, 4),
             "memory_usage": np.linspace(0, 1, 4),
@@ -148,36 +181,88 @@ class EventAgent:
             "temperature": np.linspace(0, 1, 4),
             "io_wait": np.linspace(0, 1, 3),
         }
-        q_table_shape = tuple(len(bins) - 1 for bins in self.bins.values()) + (len(NEGATIVE_ACTIONS), len(self.actions))
-        if os.path.exists("First Scenario - Desktop/q_table.npy"):
-            self.q_table = np.load("First Scenario - Desktop/q_table.npy")
-            print("Q-Table loaded from  First Scenario - Desktop/q_table.npy")
-        else:
-            self.q_table = np.zeros(q_table_shape)
-            print("Initialized new Q-Table.")
+        self.encoder = StateEncoder.from_bins(self.bins, extra_dims=(len(NEGATIVE_ACTIONS),))
+        q_table_shape = self.encoder.shape + (len(self.actions),)
+        self.q_table = np.zeros(q_table_shape)
+        # Live updates of each (state, action), saved with the Q-table
+        self.visits = np.zeros(q_table_shape, dtype=np.uint32)
         self.learning_rate = 0.1
         self.discount_factor = 0.9
         self.exploration_rate = 1.0
         self.exploration_decay = 0.995
+        stored = load_agent_q_table(Q_TABLE_PATH, self.q_table_meta())
+        if stored is not None:
+            self.q_table = stored.q_table
+            if stored.visits is not None:
+                self.visits = stored.visits
+            print(f"Q-Table loaded from {Q_TABLE_PATH}")
+        else:
+            print("Initialized new Q-Table.")
+        self.planner = None
+        self.q_reader = None
         self.running = True
+        self.sampler = None
+        self.settle_detector = None
+        self.collector = None
+        # state is written by the monitor and read by event handlers; decisions are serialized
+        self.state_lock = threading.Lock()
+        self.decision_lock = threading.Lock()
+        self.events = EventQueue()
+        self.event_worker = None
 
     def monitor_metrics(self):
         """
         Monitor system metrics and update state.
+        Uses PSI triggers when the kernel supports them, threshold polling otherwise.
         """
+        if psi_available():
+            try:
+                events = PressureEvents()
+            except OSError as e:
+                print(f"PSI triggers unavailable ({e}), polling thresholds instead.")
+            else:
+                self.monitor_pressure(events)
+                return
         while self.running:
             try:
-                self.state["cpu_usage"] = psutil.cpu_percent(interval=1)
-                self.state["memory_usage"] = psutil.virtual_memory().percent
-                self.state["swap_usage"] = psutil.swap_memory().percent
-                self.state["load_average"] = os.getloadavg()[0]
-                self.state["disk_usage"] = psutil.disk_usage('/').percent
-                self.state["temperature"] = self.get_cpu_temperature()
-                self.state["io_wait"] = psutil.cpu_times().iowait if hasattr(psutil.cpu_times(), 'iowait') else 0
+                self.update_metrics_once()
                 self.check_thresholds()
+                if self.sampler is not None:
+                    # update_metrics_once does not block with a sampler
+                    time.sleep(self.sampler.window)
             except Exception as e:
                 print(f"Error monitoring metrics: {e}")
 
+    def monitor_pressure(self, events, interval=1.0):
+        """
+        Sleep in epoll until a CPU, memory or I/O pressure stall trigger fires and handle it.
+        Temperature and disk space, which have no stall information, are checked every interval.
+        """
+        try:
+            while self.running:
+                try:
+                    for resource, _ in events.wait(interval):
+                        self.post_event(PRESSURE_EVENTS[resource], context={"resource": resource})
+                    self.check_slow_thresholds()
+                except Exception as e:
+                    print(f"Error monitoring pressure: {e}")
+        finally:
+            events.close()
+
+    def check_slow_thresholds(self):
+        """
+        Read temperature and disk usage (cheap, non-blocking) and check their thresholds.
+        """
+        temperature = self.get_cpu_temperature()
+        disk = disk_usage('/')
+        with self.state_lock:
+            self.state["temperature"] = temperature
+            self.state["disk_usage"] = disk
+        if temperature > self.thresholds["high_temperature"]:
+            self.post_event("High Temperature")
+        if 100 - disk < self.thresholds["low_disk_space"]:
+            self.post_event("Low Disk Space")
+
     def get_cpu_temperature(self):
         """
         Get CPU temperature if available.
@@ -196,108 +281,166 @@ class EventAgent:
         """
         Check if any metrics exceed thresholds and trigger events.
         """
-        if self.state["cpu_usage"] > self.thresholds["high_cpu"]:
-            self.handle_event("High CPU Usage")
-        if self.state["memory_usage"] > self.thresholds["high_memory"]:
-            self.handle_event("High Memory Usage")
-        if self.state["temperature"] > self.thresholds["high_temperature"]:
-            self.handle_event("High Temperature")
-        if 100 - self.state["disk_usage"] < self.thresholds["low_disk_space"]:
-            self.handle_event("Low Disk Space")
+        with self.state_lock:
+            state = dict(self.state)
+        if state["cpu_usage"] > self.thresholds["high_cpu"]:
+            self.post_event("High CPU Usage")
+        if state["memory_usage"] > self.thresholds["high_memory"]:
+            self.post_event("High Memory Usage")
+        if state["temperature"] > self.thresholds["high_temperature"]:
+            self.post_event("High Temperature")
+        if 100 - state["disk_usage"] < self.thresholds["low_disk_space"]:
+            self.post_event("Low Disk Space")
+
+    def post_event(self, event_type, context=None):
+        """
+        Queue an event for the event worker, or handle it right away when no worker runs.
+        """
+        if self.event_worker is None:
+            self.handle_event(event_type, context=context)
+        else:
+            self.events.put(event_type, context)
+
+    def start_event_worker(self):
+        """
+        Handle threshold and pressure events in a dedicated worker so that monitoring never
+        blocks on a decision. Duplicate pending events are coalesced (see common.events).
+        """
+        self.event_worker = EventWorker(self.events, self.handle_event).start()
 
-    def handle_event(self, event_type, plot=False):
+    def stop_event_worker(self):
+        if self.event_worker is not None:
+            self.event_worker.stop()
+            self.event_worker = None
+
+    def event_stats(self):
+        """
+        Queue counters and per-event queueing / handling latencies of the event worker.
         """
-        Handle events triggered by GUI or thresholds.
+        return self.event_worker.stats() if self.event_worker is not None else {}
+
+    def handle_event(self, event_type, plot=False, context=None):
+        """
+        Handle events triggered by GUI, thresholds or pressure stalls.
+        context holds extra information on the event (e.g. the stalled resource).
         If plot=True, return the action description for display.
         """
-        print(f"Event received: {event_type}")
-        state = self.get_normalized_state()
-        action_idx = self.select_action(state)
-        reaction_text = self.apply_action(action_idx, return_text=plot)
-        time.sleep(1)
-        self.update_metrics_once()
-        new_state = self.get_normalized_state()
-        reward = self.compute_reward(state, new_state)
-        self.learn(state, action_idx, reward, new_state)
+        print(f"Event received: {event_type}" + (f" {context}" if context else ""))
+        with self.decision_lock:
+            # Decide on the current metrics: pressure triggers and GUI events arrive without
+            # the polling loop having refreshed them (with a sampler this does not block)
+            self.update_metrics_once()
+            state = self.get_normalized_state()
+            action_idx = self.select_action(state)
+            reaction_text = self.apply_action(action_idx, return_text=plot)
+            action_time = time.monotonic()
+            time.sleep(1)
+            self.update_metrics_once(since=action_time)
+            new_state = self.get_normalized_state()
+            reward = self.compute_reward(state, new_state)
+            self.learn(state, action_idx, reward, new_state)
         if plot:
             return reaction_text
 
-    def update_metrics_once(self):
+    def start_sampler(self, period=0.1, window=1.0):
+        """
+        Sample metrics in a background thread so that update_metrics_once no longer blocks.
+        """
+        self.sampler = MetricSampler(period=period, window=window).start()
+        self.settle_detector = SettleDetector(self.sampler)
+
+    def stop_sampler(self):
+        """
+        Stop the background metric sampler, if any.
+        """
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+            self.settle_detector = None
+
+    def wait_settled(self, since, max_wait):
+        """
+        Wait until metrics settle after something done at since (a time.monotonic() value),
+        for at most max_wait seconds, and update state. Return the seconds waited.
+        Without a sampler, sleep max_wait and take a blocking measurement as before.
+        """
+        if self.settle_detector is None:
+            time.sleep(max(0.0, since + max_wait - time.monotonic()))
+            self.update_metrics_once()
+            return time.monotonic() - since
+        snapshot, waited, _ = self.settle_detector.wait(since, max_wait)
+        with self.state_lock:
+            for key in self.state:
+                self.state[key] = getattr(snapshot, key)
+        return waited
+
+    def update_metrics_once(self, since=None):
         """
         Update state with current system metrics.
+        With a running sampler, read its latest snapshot without blocking, or when since
+        (a time.monotonic() value, e.g. when an action was applied) is given, the first
+        snapshot covering a full sampler window after it.
         """
-        self.state["cpu_usage"] = psutil.cpu_percent(interval=1)
-        self.state["memory_usage"] = psutil.virtual_memory().percent
-        self.state["swap_usage"] = psutil.swap_memory().percent
-        self.state["load_average"] = os.getloadavg()[0]
-        self.state["disk_usage"] = psutil.disk_usage('/').percent
-        self.state["temperature"] = self.get_cpu_temperature()
-        self.state["io_wait"] = psutil.cpu_times().iowait if hasattr(psutil.cpu_times(), 'iowait') else 0
+        if self.sampler is not None:
+            snapshot = self.sampler.latest() if since is None else self.sampler.after(since)
+            with self.state_lock:
+                for key in self.state:
+                    self.state[key] = getattr(snapshot, key)
+            return
+        # CPU usage and iowait are rates: % of CPU time over the next second
+        if self.collector is None:
+            self.collector = ProcCollector()
+        before = self.collector.sample()
+        time.sleep(1)
+        after = self.collector.sample()
+        values = {}
+        values["cpu_usage"], values["io_wait"] = cpu_percentages(before, after)
+        values["memory_usage"] = psutil.virtual_memory().percent
+        values["swap_usage"] = psutil.swap_memory().percent
+        values["load_average"] = os.getloadavg()[0]
+        values["disk_usage"] = psutil.disk_usage('/').percent
+        values["temperature"] = self.get_cpu_temperature()
+        with self.state_lock:
+            self.state.update(values)
 
     def get_normalized_state(self):
         """
         Normalize state metrics to [0, 1] and concat one-hot stress.
         """
-        base = np.array([
-            min(1, self.state["cpu_usage"] / 100),
-            min(1, self.state["memory_usage"] / 100),
-            min(1, self.state["swap_usage"] / 50),
-            min(1, self.state["load_average"] / 10),
-            min(1, self.state["disk_usage"] / 100),
-            min(1, self.state["temperature"] / 100),
-            min(1, self.state["io_wait"] / 20),
-        ])
-        stress_one_hot = get_stress_one_hot(self.last_stress) if self.last_stress else np.zeros(len(NEGATIVE_ACTIONS))
-        return np.concatenate([base, stress_one_hot])
+        with self.state_lock:
+            state = dict(self.state)
+        return normalize_metrics(state, self.last_stress)
+
+    def metrics_state_index(self, metrics, stress):
+        """
+        Flat Q-table row of raw metrics (a state dict) under a stress, e.g. from a transition log.
+        """
+        return self.encoder.encode(normalize_metrics(metrics, stress), STRESS_INDEX.get(stress, 0))
 
     def discretize_state(self, state):
         """
         Discretize the state into bins for Q-learning, including stress.
         """
-        metrics_order = [
-            "cpu_usage",
-            "memory_usage",
-            "swap_usage",
-            "load_average",
-            "disk_usage",
-            "temperature",
-            "io_wait",
-        ]
-        discretized_state = []
-        for i, metric in enumerate(metrics_order):
-            value = state[i]
-            bin_edges = self.bins[metric]
-            bin_idx = np.digitize(value, bin_edges) - 1
-            bin_idx = max(0, min(bin_idx, len(bin_edges) - 2))
-            discretized_state.append(bin_idx)
-        if self.last_stress and self.last_stress in NEGATIVE_ACTIONS:
-            stress_idx = NEGATIVE_ACTIONS.index(self.last_stress)
-        else:
-            stress_idx = 0
-        discretized_state.append(stress_idx)
-        return tuple(discretized_state)
+        return self.encoder.decode(self.state_index(state))
     
-    def reset_all_params(self):
+    def reset_all_params(self, snapshot=None):
         """
-        Reset all system parameters to default values.
+        Reset all system parameters to default values, or to a Tunables.snapshot().
+        Only the parameters whose live value differs are written.
         """
-        disk = get_main_disk()
-        subprocess.run("sudo sysctl -w vm.dirty_ratio=20", shell=True)
-        subprocess.run("sudo sysctl -w vm.swappiness=60", shell=True)
-        subprocess.run(f"sudo blockdev --setra 128 {disk}", shell=True)
-        subprocess.run("sudo sh -c 'echo performance > /sys/devices/system/cpu/cpu0/cpufreq/scaling_governor'", shell=True)
-        subprocess.run("sudo sh -c 'echo 0 > /sys/module/zswap/parameters/enabled'", shell=True)
-        time.sleep(1)
+        self.tunables.restore(get_default_params() if snapshot is None else snapshot)
 
     def select_action(self, state):
         """
         Select an action based on the current state using epsilon-greedy policy
         """
-        discretized_state = self.discretize_state(state)
+        state_idx = self.state_index(state)
+        if self.q_reader is not None:
+            self.q_table = self.q_reader.table()
         if np.random.uniform(0, 1) < self.exploration_rate:
             return np.random.randint(0, len(self.actions))
         else:
-            return np.argmax(self.q_table[discretized_state])
+            return np.argmax(flat_q_view(self.q_table)[state_idx])
 
     def apply_action(self, action_idx, return_text=False):
         """
@@ -308,26 +451,27 @@ class EventAgent:
         reaction = ""
         if action == "no_op":
             reaction = "No operation performed."
-        elif action in self.action_cmds:
-            os.system(self.action_cmds[action])
+        elif action in self.action_settings:
+            self.tunables.apply(self.action_settings[action])
             reaction = f"{action.replace('_', ' ').capitalize()} applied."
         elif action == "lower_process_priority":
-            os.system("sudo renice +10 -p $(pgrep stress)")
+            # The negative actions run as our own worker processes; external stress tools too
+            renice_workloads(10)
+            run_privileged([("renice", 10, "stress")])
             reaction = "Process priority lowered."
         elif action == "reduce_io_threads":
-            os.system("sudo pkill -f 'stress-ng --io'")
+            stop_all_workloads("disk_MB/s")
+            run_privileged([("pkill", "stress-ng --io")])
             reaction = "Kill stress-ng I/O processes."
         elif action == "drop_caches":
-            os.system("sudo sh -c 'echo 3 > /proc/sys/vm/drop_caches'")
+            self.tunables.set(DROP_CACHES, 3, force=True)
             reaction = "Caches dropped."
         elif action == "kill_stress_processes":
-            os.system("sudo pkill -f stress-ng")
-            os.system("sudo pkill -f yes")
-            os.system("sudo pkill -f vlc")
-            os.system("sudo pkill -f iperf3")
+            stop_all_workloads()
+            run_privileged([("pkill", name) for name in ("stress-ng", "yes", "vlc", "iperf3")])
             reaction = "All stress processes killed."
         elif action == "clean_tmp":
-            os.system("sudo rm -rf /tmp/*")
+            run_privileged([("clean_tmp",)])
             reaction = "Temporary files cleaned."
         else:
             reaction = f"Unknown action: {action}"
@@ -360,26 +504,88 @@ class EventAgent:
         """
         Update Q-table using the Q-learning algorithm.
         """
-        state_idx = self.discretize_state(state)
-        new_state_idx = self.discretize_state(new_state)
-        self.q_table[state_idx][action] = self.q_table[state_idx][action] + self.learning_rate * (
-            reward + self.discount_factor * np.max(self.q_table[new_state_idx]) - self.q_table[state_idx][action]
+        if self.q_reader is not None:
+            return
+        q = flat_q_view(self.q_table)
+        state_idx = self.state_index(state)
+        new_state_idx = self.state_index(new_state)
+        q[state_idx, action] = q[state_idx, action] + self.learning_rate * (
+            reward + self.discount_factor * np.max(q[new_state_idx]) - q[state_idx, action]
         )
+        flat_q_view(self.visits)[state_idx, action] += 1
+        if self.planner is not None:
+            self.planner.observe(state_idx, action, reward, new_state_idx)
+            self.planner.plan()
+
+    def enable_planning(self, planning_steps=20, **kwargs):
+        """
+        Follow every real update with planning_steps simulated ones (Dyna-Q with
+        prioritized sweeping, see common.dyna.DynaPlanner).
+        """
+        self.planner = DynaPlanner(self, planning_steps=planning_steps, **kwargs)
+        return self.planner
+
+    def q_table_meta(self):
+        """
+        Metadata saved with the Q-table (common.qtable_store): what its axes mean, checked
+        when loading it, and the hyperparameters it was trained with.
+        """
+        return {
+            "agent": type(self).__name__,
+            "shape": list(self.q_table.shape),
+            "metrics": list(self.bins),
+            "bins": self.bins,
+            "actions": self.actions,
+            "stresses": NEGATIVE_ACTIONS,
+            "hyperparameters": {
+                "learning_rate": self.learning_rate,
+                "discount_factor": self.discount_factor,
+                "exploration_rate": self.exploration_rate,
+                "exploration_decay": self.exploration_decay,
+            },
+        }
+
+    def follow_q_table(self, path):
+        """
+        Act from the Q-table a trainer publishes at path (common.qtable_store), mapped
+        read-only and shared with other processes. Each new version is picked up at the
+        next decision; learn() does nothing meanwhile.
+        """
+        self.q_reader = QTableReader(path, expect=self.q_table_meta())
+        self.q_table = self.q_reader.table()
+
+    def state_index(self, state):
+        """
+        Flat row index of a state in the (n_states, n_actions) view of the Q-table.
+        """
+        return self.encoder.encode(state, STRESS_INDEX.get(self.last_stress, 0))
+
+    def learn_batch(self, state_idx, actions, rewards, new_state_idx, mode="sequential"):
+        """
+        Update the Q-table from arrays of transitions in one vectorized pass.
+        States are flat row indices (see state_index).
+        """
+        return batch_q_update(self.q_table, state_idx, actions, rewards, new_state_idx,
+                              self.learning_rate, self.discount_factor, mode=mode)
 
     def stop(self):
         """
         Stop the agent's monitoring thread.
         """
         self.running = False
+        self.stop_event_worker()
+        self.stop_sampler()
 
-    def save_q_table(self, path):
-        np.save(path, self.q_table)
+    def save_q_table(self, path=Q_TABLE_PATH, stats=None, dtype=None):
+        publish_q_table(path, self.q_table, meta=stamp_q_meta(self.q_table_meta(), self.visits, stats),
+                        visits=self.visits, dtype=dtype)
         print(f"Q-Table saved to {path}.")
 
     def clean_resources(self):
         """
         Clean up resources and processes.
         """
+        stop_all_workloads()
         if hasattr(self, "processes"):
             for process in self.processes:
                 try:
@@ -408,6 +614,11 @@ class EventAgent:
 
 if __name__ == "__main__":
     agent = EventAgent()
+    # "follow": act from the Q-table train_agent.py publishes, picking up each episode's version
+    if len(sys.argv) > 1 and sys.argv[1] == "follow":
+        agent.follow_q_table(Q_TABLE_PATH)
+    agent.start_sampler()
+    agent.start_event_worker()
     monitoring_thread = threading.Thread(target=agent.monitor_metrics, daemon=True)
     monitoring_thread.start()
 
@@ -415,4 +626,5 @@ if __name__ == "__main__":
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
+        print(agent.event_stats())
         agent.stop()
@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.downsample import lttb
+
+# (label, color, metric history fields summed into the series)
+PLOT_SERIES = [
+    ("CPU %", "tab:blue", ("cpu",)),
+    ("RAM %", "tab:orange", ("ram",)),
+    ("Disk Usage %", "tab:green", ("disk",)),
+    ("I/O Wait %", "tab:brown", ("io_wait",)),
+    ("Network B/s", "tab:gray", ("net_sent_per_s", "net_recv_per_s")),
+    ("CPU Temp", "tab:red", ("temp",)),
+]
+# Heights of the user action and agent reaction markers, on the normalized scale
+ACTION_Y = 1.02
+REACTION_Y = -0.08
+Y_LIMITS = (-0.18, 1.15)
+
+def normalized_series(history):
+    """
+    Times and the (len(PLOT_SERIES), n) PLOT_SERIES values of a MetricHistory, each
+    scaled to [0, 1]. A series without any value (no thermal zone) stays NaN.
+    """
+    times = history.column("time")
+    values = np.empty((len(PLOT_SERIES), len(times)))
+    for row, (_, _, fields) in zip(values, PLOT_SERIES):
+        row[:] = history.column(fields[0])
+        for field in fields[1:]:
+            row += history.column(field)
+        if not np.isnan(row).all():
+            row -= np.nanmin(row)
+            row /= np.nanmax(row) + 1e-6
+    return times, values
+
+class MarkerTrack:
+    def __init__(self):
+        """Times of a log list (dicts with a "time" key) as an array, converted incrementally."""
+        self.source = None
+        self.times = np.empty(0)
+
+    def update(self, logs):
+        """Return the times of logs, converting only the entries added since the last call."""
+        if logs is not self.source or len(logs) < len(self.times):
+            self.source = logs
+            self.times = np.empty(0)
+        if len(logs) > len(self.times):
+            added = [log["time"] for log in logs[len(self.times):]]
+            self.times = np.concatenate([self.times, added])
+        return self.times
+
+class MetricsDashboard:
+    def __init__(self, master, min_span=60, points_per_pixel=0.5):
+        """
+        Live plot of the GUI metrics embedded in the Tk widget master. Lines and markers are
+        animated artists blitted over a cached background (axes, grid, legend); the axes are
+        only redrawn when the time axis has to grow, by 25 % steps of at least min_span s.
+        Lines are downsampled with LTTB to points_per_pixel points per pixel of the axes width
+        (rasterizing a noisy line costs about its number of segments, and half a point per
+        pixel already fills a 1 px line), and the user actions and agent reactions are one
+        scatter collection each.
+        """
+        self.figure = Figure(figsize=(7, 4), dpi=100)
+        self.ax = self.figure.add_subplot()
+        self.ax.set_ylim(*Y_LIMITS)
+        self.ax.set_xlim(0, min_span)
+        self.ax.set_xlabel("Time (s)")
+        self.ax.set_ylabel("Normalized metrics")
+        self.ax.grid(alpha=0.2)
+        self.lines = [self.ax.plot([], [], label=label, color=color, linewidth=1, animated=True)[0]
+                      for label, color, _ in PLOT_SERIES]
+        self.actions = self.ax.scatter([], [], marker="v", color="black", label="User Action", animated=True)
+        self.reactions = self.ax.scatter([], [], marker="*", color="purple", s=120, label="Agent Reaction",
+                                         animated=True)
+        self.ax.legend(loc="upper left", fontsize=7, ncol=4)
+        self.figure.tight_layout()
+        self.min_span = min_span
+        self.points_per_pixel = points_per_pixel
+        self.action_track = MarkerTrack()
+        self.reaction_track = MarkerTrack()
+        self.background = None
+        self.counters = {"blits": 0, "redraws": 0, "blit_time": 0.0, "max_blit": 0.0, "redraw_time": 0.0,
+                         "points": 0}
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        # Every full draw (first display, resize, axis growth) refreshes the cached background
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.lines + [self.actions, self.reactions]:
+            self.ax.draw_artist(artist)
+
+    def update(self, history, actions, reactions):
+        """Show the samples of history (MetricHistory) and the user actions and agent reactions (log lists)."""
+        started = time.perf_counter()
+        first, last = 0.0, 0.0
+        if len(history):
+            times, values = normalized_series(history)
+            first, last = times[0], times[-1]
+            kept = lttb(times, values, max(int(self.ax.bbox.width * self.points_per_pixel), 3))
+            for line, series, index in zip(self.lines, values, kept):
+                line.set_data(times[index], series[index])
+            self.counters["points"] = kept.size
+        else:
+            for line in self.lines:
+                line.set_data([], [])
+        for collection, track, logs, y in ((self.actions, self.action_track, actions, ACTION_Y),
+                                           (self.reactions, self.reaction_track, reactions, REACTION_Y)):
+            marker_times = track.update(logs)
+            collection.set_offsets(np.column_stack([marker_times, np.full(len(marker_times), y)]))
+
+        left, right = self.ax.get_xlim()
+        span = max(last - first, self.min_span)
+        if self.background is None or not (left <= first and last <= right and right - left <= 1.5 * span):
+            self.ax.set_xlim(first, first + 1.25 * span)
+            self.canvas.draw()
+            self.counters["redraws"] += 1
+            self.counters["redraw_time"] += time.perf_counter() - started
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        self.canvas.blit(self.figure.bbox)
+        elapsed = time.perf_counter() - started
+        self.counters["blits"] += 1
+        self.counters["blit_time"] += elapsed
+        self.counters["max_blit"] = max(self.counters["max_blit"], elapsed)
+
+    def stats(self):
+        """Blitted and full updates, their mean time and the max blitted update time (s), points drawn."""
+        stats = dict(self.counters)
+        stats["mean_blit"] = stats.pop("blit_time") / stats["blits"] if stats["blits"] else 0.0
+        stats["mean_redraw"] = stats.pop("redraw_time") / stats["redraws"] if stats["redraws"] else 0.0
+        return stats
+
+def save_plot(times, values, actions, reactions, path):
+    """
+    Save the full-resolution plot of normalized_series() values, with every user action
+    and agent reaction labelled, to path. Uses no pyplot state, so it can run off the Tk thread.
+    """
+    figure = Figure(figsize=(12, 6))
+    ax = figure.add_subplot()
+    for (label, color, _), series in zip(PLOT_SERIES, values):
+        if not np.isnan(series).all():
+            ax.plot(times, series, label=label, color=color)
+    ax.grid(alpha=0.2)
+
+    # One collection per marker kind; labels are still one text each
+    if actions:
+        ax.scatter([log["time"] for log in actions], np.full(len(actions), ACTION_Y), marker="v", color="black",
+                   label="User Action")
+    for log in actions:
+        ax.text(log["time"], 1.05, log["action"], rotation=90, verticalalignment='bottom', fontsize=7)
+    if reactions:
+        ax.scatter([log["time"] for log in reactions], np.full(len(reactions), REACTION_Y), marker="*",
+                   color="purple", s=120, label="Agent Reaction")
+    for log in reactions:
+        ax.text(log["time"], -0.13, log["reaction"], rotation=90, verticalalignment='top', fontsize=7, color="purple")
+
+    ax.set_xlabel("Time (s)")
+    ax.set_ylabel("Normalized metrics")
+    ax.set_ylim(*Y_LIMITS)
+    ax.legend()
+    figure.tight_layout()
+    figure.savefig(path)
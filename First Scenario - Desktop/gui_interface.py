@@ -3,53 +3,80 @@ from tkinter import ttk, messagebox
 import subprocess
 import os
 import multiprocessing
-import psutil
 import time
-import matplotlib.pyplot as plt
-import numpy as np
-import csv
-import shutil
 from monitor_interface import SystemMonitorGUI
+from dashboard import MetricsDashboard, normalized_series, save_plot
 from agent import EventAgent
+from common.procfs import ProcCollector, disk_space, process_count
+from common.counters import CounterRates
+from common.gui_tasks import TaskRunner
+from common.metric_history import MetricHistory
+from common.stream_log import StreamLog, export_csv
+
+# Columns of the metric history and of the metrics CSV
+METRIC_FIELDS = [
+    "time", "cpu", "ram", "swap", "temp", "disk", "io_wait", "net_sent_per_s", "net_recv_per_s",
+    "free_disk_gb", "used_disk_gb", "total_disk_gb",
+    "load1", "load5", "load15", "procs", "ctx_switches_per_s", "interrupts_per_s", "soft_interrupts_per_s"
+]
+# Streamed records: float32 metrics, float64 time
+METRIC_RECORD = [(field, "<f8" if field == "time" else "<f4") for field in METRIC_FIELDS]
+EVENT_RECORD = [("time", "<f8"), ("kind", None), ("text", None)]
 
 class KernelTuneGUI:
     def __init__(self, root):
         """Initialize the GUI."""
         self.root = root
         self.root.title("Kernel Tune Interface")
-        self.root.geometry("500x900")
+        self.root.geometry("1200x900")
         self.processes = []
 
         # Metrics and logs collection
         self.t0 = time.time()
-        self.metrics = []
+        # Last 6 h of metrics in memory (1 sample/s) for plots; the whole session is streamed to disk
+        self.metrics = MetricHistory(METRIC_FIELDS, capacity=6 * 3600)
+        self.open_stream_logs()
         self.logs = []
         self.agent_logs = []
         self.collecting = True
+        # Persistent /proc readers; CPU usage and counters are rates between two collect_metrics ticks
+        self.collector = ProcCollector()
+        self.counters = CounterRates(self.collector)
 
         # Initialize the EventAgent
         self.agent = EventAgent()
+        self.agent.start_sampler()
+
+        # Actions and agent reactions run on worker threads, their results come back through the drain loop
+        self.tasks = TaskRunner(root)
+
+        # Controls on the left, live dashboard on the right
+        controls = ttk.Frame(root)
+        controls.pack(side="left", fill="y")
+        dashboard_frame = ttk.Frame(root)
+        dashboard_frame.pack(side="right", fill="both", expand=True)
+        self.dashboard = MetricsDashboard(dashboard_frame)
 
         # Header
-        header = ttk.Label(root, text="Kernel Tune Interface", font=("Arial", 16, "bold"))
+        header = ttk.Label(controls, text="Kernel Tune Interface", font=("Arial", 16, "bold"))
         header.pack(pady=10)
 
         # Button to open the monitoring window
-        ttk.Button(root, text="Open System Monitor", command=self.open_monitor).pack(pady=10)
+        ttk.Button(controls, text="Open System Monitor", command=self.open_monitor).pack(pady=10)
 
         # Dynamic elapsed time display
-        self.time_label = ttk.Label(root, text="Elapsed time: 0 s", font=("Arial", 12))
+        self.time_label = ttk.Label(controls, text="Elapsed time: 0 s", font=("Arial", 12))
         self.time_label.pack(pady=5)
         self.update_timer()
 
         # Buttons for logs/plots/reset
-        ttk.Button(root, text="Generate plot", command=self.generate_plot).pack(pady=5)
-        ttk.Button(root, text="Save actions logs", command=self.save_actions_logs).pack(pady=5)
-        ttk.Button(root, text="Save metrics logs", command=self.save_metrics_csv).pack(pady=5)
-        ttk.Button(root, text="Reset timer", command=self.reset_timer).pack(pady=5)
+        ttk.Button(controls, text="Generate plot", command=self.generate_plot).pack(pady=5)
+        ttk.Button(controls, text="Save actions logs", command=self.save_actions_logs).pack(pady=5)
+        ttk.Button(controls, text="Save metrics logs", command=self.save_metrics_csv).pack(pady=5)
+        ttk.Button(controls, text="Reset timer", command=self.reset_timer).pack(pady=5)
 
         # Buttons for each action
-        actions_frame = ttk.LabelFrame(root, text="Actions", padding=(10, 10))
+        actions_frame = ttk.LabelFrame(controls, text="Actions", padding=(10, 10))
         actions_frame.pack(fill="both", expand=True, padx=10, pady=10)
 
         ttk.Button(actions_frame, text="Simulate CPU Stress", command=self.simulate_cpu_stress).pack(pady=5)
@@ -65,16 +92,16 @@ class KernelTuneGUI:
         ttk.Button(actions_frame, text="Stress Tmpfs", command=self.stress_tmpfs).pack(pady=5)
 
         # Button to stop all stress and clean resources
-        ttk.Button(root, text="Stop All Stress", command=self.clean_resources).pack(pady=10)
+        ttk.Button(controls, text="Stop All Stress", command=self.clean_resources).pack(pady=10)
 
         # Exit button
-        ttk.Button(root, text="Exit", command=self.exit_application).pack(pady=10)
+        ttk.Button(controls, text="Exit", command=self.exit_application).pack(pady=10)
 
         # Start metrics collection
         self.collect_metrics()
 
         # Activity label
-        self.activity_label = ttk.Label(root, text="", foreground="blue", font=("Arial", 12, "italic"))
+        self.activity_label = ttk.Label(controls, text="", foreground="blue", font=("Arial", 12, "italic"))
         self.activity_label.pack(pady=5)
 
     def update_timer(self):
@@ -83,10 +110,31 @@ class KernelTuneGUI:
         self.time_label.config(text=f"Elapsed time: {elapsed} s")
         self.root.after(1000, self.update_timer)
 
+    def open_stream_logs(self):
+        """
+        Start streaming this session's metrics to metrics_logs/stream_<date>/ and its actions
+        and agent reactions to actions_logs/stream_<date>/ (see common/stream_log.py).
+        """
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base_dir = os.path.dirname(__file__)
+        self.metrics_log = StreamLog(os.path.join(base_dir, "metrics_logs", f"stream_{stamp}"), METRIC_RECORD)
+        self.events_log = StreamLog(os.path.join(base_dir, "actions_logs", f"stream_{stamp}"), EVENT_RECORD,
+                                    labels=("kind", "text"))
+
+    def close_stream_logs(self):
+        self.metrics_log.close()
+        self.events_log.close()
+
     def reset_timer(self):
         """Reset the timer and clear logs."""
         self.t0 = time.time()
-        self.metrics = []
+        # Swap in the new logs before closing the old ones: a task still running logs to
+        # one or the other (a closed log drops the record) but never to a missing one
+        metrics_log, events_log = self.metrics_log, self.events_log
+        self.open_stream_logs()
+        metrics_log.close()
+        events_log.close()
+        self.metrics.clear()
         self.logs = []
         self.agent_logs = []
         messagebox.showinfo("Timer", "Timer reset.")
@@ -95,48 +143,33 @@ class KernelTuneGUI:
         """Collect system metrics and store them in the metrics list."""
         if self.collecting:
             t = time.time() - self.t0
-            cpu = psutil.cpu_percent(interval=0.1)
-            ram = psutil.virtual_memory().percent
-            swap = psutil.swap_memory().percent
-            temp = None
-            try:
-                temps = psutil.sensors_temperatures()
-                if temps:
-                    for name, entries in temps.items():
-                        for entry in entries:
-                            if hasattr(entry, 'label') and ('cpu' in entry.label.lower() or 'core' in entry.label.lower()):
-                                temp = entry.current
-                                break
-                        if temp is not None:
-                            break
-                    if temp is None:
-                        for entries in temps.values():
-                            if entries:
-                                temp = entries[0].current
-                                break
-            except Exception:
-                temp = None
-            disk = psutil.disk_usage('/').percent
-            net = psutil.net_io_counters()
-            net_sent = net.bytes_sent
-            net_recv = net.bytes_recv
-            free_disk_gb = shutil.disk_usage('/').free / (1024**3)
-            used_disk_gb = shutil.disk_usage('/').used / (1024**3)
-            total_disk_gb = shutil.disk_usage('/').total / (1024**3)
-            load1, load5, load15 = os.getloadavg()
-            procs = len(psutil.pids())
-            ctx_switches = psutil.cpu_stats().ctx_switches
-            interrupts = psutil.cpu_stats().interrupts
-            soft_interrupts = psutil.cpu_stats().soft_interrupts
-            self.metrics.append({
+            sample, rates = self.counters.update()
+            cpu = rates["cpu_usage"]
+            io_wait = rates["io_wait"]
+            ram = sample.memory_usage
+            swap = sample.swap_usage
+            temp = sample.temperature if self.collector.thermal is not None else None
+            total, used, free, disk = disk_space('/')
+            net_sent = rates["net_sent"]
+            net_recv = rates["net_recv"]
+            free_disk_gb = free / (1024**3)
+            used_disk_gb = used / (1024**3)
+            total_disk_gb = total / (1024**3)
+            load1, load5, load15 = sample.load1, sample.load5, sample.load15
+            procs = process_count()
+            ctx_switches = rates["ctx_switches"]
+            interrupts = rates["interrupts"]
+            soft_interrupts = rates["soft_interrupts"]
+            record = {
                 "time": t,
                 "cpu": cpu,
                 "ram": ram,
                 "swap": swap,
                 "temp": temp,
                 "disk": disk,
-                "net_sent": net_sent,
-                "net_recv": net_recv,
+                "io_wait": io_wait,
+                "net_sent_per_s": net_sent,
+                "net_recv_per_s": net_recv,
                 "free_disk_gb": free_disk_gb,
                 "used_disk_gb": used_disk_gb,
                 "total_disk_gb": total_disk_gb,
@@ -144,77 +177,49 @@ class KernelTuneGUI:
                 "load5": load5,
                 "load15": load15,
                 "procs": procs,
-                "ctx_switches": ctx_switches,
-                "interrupts": interrupts,
-                "soft_interrupts": soft_interrupts
-            })
+                "ctx_switches_per_s": ctx_switches,
+                "interrupts_per_s": interrupts,
+                "soft_interrupts_per_s": soft_interrupts
+            }
+            self.metrics.append(record)
+            self.metrics_log.append(record)
+            self.dashboard.update(self.metrics, self.logs, self.agent_logs)
             self.root.after(1000, self.collect_metrics)
 
     def log_action(self, action):
         """Log the user action with the current time."""
         t = time.time() - self.t0
         self.logs.append({"time": t, "action": action})
+        self.events_log.append({"time": t, "kind": "action", "text": action})
 
     def log_agent_reaction(self, reaction):
         """Log the agent's reaction with the current time."""
         t = time.time() - self.t0
         self.agent_logs.append({"time": t, "reaction": reaction})
+        self.events_log.append({"time": t, "kind": "reaction", "text": reaction})
 
     def generate_plot(self):
-        """Generate a plot of the collected metrics."""
-        if not self.metrics:
+        """Save a full-resolution plot of the collected metrics, rendered on a worker thread."""
+        if not len(self.metrics):
             messagebox.showerror("Plot", "No data to display.")
             return
-        times = [m["time"] for m in self.metrics]
-        cpu = np.array([m["cpu"] for m in self.metrics])
-        ram = np.array([m["ram"] for m in self.metrics])
-        disk = np.array([m["disk"] for m in self.metrics])
-        temp = np.array([m["temp"] if m["temp"] is not None else np.nan for m in self.metrics])
-
-        # Normalization
-        cpu_norm = (cpu - cpu.min()) / (cpu.max() - cpu.min() + 1e-6)
-        ram_norm = (ram - ram.min()) / (ram.max() - ram.min() + 1e-6)
-        disk_norm = (disk - disk.min()) / (disk.max() - disk.min() + 1e-6)
-        if not np.isnan(temp).all():
-            temp_norm = (temp - np.nanmin(temp)) / (np.nanmax(temp) - np.nanmin(temp) + 1e-6)
-        else:
-            temp_norm = None
-
-        plt.figure(figsize=(12,6))
-        plt.plot(times, cpu_norm, label="CPU %", color='tab:blue')
-        plt.plot(times, ram_norm, label="RAM %", color='tab:orange')
-        plt.plot(times, disk_norm, label="Disk Usage %", color='tab:green')
-        if temp_norm is not None:
-            plt.plot(times, temp_norm, label="CPU Temp", color='tab:red')
-        plt.grid(alpha=0.2)
-
-        # User action markers 
-        for log in self.logs:
-            plt.scatter(log["time"], 1.02, marker="v", color="black", label="User Action" if log == self.logs[0] else "")
-            plt.text(log["time"], 1.05, log["action"], rotation=90, verticalalignment='bottom', fontsize=7)
-
-        # Agent reaction markers 
-        for agent_log in self.agent_logs:
-            plt.scatter(agent_log["time"], -0.08, marker="*", color="purple", s=120, label="Agent Reaction" if agent_log == self.agent_logs[0] else "")
-            plt.text(agent_log["time"], -0.13, agent_log["reaction"], rotation=90, verticalalignment='top', fontsize=7, color="purple")
-
-        plt.xlabel("Time (s)")
-        plt.ylabel("Normalized metrics")
-        plt.ylim(-0.18, 1.15)
-        plt.legend()
-        plt.tight_layout()
+        # Copies: the worker must not see the ring buffer move under it
+        times, values = normalized_series(self.metrics)
         plots_dir = os.path.join(os.path.dirname(__file__), "plots")
         os.makedirs(plots_dir, exist_ok=True)
         i = 1
         while os.path.exists(os.path.join(plots_dir, f"plot_{i}.png")):
             i += 1
         plot_path = os.path.join(plots_dir, f"plot_{i}.png")
-        plt.savefig(plot_path)
-        plt.show()
-        messagebox.showinfo("Plot", f"Plot saved in {plot_path}")
+        self.show_activity("Saving plot...")
+        def done(_):
+            self.hide_activity()
+            messagebox.showinfo("Plot", f"Plot saved in {plot_path}")
+        self.tasks.submit(save_plot, times.copy(), values, list(self.logs), list(self.agent_logs), plot_path,
+                          on_done=done)
 
     def save_metrics_csv(self):
-        """Save the collected metrics to a CSV file."""
+        """Export the metrics streamed since the start (or the last timer reset) to a CSV file."""
         logs_dir = os.path.join(os.path.dirname(__file__), "metrics_logs")
         os.makedirs(logs_dir, exist_ok=True)
         i = 1
@@ -222,15 +227,7 @@ class KernelTuneGUI:
             i += 1
         csv_path = os.path.join(logs_dir, f"metrics_{i}.csv")
         with open(csv_path, "w", newline="") as csvfile:
-            fieldnames = [
-                "time", "cpu", "ram", "swap", "temp", "disk", "net_sent", "net_recv",
-                "free_disk_gb", "used_disk_gb", "total_disk_gb",
-                "load1", "load5", "load15", "procs", "ctx_switches", "interrupts", "soft_interrupts"
-            ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for m in self.metrics:
-                writer.writerow(m)
+            export_csv(self.metrics_log.path, csvfile)
         messagebox.showinfo("Metrics", f"Metrics saved in {csv_path}")
 
     def save_actions_logs(self):
@@ -246,58 +243,64 @@ class KernelTuneGUI:
                 f.write(f"{log['time']:.2f}s : {log['action']}\n")
         messagebox.showinfo("Logs", f"Action logs saved in {log_path}")
 
+    def run_action(self, name, activity, work, done_message, missing=None):
+        """
+        Run an action on a worker thread: work(), then the agent's reaction to it. The
+        action and reaction are logged and done_message shown once back on the Tk thread.
+        If work raises FileNotFoundError, missing (the tool to install) is shown instead.
+        """
+        self.show_activity(activity)
+        def task():
+            work()
+            return self.react(name)
+        def done(reaction):
+            self.log_agent_reaction(reaction)
+            self.hide_activity()
+            messagebox.showinfo("Action", done_message)
+        def failed(error):
+            self.hide_activity()
+            if isinstance(error, FileNotFoundError) and missing:
+                messagebox.showerror("Error", missing)
+            else:
+                messagebox.showerror("Error", f"An unexpected error occurred:\n{error}")
+        self.tasks.submit(task, on_done=done, on_error=failed)
+
+    def react(self, name):
+        """Log an action and return the agent's reaction to it (worker thread)."""
+        self.log_action(name)
+        time.sleep(1)
+        return self.agent.handle_event(name, plot=True)
+
     def simulate_cpu_stress(self):
         """Simulate CPU stress by creating multiple processes."""
-        self.show_activity("Simulating CPU stress...")
         def _cpu_stress_worker():
             while True:
                 pass
-        for _ in range(multiprocessing.cpu_count() // 2):
-            process = multiprocessing.Process(target=_cpu_stress_worker)
-            process.start()
-            self.processes.append(process)
-        self.log_action("Simulate CPU Stress")
-        time.sleep(1)
-        reaction = self.agent.handle_event("Simulate CPU Stress", plot=True)
-        self.log_agent_reaction(reaction)
-        self.hide_activity()
-        messagebox.showinfo("Action", "CPU stress simulation started.")
+        def work():
+            for _ in range(multiprocessing.cpu_count() // 2):
+                process = multiprocessing.Process(target=_cpu_stress_worker)
+                process.start()
+                self.processes.append(process)
+        self.run_action("Simulate CPU Stress", "Simulating CPU stress...", work, "CPU stress simulation started.")
 
     def simulate_memory_stress(self):
         """Simulate memory stress by allocating large amounts of memory."""
-        self.show_activity("Simulating Memory stress...")
-        self.memory_stress = [" " * 10**6 for _ in range(10**4)]
-        self.log_action("Simulate Memory Stress")
-        time.sleep(1)
-        reaction = self.agent.handle_event("Simulate Memory Stress", plot=True)
-        self.log_agent_reaction(reaction)
-        self.hide_activity()
-        messagebox.showinfo("Action", "Memory stress simulation started.")
+        def work():
+            self.memory_stress = [" " * 10**6 for _ in range(10**4)]
+        self.run_action("Simulate Memory Stress", "Simulating Memory stress...", work,
+                        "Memory stress simulation started.")
 
     def simulate_disk_io_stress(self):
         """Simulate disk I/O stress by writing large files."""
-        self.show_activity("Simulating Disk I/O stress...")
-        subprocess.run(["dd", "if=/dev/zero", "of=/tmp/largefile", "bs=1M", "count=256"])
-        self.log_action("Simulate Disk I/O Stress")
-        time.sleep(1)
-        reaction = self.agent.handle_event("Simulate Disk I/O Stress", plot=True)
-        self.log_agent_reaction(reaction)
-        self.hide_activity()
-        messagebox.showinfo("Action", "Disk I/O stress simulation completed.")
+        self.run_action("Simulate Disk I/O Stress", "Simulating Disk I/O stress...",
+                        lambda: subprocess.run(["dd", "if=/dev/zero", "of=/tmp/largefile", "bs=1M", "count=256"]),
+                        "Disk I/O stress simulation completed.")
 
     def simulate_gpu_load(self):
         """Simulate GPU load using glxgears."""
-        try:
-            self.show_activity("Simulating GPU load...")
-            subprocess.Popen(["glxgears"], stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-            self.log_action("Simulate GPU Load")
-            time.sleep(1)
-            reaction = self.agent.handle_event("Simulate GPU Load", plot=True)
-            self.log_agent_reaction(reaction)
-            self.hide_activity()
-            messagebox.showinfo("Action", "GPU load simulation started.")
-        except FileNotFoundError:
-            messagebox.showerror("Error", "glxgears not found. Please install it.")
+        self.run_action("Simulate GPU Load", "Simulating GPU load...",
+                        lambda: subprocess.Popen(["glxgears"], stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL),
+                        "GPU load simulation started.", missing="glxgears not found. Please install it.")
 
     def run_compilation_task(self):
         """Run a compilation task using g++."""
@@ -306,115 +309,83 @@ class KernelTuneGUI:
         if not os.path.exists(code_file):
             messagebox.showerror("Error", f"code.cpp introuvable dans {utils_dir}")
             return
-        try:
-            result = subprocess.run(["g++", "-o", "code", code_file], cwd=utils_dir, capture_output=True, text=True)
-            if result.returncode == 0:
+        self.show_activity("Running compilation task...")
+        def task():
+            # The agent reacts whether or not the compilation succeeded
+            try:
+                result = subprocess.run(["g++", "-o", "code", code_file], cwd=utils_dir, capture_output=True, text=True)
+            except Exception as e:
+                result = e
+            return result, self.react("Run Compilation Task")
+        def done(outcome):
+            result, reaction = outcome
+            self.log_agent_reaction(reaction)
+            self.hide_activity()
+            if isinstance(result, FileNotFoundError):
+                messagebox.showerror("Error", "g++ not found. Please install it.")
+            elif isinstance(result, Exception):
+                messagebox.showerror("Error", f"An unexpected error occurred:\n{result}")
+            elif result.returncode == 0:
                 messagebox.showinfo("Action", "Compilation task completed successfully.")
             else:
                 messagebox.showerror("Error", f"Compilation failed:\n{result.stderr}")
-        except FileNotFoundError:
-            messagebox.showerror("Error", "g++ not found. Please install it.")
-        except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred:\n{e}")
-        finally:
-            self.log_action("Run Compilation Task")
-            time.sleep(1)
-            reaction = self.agent.handle_event("Run Compilation Task", plot=True)
-            self.log_agent_reaction(reaction)
+        self.tasks.submit(task, on_done=done)
 
     def simulate_network_flood(self):
         """Simulate network flood using ping."""
-        try:
-            self.show_activity("Simulating Network flood...")
-            subprocess.Popen(["ping", "-f", "8.8.8.8"], stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-            self.log_action("Simulate Network Flood")
-            time.sleep(1)
-            reaction = self.agent.handle_event("Simulate Network Flood", plot=True)
-            self.log_agent_reaction(reaction)
-            self.hide_activity()
-            messagebox.showinfo("Action", "Network flood simulation started.")
-        except FileNotFoundError:
-            messagebox.showerror("Error", "Ping command not found.")
+        self.run_action("Simulate Network Flood", "Simulating Network flood...",
+                        lambda: subprocess.Popen(["ping", "-f", "8.8.8.8"], stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL),
+                        "Network flood simulation started.", missing="Ping command not found.")
 
     def fill_disk_until_threshold(self):
         """Fill the disk until a certain threshold."""
-        try:
-            self.show_activity("Filling Disk Until Threshold...")
-            subprocess.run(["dd", "if=/dev/zero", "of=/tmp/fillfile", "bs=1M", "count=1024"])
-            self.log_action("Fill Disk Until Threshold")
-            time.sleep(1)
-            reaction = self.agent.handle_event("Fill Disk Until Threshold", plot=True)
-            self.log_agent_reaction(reaction)
-            self.hide_activity()
-            messagebox.showinfo("Action", "Disk filling simulation completed.")
-        except FileNotFoundError:
-            messagebox.showerror("Error", "dd command not found.")
+        self.run_action("Fill Disk Until Threshold", "Filling Disk Until Threshold...",
+                        lambda: subprocess.run(["dd", "if=/dev/zero", "of=/tmp/fillfile", "bs=1M", "count=1024"]),
+                        "Disk filling simulation completed.", missing="dd command not found.")
 
     def play_streaming_video(self):
         """Play a streaming video using VLC."""
-        try:
-            self.show_activity("Playing Streaming Video...")
-            subprocess.Popen(["vlc", "https://www.youtube.com/watch?v=dQw4w9WgXcQ"], stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-            self.log_action("Play Streaming Video")
-            time.sleep(1)
-            reaction = self.agent.handle_event("Play Streaming Video", plot=True)
-            self.log_agent_reaction(reaction)
-            self.hide_activity()
-            messagebox.showinfo("Action", "Streaming video started.")
-        except FileNotFoundError:
-            messagebox.showerror("Error", "VLC not found. Please install it.")
+        self.run_action("Play Streaming Video", "Playing Streaming Video...",
+                        lambda: subprocess.Popen(["vlc", "https://www.youtube.com/watch?v=dQw4w9WgXcQ"],
+                                                 stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL),
+                        "Streaming video started.", missing="VLC not found. Please install it.")
 
     def spawn_multiple_processes(self):
         """Spawn multiple processes to simulate high load."""
-        try:
-            self.show_activity("Spawning Multiple Processes...")
+        def work():
             for _ in range(100):
                 process = subprocess.Popen(["sleep", "100"])
                 self.processes.append(process)
-            self.log_action("Spawn Multiple Processes")
-            time.sleep(1)
-            reaction = self.agent.handle_event("Spawn Multiple Processes", plot=True)
-            self.log_agent_reaction(reaction)
-            self.hide_activity()
-            messagebox.showinfo("Action", "Spawned multiple processes.")
-        except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred:\n{e}")
+        self.run_action("Spawn Multiple Processes", "Spawning Multiple Processes...", work, "Spawned multiple processes.")
 
     def simulate_disk_latency(self):
         """Simulate disk latency using stress-ng."""
-        try:
-            self.show_activity("Simulating Disk Latency...")
-            subprocess.Popen(["stress-ng", "--io", "1", "--timeout", "30"], stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-            self.log_action("Simulate Disk Latency")
-            time.sleep(1)
-            reaction = self.agent.handle_event("Simulate Disk Latency", plot=True)
-            self.log_agent_reaction(reaction)
-            self.hide_activity()
-            messagebox.showinfo("Action", "Disk latency simulation started.")
-        except FileNotFoundError:
-            messagebox.showerror("Error", "stress-ng not found. Please install it.")
+        self.run_action("Simulate Disk Latency", "Simulating Disk Latency...",
+                        lambda: subprocess.Popen(["stress-ng", "--io", "1", "--timeout", "30"],
+                                                 stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL),
+                        "Disk latency simulation started.", missing="stress-ng not found. Please install it.")
 
     def stress_tmpfs(self):
         """Stress the tmpfs filesystem."""
-        try:
-            self.show_activity("Stressing Tmpfs...")
-            subprocess.run(["dd", "if=/dev/zero", "of=/dev/shm/tmpfile", "bs=1M", "count=512"])
-            self.log_action("Stress Tmpfs")
-            time.sleep(1)
-            reaction = self.agent.handle_event("Stress Tmpfs", plot=True)
-            self.log_agent_reaction(reaction)
-            self.hide_activity()
-            messagebox.showinfo("Action", "Tmpfs stress simulation completed.")
-        except FileNotFoundError:
-            messagebox.showerror("Error", "dd command not found.")
+        self.run_action("Stress Tmpfs", "Stressing Tmpfs...",
+                        lambda: subprocess.run(["dd", "if=/dev/zero", "of=/dev/shm/tmpfile", "bs=1M", "count=512"]),
+                        "Tmpfs stress simulation completed.", missing="dd command not found.")
 
-    def clean_resources(self):
-        """Stop all stress processes and clean resources."""
+    def stop_all_stress(self):
+        """Stop all stress processes and let the agent react (blocking)."""
         self.agent.clean_resources()
         reaction = self.agent.handle_event("Stop All Stress", plot=True)
-        self.log_agent_reaction(reaction)
         self.log_action("Stop All Stress")
-        messagebox.showinfo("Action", "Resources cleaned.")
+        return reaction
+
+    def clean_resources(self):
+        """Stop all stress processes and clean resources."""
+        self.show_activity("Stopping all stress...")
+        def done(reaction):
+            self.log_agent_reaction(reaction)
+            self.hide_activity()
+            messagebox.showinfo("Action", "Resources cleaned.")
+        self.tasks.submit(self.stop_all_stress, on_done=done)
 
     def open_monitor(self):
         """Open the system monitor window."""
@@ -423,17 +394,25 @@ class KernelTuneGUI:
 
     def exit_application(self):
         """Exit the application."""
-        self.clean_resources()
-        self.agent.save_q_table("First Scenario - Desktop/q_table.npy") 
+        # Let running actions and reactions finish, so they log before the logs close
+        self.tasks.shutdown(wait=True)
+        print(f"GUI tasks: {self.tasks.stats()}")
+        print(f"Dashboard: {self.dashboard.stats()}")
+        self.stop_all_stress()
+        self.agent.save_q_table()
+        self.collecting = False
+        self.collector.close()
+        self.metrics.close()
+        self.close_stream_logs()
         self.root.destroy()
 
     def show_activity(self, message="Processing..."):
         self.activity_label.config(text=message)
-        self.root.update_idletasks()
 
     def hide_activity(self):
-        self.activity_label.config(text="")
-        self.root.update_idletasks()
+        """Clear the activity message once no action is running anymore."""
+        if self.tasks.pending() == 0:
+            self.activity_label.config(text="")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -1,8 +1,14 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from light_agent import LightEventAgent, NEGATIVE_ACTIONS
+from common.qtable_store import load_q_file, resolve_q_table_path
 
-q_table_path = "First Scenario - Desktop/light_first_scenario/q_table.npy"
-q_table = np.load(q_table_path)
+q_table_path = "First Scenario - Desktop/light_first_scenario/q_table.qtab"
+stored = load_q_file(resolve_q_table_path(q_table_path), mmap=True)
+q_table = stored.q_table
+agent = LightEventAgent()
+# Tables in the former .npy format carry no action names
+actions = stored.meta.get("actions") or agent.actions
 print(f"Q-table shape: {q_table.shape}")
 
 print(f"Q min: {q_table.min():.3f} | Q max: {q_table.max():.3f} | Q mean: {q_table.mean():.3f} | Q std: {q_table.std():.3f}")
@@ -10,6 +16,9 @@ print(f"Q min: {q_table.min():.3f} | Q max: {q_table.max():.3f} | Q mean: {q_tab
 n_states = np.prod(q_table.shape[:-1])
 n_actions = q_table.shape[-1]
 print(f"Number of states: {n_states} | Number of actions: {n_actions}")
+encoder = agent.encoder
+if encoder.shape != q_table.shape[:-1]:
+    encoder = None
 
 plt.hist(q_table.flatten(), bins=50)
 plt.title("Q-value distribution")
@@ -23,14 +32,17 @@ best_action = flat_q.argmax(axis=1)
 top_idx = np.argsort(best_q)[-10:][::-1]
 print("\nTop 10 states (indexed) with highest Q-value and optimal action:")
 for idx in top_idx:
-    print(f"State {idx} | Q* = {best_q[idx]:.2f} | Optimal action = {best_action[idx]}")
+    print(f"State {idx} | Q* = {best_q[idx]:.2f} | Optimal action = {actions[best_action[idx]]}")
+    if encoder is not None:
+        bins = ", ".join(f"{name}=[{low:.2f}, {high:.2f})" for name, (low, high) in encoder.describe(idx).items())
+        print(f"    {bins}, stress={NEGATIVE_ACTIONS[encoder.decode(idx)[-1]]}")
 
 print("\nBest actions for a few simple states:")
 for i in range(5):
     state_idx = [0] * (len(q_table.shape) - 2) + [i, 0]
     state_idx = tuple(state_idx)
     q_vals = q_table[state_idx]
-    print(f"State stress {i}: Q = {q_vals} | Optimal action = {np.argmax(q_vals)}")
+    print(f"State stress {i}: Q = {q_vals} | Optimal action = {actions[np.argmax(q_vals)]}")
 
 nonzero_cases = np.count_nonzero(q_table)
 total_cases = q_table.size
@@ -2,7 +2,18 @@ import psutil
 import os
 import time
 import numpy as np
-import subprocess
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.q_learning import batch_q_update, flat_q_view
+from common.state_encoder import StateEncoder
+from common.metric_sampler import MetricSampler
+from common.tunables import DROP_CACHES, ZSWAP_ENABLED, read_ahead_path, shared_tunables
+from common.tuning_helper import run_privileged
+from common.workloads import start_workload, stop_all_workloads
+from common.settle import SettleDetector
+from common.dyna import DynaPlanner
+from common.qtable_store import QTableReader, load_agent_q_table, publish_q_table, stamp_q_meta
 
 NEGATIVE_ACTIONS_INFO = {
     "simulate_cpu_stress":        1,
@@ -14,26 +25,23 @@ NEGATIVE_ACTIONS_INFO = {
 }
 
 NEGATIVE_ACTIONS = list(NEGATIVE_ACTIONS_INFO.keys())
+# Transition log shared by the training and policy scripts
+TRANSITIONS_PATH = "First Scenario - Desktop/light_first_scenario/transitions"
+STRESS_INDEX = {name: i for i, name in enumerate(NEGATIVE_ACTIONS)}
+Q_TABLE_PATH = "First Scenario - Desktop/light_first_scenario/q_table.qtab"
 
 def get_negative_action_delay(action):
     return NEGATIVE_ACTIONS_INFO.get(action, 2)
 
+# Half the disk workload of the full agent (1 GB fill, 2 x 512 MB rewrites)
+NEGATIVE_ACTION_INTENSITY = {
+    "simulate_disk_fill": 0.5,
+    "simulate_disk_latency": 0.5,
+}
+
 def apply_negative_action(action):
-    if action == "simulate_cpu_stress":
-        return subprocess.Popen("stress-ng --cpu 2 --timeout 8", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    elif action == "simulate_memory_stress":
-        return subprocess.Popen("stress-ng --vm 2 --vm-bytes 1G --timeout 8", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    elif action == "simulate_disk_fill":
-        return subprocess.Popen("dd if=/dev/zero of=/tmp/fillfile bs=1M count=1024", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    elif action == "simulate_disk_latency":
-        return subprocess.Popen("stress-ng --hdd 2 --hdd-bytes 512M --timeout 8", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    elif action == "simulate_network_stress":
-        server_proc = subprocess.Popen("iperf3 -s", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        time.sleep(1)
-        client_proc = subprocess.Popen("iperf3 -c 127.0.0.1 -t 8", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return (server_proc, client_proc)
-    else:
-        return None
+    """Start the built-in workload of a negative action, or return None for no_op."""
+    return start_workload(action, intensity=NEGATIVE_ACTION_INTENSITY.get(action, 1.0))
 
 def get_main_disk():
     partitions = psutil.disk_partitions()
@@ -42,17 +50,30 @@ def get_main_disk():
             return p.device
     return '/dev/sda'
 
+def normalize_metrics(state, stress=None):
+    """Raw metrics (a state dict) normalized to [0, 1], followed by the one-hot stress."""
+    base = np.array([
+        min(1, state["cpu_usage"] / 100),
+        min(1, state["memory_usage"] / 100),
+        min(1, state["load_average"] / 10),
+        min(1, state["disk_usage"] / 100),
+        min(1, state["temperature"] / 100),
+    ])
+    stress_one_hot = get_stress_one_hot(stress) if stress else np.zeros(len(NEGATIVE_ACTIONS))
+    return np.concatenate([base, stress_one_hot])
+
 def get_param_actions():
-    disk = get_main_disk()
+    """(action, {tunable: value}) pairs. Read-ahead is in KB (--setra 128 sectors = 64 KB)."""
+    read_ahead = read_ahead_path(get_main_disk())
     return [
-        ("set_dirty_ratio_10", "sudo sysctl -w vm.dirty_ratio=10"),
-        ("set_dirty_ratio_40", "sudo sysctl -w vm.dirty_ratio=40"),
-        ("set_swappiness_10", "sudo sysctl -w vm.swappiness=10"),
-        ("set_swappiness_100", "sudo sysctl -w vm.swappiness=100"),
-        ("set_read_ahead_128", f"sudo blockdev --setra 128 {disk}"),
-        ("set_read_ahead_1024", f"sudo blockdev --setra 1024 {disk}"),
-        ("enable_zswap", "sudo sh -c 'echo 1 > /sys/module/zswap/parameters/enabled'"),
-        ("disable_zswap", "sudo sh -c 'echo 0 > /sys/module/zswap/parameters/enabled'"),
+        ("set_dirty_ratio_10", {"vm.dirty_ratio": 10}),
+        ("set_dirty_ratio_40", {"vm.dirty_ratio": 40}),
+        ("set_swappiness_10", {"vm.swappiness": 10}),
+        ("set_swappiness_100", {"vm.swappiness": 100}),
+        ("set_read_ahead_128", {read_ahead: 64}),
+        ("set_read_ahead_1024", {read_ahead: 512}),
+        ("enable_zswap", {ZSWAP_ENABLED: 1}),
+        ("disable_zswap", {ZSWAP_ENABLED: 0}),
     ]
 
 def get_reaction_actions():
@@ -64,9 +85,8 @@ def get_reaction_actions():
 
 def get_stress_one_hot(stress_name):
     one_hot = np.zeros(len(NEGATIVE_ACTIONS))
-    if stress_name in NEGATIVE_ACTIONS:
-        idx = NEGATIVE_ACTIONS.index(stress_name)
-        one_hot[idx] = 1
+    if stress_name in STRESS_INDEX:
+        one_hot[STRESS_INDEX[stress_name]] = 1
     return one_hot
 
 class LightEventAgent:
@@ -80,7 +100,8 @@ class LightEventAgent:
         }
         self.last_stress = None
         self.actions = [a[0] for a in get_param_actions()] + get_reaction_actions()
-        self.action_cmds = {a[0]: a[1] for a in get_param_actions()}
+        self.action_settings = {a[0]: a[1] for a in get_param_actions()}
+        self.tunables = shared_tunables()
         self.bins = {
             "cpu_usage": np.linspace(0, 1, 3), 
             "memory_usage": np.linspace(0, 1, 3),
@@ -88,19 +109,63 @@ class LightEventAgent:
             "disk_usage": np.linspace(0, 1, 3),
             "temperature": np.linspace(0, 1, 3),
         }
-        q_table_shape = tuple(len(self.bins[metric]) - 1 for metric in self.bins) + (len(NEGATIVE_ACTIONS), len(self.actions))
-        if os.path.exists("First Scenario - Desktop/light_first_scenario/q_table.npy"):
-            self.q_table = np.load("First Scenario - Desktop/light_first_scenario/q_table.npy")
-            print("Q-Table loaded from First Scenario - Desktop/light_first_scenario/q_table.npy")
-        else:
-            self.q_table = np.zeros(q_table_shape)
-            print("Initialized new Q-Table.")
+        self.encoder = StateEncoder.from_bins(self.bins, extra_dims=(len(NEGATIVE_ACTIONS),))
+        q_table_shape = self.encoder.shape + (len(self.actions),)
+        self.q_table = np.zeros(q_table_shape)
+        # Live updates of each (state, action), saved with the Q-table
+        self.visits = np.zeros(q_table_shape, dtype=np.uint32)
         self.learning_rate = 0.1
         self.discount_factor = 0.9
         self.exploration_rate = 1.0
         self.exploration_decay = 0.995
+        stored = load_agent_q_table(Q_TABLE_PATH, self.q_table_meta())
+        if stored is not None:
+            self.q_table = stored.q_table
+            if stored.visits is not None:
+                self.visits = stored.visits
+            print(f"Q-Table loaded from {Q_TABLE_PATH}")
+        else:
+            print("Initialized new Q-Table.")
+        self.planner = None
+        self.q_reader = None
+        self.sampler = None
+        self.settle_detector = None
+
+    def start_sampler(self, period=0.1, window=1.0):
+        """Sample metrics in a background thread so that update_metrics_once no longer blocks."""
+        self.sampler = MetricSampler(period=period, window=window).start()
+        self.settle_detector = SettleDetector(self.sampler)
+
+    def stop_sampler(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+            self.settle_detector = None
 
-    def update_metrics_once(self):
+    def wait_settled(self, since, max_wait):
+        """
+        Update state once metrics settle after since (time.monotonic()), waiting at most
+        max_wait seconds. Return the seconds waited.
+        """
+        if self.settle_detector is None:
+            time.sleep(max(0.0, since + max_wait - time.monotonic()))
+            self.update_metrics_once()
+            return time.monotonic() - since
+        snapshot, waited, _ = self.settle_detector.wait(since, max_wait)
+        for key in self.state:
+            self.state[key] = getattr(snapshot, key)
+        return waited
+
+    def update_metrics_once(self, since=None):
+        """
+        Update state with current metrics. With a running sampler this reads its latest
+        snapshot, or the first one covering a full window after since (time.monotonic()).
+        """
+        if self.sampler is not None:
+            snapshot = self.sampler.latest() if since is None else self.sampler.after(since)
+            for key in self.state:
+                self.state[key] = getattr(snapshot, key)
+            return
         self.state["cpu_usage"] = psutil.cpu_percent(interval=1)
         self.state["memory_usage"] = psutil.virtual_memory().percent
         self.state["load_average"] = os.getloadavg()[0]
@@ -119,58 +184,36 @@ class LightEventAgent:
         return 0
 
     def get_normalized_state(self):
-        base = np.array([
-            min(1, self.state["cpu_usage"] / 100),
-            min(1, self.state["memory_usage"] / 100),
-            min(1, self.state["load_average"] / 10),
-            min(1, self.state["disk_usage"] / 100),
-            min(1, self.state["temperature"] / 100),
-        ])
-        stress_one_hot = get_stress_one_hot(self.last_stress) if self.last_stress else np.zeros(len(NEGATIVE_ACTIONS))
-        return np.concatenate([base, stress_one_hot])
+        return normalize_metrics(self.state, self.last_stress)
+
+    def metrics_state_index(self, metrics, stress):
+        """Flat Q-table row of raw metrics (a state dict) under a stress, e.g. from a transition log."""
+        return self.encoder.encode(normalize_metrics(metrics, stress), STRESS_INDEX.get(stress, 0))
 
     def discretize_state(self, state):
-        metrics_order = [
-            "cpu_usage",
-            "memory_usage",
-            "load_average",
-            "disk_usage",
-            "temperature",
-        ]
-        discretized_state = []
-        for i, metric in enumerate(metrics_order):
-            value = state[i]
-            bin_edges = self.bins[metric]
-            bin_idx = np.digitize(value, bin_edges) - 1
-            bin_idx = max(0, min(bin_idx, len(bin_edges) - 2))
-            discretized_state.append(bin_idx)
-        if self.last_stress and self.last_stress in NEGATIVE_ACTIONS:
-            stress_idx = NEGATIVE_ACTIONS.index(self.last_stress)
-        else:
-            stress_idx = 0
-        discretized_state.append(stress_idx)
-        return tuple(discretized_state)
+        return self.encoder.decode(self.state_index(state))
 
     def select_action(self, state):
-        discretized_state = self.discretize_state(state)
+        state_idx = self.state_index(state)
+        if self.q_reader is not None:
+            self.q_table = self.q_reader.table()
         if np.random.uniform(0, 1) < self.exploration_rate:
             return np.random.randint(0, len(self.actions))
         else:
-            return np.argmax(self.q_table[discretized_state])
+            return np.argmax(flat_q_view(self.q_table)[state_idx])
 
     def apply_action(self, action_idx):
         action = self.actions[action_idx]
         if action == "no_op":
             print("No operation performed.")
-        elif action in self.action_cmds:
-            os.system(self.action_cmds[action])
+        elif action in self.action_settings:
+            self.tunables.apply(self.action_settings[action])
         elif action == "drop_caches":
-            os.system("sudo sh -c 'echo 3 > /proc/sys/vm/drop_caches'")
+            self.tunables.set(DROP_CACHES, 3, force=True)
         elif action == "kill_stress_processes":
-            os.system("sudo pkill -f stress-ng")
-            os.system("sudo pkill -f yes")
-            os.system("sudo pkill -f vlc")
-            os.system("sudo pkill -f iperf3")
+            # The negative actions run as our own worker processes; external stress tools too
+            stop_all_workloads()
+            run_privileged([("pkill", name) for name in ("stress-ng", "yes", "vlc", "iperf3")])
         else:
             print(f"Unknown action: {action}")
 
@@ -193,17 +236,65 @@ class LightEventAgent:
         return reward
 
     def learn(self, state, action, reward, new_state):
-        state_idx = self.discretize_state(state)
-        new_state_idx = self.discretize_state(new_state)
-        self.q_table[state_idx][action] = self.q_table[state_idx][action] + self.learning_rate * (
-            reward + self.discount_factor * np.max(self.q_table[new_state_idx]) - self.q_table[state_idx][action]
+        if self.q_reader is not None:
+            return
+        q = flat_q_view(self.q_table)
+        state_idx = self.state_index(state)
+        new_state_idx = self.state_index(new_state)
+        q[state_idx, action] = q[state_idx, action] + self.learning_rate * (
+            reward + self.discount_factor * np.max(q[new_state_idx]) - q[state_idx, action]
         )
+        flat_q_view(self.visits)[state_idx, action] += 1
+        if self.planner is not None:
+            self.planner.observe(state_idx, action, reward, new_state_idx)
+            self.planner.plan()
+
+    def enable_planning(self, planning_steps=20, **kwargs):
+        """Follow every real update with planning_steps Dyna-Q updates (common.dyna)."""
+        self.planner = DynaPlanner(self, planning_steps=planning_steps, **kwargs)
+        return self.planner
+
+    def q_table_meta(self):
+        """Metadata saved with the Q-table: what its axes mean (checked on load) and its hyperparameters."""
+        return {
+            "agent": type(self).__name__,
+            "shape": list(self.q_table.shape),
+            "metrics": list(self.bins),
+            "bins": self.bins,
+            "actions": self.actions,
+            "stresses": NEGATIVE_ACTIONS,
+            "hyperparameters": {
+                "learning_rate": self.learning_rate,
+                "discount_factor": self.discount_factor,
+                "exploration_rate": self.exploration_rate,
+                "exploration_decay": self.exploration_decay,
+            },
+        }
+
+    def follow_q_table(self, path):
+        """
+        Act from the Q-table published at path, mapped read-only and shared with other
+        processes, switching to each new version at the next decision. learn() does nothing.
+        """
+        self.q_reader = QTableReader(path, expect=self.q_table_meta())
+        self.q_table = self.q_reader.table()
+
+    def state_index(self, state):
+        """Flat row index of a state in the (n_states, n_actions) view of the Q-table."""
+        return self.encoder.encode(state, STRESS_INDEX.get(self.last_stress, 0))
+
+    def learn_batch(self, state_idx, actions, rewards, new_state_idx, mode="sequential"):
+        """Update the Q-table from arrays of transitions given as flat state indices."""
+        return batch_q_update(self.q_table, state_idx, actions, rewards, new_state_idx,
+                              self.learning_rate, self.discount_factor, mode=mode)
 
-    def save_q_table(self, path):
-        np.save(path, self.q_table)
+    def save_q_table(self, path=Q_TABLE_PATH, stats=None, dtype=None):
+        publish_q_table(path, self.q_table, meta=stamp_q_meta(self.q_table_meta(), self.visits, stats),
+                        visits=self.visits, dtype=dtype)
         print(f"Q-Table saved to {path}.")
 
     def clean_resources(self):
+        stop_all_workloads()
         for path in ["/tmp/largefile", "/tmp/fillfile", "/dev/shm/tmpfs_stress"]:
             if os.path.exists(path):
                 try:
@@ -1,55 +1,62 @@
 import time
 import random
-from light_agent import LightEventAgent, NEGATIVE_ACTIONS, get_negative_action_delay, apply_negative_action
+from light_agent import LightEventAgent, NEGATIVE_ACTIONS, TRANSITIONS_PATH, get_negative_action_delay, apply_negative_action
+from common.transitions import TransitionLog
 
 def noop_policy(num_episodes=100, nb_steps_per_episode=10, sleep_interval=2):
     """Runs a no-op policy for the LightEventAgent"""
     agent = LightEventAgent()
+    agent.start_sampler()
+    log = TransitionLog(TRANSITIONS_PATH, list(agent.state), agent.actions, NEGATIVE_ACTIONS, policy="noop")
     rewards_per_episode = []
 
     try:
         for episode in range(num_episodes):
             print(f"\n=== No-op Policy | Episode {episode+1}/{num_episodes} ===")
-            time.sleep(1)
+            agent.wait_settled(time.monotonic(), max_wait=1)
             total_reward = 0
+            total_wait = 0.0
 
             for step in range(nb_steps_per_episode):
+                step_start = time.monotonic()
                 negative_action = random.choice(NEGATIVE_ACTIONS)
                 proc = apply_negative_action(negative_action)
+                stress_time = time.monotonic()
                 delay = get_negative_action_delay(negative_action)
-                time.sleep(delay)
                 agent.last_stress = negative_action
 
-                agent.update_metrics_once()
+                stress_wait = agent.wait_settled(stress_time, max_wait=delay)
+                metrics = dict(agent.state)
                 state = agent.get_normalized_state()
 
-                if negative_action == "simulate_network_stress" and proc is not None:
-                    server_proc, client_proc = proc
-                    client_proc.wait()
-                    server_proc.terminate()
-                    server_proc.wait()
-                elif proc is not None:
-                    proc.wait()
+                if proc is not None:
+                    print(f"{negative_action} load: {proc.wait()}")
 
                 action_idx = agent.actions.index("no_op")
                 agent.apply_action(action_idx)
-                time.sleep(sleep_interval)
-
-                agent.update_metrics_once()
+                action_time = time.monotonic()
+                action_wait = agent.wait_settled(action_time, max_wait=sleep_interval)
+                total_wait += stress_wait + action_wait
                 new_state = agent.get_normalized_state()
 
                 reward = agent.compute_reward(state, new_state, debug=False)
                 total_reward += reward
+                log.record(metrics, action_idx, dict(agent.state), reward, stress=negative_action,
+                           episode=episode, step=step, wait_time=stress_wait + action_wait,
+                           step_time=time.monotonic() - step_start)
 
-                print(f"[Step {step+1}] Stress: {negative_action} | Action: no_op | Reward: {reward:.2f}")
+                print(f"[Step {step+1}] Stress: {negative_action} | Action: no_op | Reward: {reward:.2f} | Waited: {stress_wait:.1f} + {action_wait:.1f} s")
 
             print(f"Total reward for episode {episode+1}: {total_reward:.2f}")
+            print(f"Settle wait for episode {episode+1}: {total_wait:.1f} s")
             rewards_per_episode.append(total_reward)
 
     except KeyboardInterrupt:
         print("\nNo-op policy interrupted by user.")
 
+    log.close()
     agent.clean_resources()
+    agent.stop_sampler()
 
     return rewards_per_episode
 
@@ -1,71 +1,114 @@
+import sys
 import time
 import random
-from light_agent import LightEventAgent, NEGATIVE_ACTIONS, get_negative_action_delay, apply_negative_action
+import numpy as np
+from light_agent import LightEventAgent, NEGATIVE_ACTIONS, Q_TABLE_PATH, TRANSITIONS_PATH, get_negative_action_delay, apply_negative_action
+from common.checkpoint import Checkpointer
+from common.session import Schedule, resume_session
+from common.transitions import ReplayEnv, TransitionLog
 import matplotlib.pyplot as plt
 
-def train_agent(num_episodes=1000, nb_steps_per_episode=10, learning_rate=0.1, discount_factor=0.9, exploration_rate=1.0, exploration_decay=0.995):
-    """Main training loop for the light RL agent in the first scenario."""
+def train_agent(num_episodes=1000, nb_steps_per_episode=10, learning_rate=None, discount_factor=0.9, exploration_rate=None, exploration_decay=None,
+                planning_steps=0, seed=None):
+    """
+    Main training loop for the light RL agent in the first scenario.
+    With planning_steps, every real step is followed by that many Dyna-Q planning updates.
+    Episodes are checkpointed in the background with the training session (common.session):
+    an interrupted run resumes where it stopped and a new one continues the schedules of the
+    last (epsilon 1.0, x0.995 per episode, at least 0.05; learning rate 0.1). Rates given
+    explicitly restart their schedule. Returns the rewards of the run's episodes.
+    """
     agent = LightEventAgent()
-    agent.learning_rate = learning_rate
+    if planning_steps:
+        agent.enable_planning(planning_steps)
+    agent.start_sampler()
+    log = TransitionLog(TRANSITIONS_PATH, list(agent.state), agent.actions, NEGATIVE_ACTIONS, policy="q_learning")
     agent.discount_factor = discount_factor
-    agent.exploration_rate = exploration_rate
-
-    rewards_per_episode = []
+    checkpointer = Checkpointer(agent, Q_TABLE_PATH)
+    session = resume_session(checkpointer, num_episodes, Schedule(1.0, 0.995, 0.05), Schedule(0.1), seed=seed,
+                             exploration_rate=exploration_rate, exploration_decay=exploration_decay,
+                             learning_rate=learning_rate)
 
     try:
-        for episode in range(num_episodes):
-            print(f"\n=== Episode {episode+1}/{num_episodes} ===")
-            time.sleep(1)
+        for episode in session.episodes(agent):
+            print(f"\n=== Episode {episode+1}/{session.target} ===")
+            agent.wait_settled(time.monotonic(), max_wait=1)
             total_reward = 0
+            total_wait = 0.0
 
             for step in range(nb_steps_per_episode):
+                step_start = time.monotonic()
                 negative_action = random.choice(NEGATIVE_ACTIONS)
                 proc = apply_negative_action(negative_action)
+                stress_time = time.monotonic()
                 delay = get_negative_action_delay(negative_action)
-                time.sleep(delay)
                 agent.last_stress = negative_action
 
-                agent.update_metrics_once()
+                stress_wait = agent.wait_settled(stress_time, max_wait=delay)
+                metrics = dict(agent.state)
                 state = agent.get_normalized_state()
 
-                if negative_action == "simulate_network_stress" and proc is not None:
-                    server_proc, client_proc = proc
-                    client_proc.wait()
-                    server_proc.terminate()
-                    server_proc.wait()
-                elif proc is not None:
-                    proc.wait()
+                if proc is not None:
+                    print(f"{negative_action} load: {proc.wait()}")
 
                 if random.uniform(0, 1) < agent.exploration_rate:
                     action_idx = random.randint(0, len(agent.actions) - 1)
                 else:
                     action_idx = agent.select_action(state)
                 agent.apply_action(action_idx)
-                time.sleep(2)
-
-                agent.update_metrics_once()
+                action_time = time.monotonic()
+                action_wait = agent.wait_settled(action_time, max_wait=2)
+                total_wait += stress_wait + action_wait
                 new_state = agent.get_normalized_state()
 
                 reward = agent.compute_reward(state, new_state, debug=False)
                 agent.learn(state, action_idx, reward, new_state)
                 total_reward += reward
+                log.record(metrics, action_idx, dict(agent.state), reward, stress=negative_action,
+                           episode=episode, step=step, wait_time=stress_wait + action_wait,
+                           step_time=time.monotonic() - step_start)
 
-                print(f"[Step {step+1}] Stress: {negative_action} | Action: {agent.actions[action_idx]} | Reward: {reward:.2f}")
+                print(f"[Step {step+1}] Stress: {negative_action} | Action: {agent.actions[action_idx]} | Reward: {reward:.2f} | Waited: {stress_wait:.1f} + {action_wait:.1f} s")
 
                 state = new_state
 
             print(f"Total reward for episode {episode+1}: {total_reward:.2f}")
-            rewards_per_episode.append(total_reward)
-
-            agent.exploration_rate = max(0.05, agent.exploration_rate * exploration_decay)
+            print(f"Settle wait for episode {episode+1}: {total_wait:.1f} s")
+            if agent.planner is not None:
+                print(f"Planning: {agent.planner.stats()}")
+            session.end_episode(total_reward)
+            # Changed rows only; the full table is published every few episodes
+            checkpointer.checkpoint(session.state())
 
     except KeyboardInterrupt:
         print("\nTraining interrupted by user.")
 
+    log.close()
     agent.clean_resources()
-    agent.save_q_table("First Scenario - Desktop/light_first_scenario/q_table.npy")
+    agent.stop_sampler()
+    checkpointer.close(session.state())
+    print(f"Q-Table saved to {Q_TABLE_PATH}. Checkpoints: {checkpointer.stats()}")
 
-    return rewards_per_episode
+    return session.run_rewards()
+
+def train_offline(epochs=20, learning_rate=0.1, discount_factor=0.9, log_path=TRANSITIONS_PATH,
+                  q_table_path="First Scenario - Desktop/light_first_scenario/q_table_offline.qtab"):
+    """Train a new Q-table from the transitions of live runs, without stressing the system."""
+    env = ReplayEnv(log_path)
+    agent = LightEventAgent()
+    agent.q_table = np.zeros_like(agent.q_table)
+    agent.visits = np.zeros_like(agent.visits)
+    agent.learning_rate = learning_rate
+    agent.discount_factor = discount_factor
+    errors = env.train(agent, agent.metrics_state_index, epochs=epochs)
+    for epoch, error in enumerate(errors):
+        print(f"Epoch {epoch+1}/{epochs}: mean |TD error| {error:.4f} over {len(env)} transitions")
+    agent.save_q_table(q_table_path, stats={"offline_epochs": epochs, "transitions": len(env),
+                                            "td_error": errors[-1] if errors else None})
+    return errors
 
 if __name__ == "__main__":
-    train_agent()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "offline":
+        train_offline()
+    else:
+        train_agent()
\ No newline at end of file
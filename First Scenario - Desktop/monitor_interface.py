@@ -1,14 +1,24 @@
 import tkinter as tk
 from tkinter import ttk
-import psutil
 import threading
 import time
-import subprocess
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.procfs import CpuFrequency, DiskStats, ProcCollector, disk_usage as read_disk_usage, process_count
+from common.counters import CounterRates, DiskRates
+from common.gui_tasks import TaskRunner
+
+# Highest refresh rate, in updates per second
+MAX_REFRESH_HZ = 10
 
 class SystemMonitorGUI:
-    def __init__(self, root):
-        """Initializes the GUI for the system monitor."""
+    def __init__(self, root, refresh_hz=1.0):
+        """
+        Initializes the GUI for the system monitor, refreshed refresh_hz times per second
+        (at most MAX_REFRESH_HZ). Rates are computed over the time between two refreshes.
+        """
         self.root = root
         self.root.title("System Monitor")
         self.root.geometry("500x600")
@@ -53,6 +63,17 @@ class SystemMonitorGUI:
         self.process_label = ttk.Label(root, text="Active Processes: ", font=("Arial", 12))
         self.process_label.pack(pady=5)
 
+        # Persistent /proc and /sys readers shared by every refresh
+        self.interval = 1 / min(max(refresh_hz, 0.1), MAX_REFRESH_HZ)
+        self.collector = ProcCollector()
+        self.counters = CounterRates(self.collector)
+        self.disk_stats = DiskStats()
+        self.disk_rates = DiskRates(self.disk_stats)
+        self.cpu_freq = CpuFrequency()
+
+        # Labels are only updated on the Tk thread, from texts posted by the update thread
+        self.tasks = TaskRunner(root)
+
         # Start a thread to update metrics
         self.running = True
         self.update_thread = threading.Thread(target=self.update_metrics, daemon=True)
@@ -63,81 +84,66 @@ class SystemMonitorGUI:
 
     def update_metrics(self):
         """Updates the system metrics in the GUI."""
+        next_tick = time.monotonic()
         while self.running:
             try:
                 # Collect metrics
-                cpu_usage = psutil.cpu_percent(interval=1)
-                cpu_freq = psutil.cpu_freq().current if psutil.cpu_freq() else "N/A"
+                sample, rates = self.counters.update()
+                cpu_usage = rates["cpu_usage"]
+                cpu_freq = self.cpu_freq.read()
 
                 # CPU temperature
-                temp = "N/A"
-                temperatures = psutil.sensors_temperatures()
-                if "coretemp" in temperatures:
-                    core_temps = temperatures["coretemp"]
-                    if core_temps:
-                        temp = core_temps[0].current
+                temp = sample.temperature if self.collector.thermal is not None else "N/A"
 
                 # Disk usage
-                disk_usage = psutil.disk_usage('/').percent
-
-                # Page faults and interrupts
-                vmstat_output = subprocess.check_output(["vmstat", "1", "2"]).decode().splitlines()
-                if len(vmstat_output) > 2:
-                    stats = vmstat_output[-1].split()
-                    page_faults = stats[9]
-                    interrupts = stats[11]
-                else:
-                    page_faults = "N/A"
-                    interrupts = "N/A"
+                disk_usage = read_disk_usage('/')
 
                 # Network throughput
-                net_io = psutil.net_io_counters()
-                network_throughput = f"Sent: {net_io.bytes_sent / 1024:.2f} KB, Recv: {net_io.bytes_recv / 1024:.2f} KB"
-
-                # I/O queue length
-                io_queue = subprocess.check_output(["iostat", "-x", "1", "2"]).decode().splitlines()
-                if len(io_queue) > 3:
-                    io_stats = io_queue[-1].split()
-                    io_queue_length = io_stats[8] if len(io_stats) > 8 else "N/A"
-                else:
-                    io_queue_length = "N/A"
-
-                memory_usage = psutil.virtual_memory().percent
-                self.memory_label.config(text=f"Memory Usage: {memory_usage:.2f}%")
-
-                swap_usage = psutil.swap_memory().percent
-                self.swap_label.config(text=f"Swap Usage: {swap_usage:.2f}%")
-
-                load_avg = os.getloadavg()[0]  # Load average sur 1 minute
-                self.load_label.config(text=f"Load Average: {load_avg:.2f}")
-
-                cpu_times = psutil.cpu_times()
-                io_wait = cpu_times.iowait if hasattr(cpu_times, 'iowait') else "N/A"
-                self.io_wait_label.config(text=f"I/O Wait: {io_wait:.2f} sec")
-
-                process_count = len(psutil.pids())
-                self.process_label.config(text=f"Active Processes: {process_count}")
-
-                # Update labels
-                self.cpu_label.config(text=f"CPU Usage: {cpu_usage:.2f}%")
-                self.cpu_freq_label.config(text=f"CPU Frequency: {cpu_freq:.2f} MHz")
-                self.temp_label.config(text=f"CPU Temperature: {temp}°C")
-                self.disk_label.config(text=f"Disk Usage: {disk_usage:.2f}%")
-                self.page_faults_label.config(text=f"Page Faults/s: {page_faults}")
-                self.interrupts_label.config(text=f"Interrupts/s: {interrupts}")
-                self.network_label.config(text=f"Network Throughput: {network_throughput}")
-                self.io_queue_label.config(text=f"I/O Queue Length: {io_queue_length}")
-
-                time.sleep(1)
+                network_throughput = f"Sent: {rates['net_sent'] / 1024:.2f} KB/s, Recv: {rates['net_recv'] / 1024:.2f} KB/s"
+
+                # Average requests in flight and time per request of every block device (iostat aqu-sz, await)
+                io_queue_length = "\n".join(
+                    f"{device}: {disk['queue_depth']:.2f} (await {disk['await_ms']:.1f} ms, util {disk['util']:.0f}%)"
+                    for device, disk in self.disk_rates.update().items()
+                ) or "N/A"
+
+                self.tasks.call_soon(self.show_metrics, {
+                    self.memory_label: f"Memory Usage: {sample.memory_usage:.2f}%",
+                    self.swap_label: f"Swap Usage: {sample.swap_usage:.2f}%",
+                    self.load_label: f"Load Average: {sample.load1:.2f}",  # Load average sur 1 minute
+                    self.io_wait_label: f"I/O Wait: {rates['io_wait']:.2f}%",
+                    self.process_label: f"Active Processes: {process_count()}",
+                    self.cpu_label: f"CPU Usage: {cpu_usage:.2f}%",
+                    self.cpu_freq_label: "CPU Frequency: N/A" if cpu_freq is None else f"CPU Frequency: {cpu_freq:.2f} MHz",
+                    self.temp_label: f"CPU Temperature: {temp}°C",
+                    self.disk_label: f"Disk Usage: {disk_usage:.2f}%",
+                    self.page_faults_label: f"Page Faults/s: {rates['page_faults']:.0f}",
+                    self.interrupts_label: f"Interrupts/s: {rates['interrupts']:.0f}",
+                    self.network_label: f"Network Throughput: {network_throughput}",
+                    self.io_queue_label: f"I/O Queue Length: {io_queue_length}",
+                })
             except Exception as e:
                 print(f"Error updating metrics: {e}")
+            # Fixed cadence: the time spent collecting is not added to the interval
+            next_tick = max(next_tick + self.interval, time.monotonic())
+            time.sleep(next_tick - time.monotonic())
+        self.collector.close()
+        self.disk_stats.close()
+        self.cpu_freq.close()
+
+    def show_metrics(self, texts):
+        """Set the text of each label (Tk thread)."""
+        for label, text in texts.items():
+            label.config(text=text)
 
     def close(self):
         """Stops the update thread and closes the window."""
         self.running = False
+        self.tasks.shutdown()
         self.root.destroy()
 
 if __name__ == "__main__":
+    # python monitor_interface.py [refresh rate in Hz, up to 10]
     root = tk.Tk()
-    app = SystemMonitorGUI(root)
+    app = SystemMonitorGUI(root, refresh_hz=float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
     root.mainloop()
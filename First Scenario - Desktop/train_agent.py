@@ -1,64 +1,120 @@
+import sys
 import time
 import random
-from agent import EventAgent, NEGATIVE_ACTIONS, get_negative_action_delay, apply_negative_action
+import numpy as np
+from agent import EventAgent, NEGATIVE_ACTIONS, Q_TABLE_PATH, get_negative_action_delay, apply_negative_action
+from common.checkpoint import Checkpointer
+from common.session import Schedule, resume_session
+from common.transitions import ReplayEnv, TransitionLog
 
-def train_agent(num_episodes=250, nb_steps_per_episode=10, learning_rate=0.1, discount_factor=0.9, exploration_rate=1.0, exploration_decay=0.995):
-    """Main training loop for the RL agent."""
+TRANSITIONS_PATH = "First Scenario - Desktop/transitions"
+
+def train_agent(num_episodes=250, nb_steps_per_episode=10, learning_rate=None, discount_factor=0.9, exploration_rate=None, exploration_decay=None,
+                planning_steps=0, seed=None):
+    """
+    Main training loop for the RL agent. With planning_steps, every real step is followed by
+    that many Dyna-Q planning updates. Every episode is checkpointed in the background with
+    the training session (common.session): an interrupted run (Ctrl+C, crash, reboot)
+    resumes at the episode it stopped at, and a new run continues the exploration schedule
+    (epsilon 1.0, x0.995 per episode, at least 0.05) and learning rate (0.1) of the last
+    one. Rates given explicitly restart their schedule at the current episode.
+    """
     agent = EventAgent()
-    agent.learning_rate = learning_rate
+    if planning_steps:
+        agent.enable_planning(planning_steps)
+    agent.start_sampler()
     agent.discount_factor = discount_factor
-    agent.exploration_rate = exploration_rate
+    # Tunables as they were before training, restored at the end
+    baseline = agent.tunables.snapshot()
+    log = TransitionLog(TRANSITIONS_PATH, list(agent.state), agent.actions, NEGATIVE_ACTIONS, policy="q_learning")
+    checkpointer = Checkpointer(agent, Q_TABLE_PATH)
+    session = resume_session(checkpointer, num_episodes, Schedule(1.0, 0.995, 0.05), Schedule(0.1), seed=seed,
+                             exploration_rate=exploration_rate, exploration_decay=exploration_decay,
+                             learning_rate=learning_rate)
 
     try:
-        for episode in range(num_episodes):
-            print(f"\n=== Episode {episode+1}/{num_episodes} ===")
+        for episode in session.episodes(agent):
+            print(f"\n=== Episode {episode+1}/{session.target} ===")
+            reset_time = time.monotonic()
             agent.reset_all_params()
-            time.sleep(1)
+            agent.wait_settled(reset_time, max_wait=2)
             total_reward = 0
+            total_wait = 0.0
 
             for step in range(nb_steps_per_episode):
+                step_start = time.monotonic()
                 negative_action = random.choice(NEGATIVE_ACTIONS)
+                agent.last_stress = negative_action
                 proc = apply_negative_action(negative_action)
+                stress_time = time.monotonic()
                 delay = get_negative_action_delay(negative_action)
-                time.sleep(delay)
 
-                agent.update_metrics_once()
+                stress_wait = agent.wait_settled(stress_time, max_wait=delay)
+                metrics = dict(agent.state)
                 state = agent.get_normalized_state()
 
-                if negative_action == "simulate_network_stress" and proc is not None:
-                    server_proc, client_proc = proc
-                    client_proc.wait()
-                    server_proc.terminate()
-                    server_proc.wait()
-                elif proc is not None:
-                    proc.wait()
+                if proc is not None:
+                    print(f"{negative_action} load: {proc.wait()}")
 
-                if random.uniform(0, 1) < exploration_rate:
+                if random.uniform(0, 1) < agent.exploration_rate:
                     action_idx = random.randint(0, len(agent.actions) - 1)
                 else:
                     action_idx = agent.select_action(state)
                 agent.apply_action(action_idx)
-                time.sleep(2)
-
-                agent.update_metrics_once()
+                action_time = time.monotonic()
+                action_wait = agent.wait_settled(action_time, max_wait=2)
+                total_wait += stress_wait + action_wait
                 new_state = agent.get_normalized_state()
 
                 reward = agent.compute_reward(state, new_state, debug=False)
                 agent.learn(state, action_idx, reward, new_state)
                 total_reward += reward
+                log.record(metrics, action_idx, dict(agent.state), reward, stress=negative_action,
+                           episode=episode, step=step, wait_time=stress_wait + action_wait,
+                           step_time=time.monotonic() - step_start)
 
                 state = new_state
 
             print(f"Total reward for episode {episode+1}: {total_reward:.2f}")
+            print(f"Settle wait for episode {episode+1}: {total_wait:.1f} s")
+            if agent.planner is not None:
+                print(f"Planning: {agent.planner.stats()}")
 
-            exploration_rate = max(0.05, exploration_rate * exploration_decay)
-            agent.exploration_rate = exploration_rate
+            session.end_episode(total_reward)
+            # Changed rows only; the full table is published (for EventAgent.follow_q_table)
+            # every few episodes
+            checkpointer.checkpoint(session.state())
 
     except KeyboardInterrupt:
         print("\nTraining interrupted by user.")
 
+    log.close()
     agent.clean_resources()
-    agent.save_q_table("First Scenario - Desktop/q_table.npy")
+    agent.reset_all_params(baseline)
+    agent.stop_sampler()
+    checkpointer.close(session.state())
+    print(f"Q-Table saved to {Q_TABLE_PATH}. Checkpoints: {checkpointer.stats()}")
+
+def train_offline(epochs=20, learning_rate=0.1, discount_factor=0.9, log_path=TRANSITIONS_PATH,
+                  q_table_path="First Scenario - Desktop/q_table_offline.qtab"):
+    """
+    Train a new Q-table from the transitions recorded by live runs, without stressing the system.
+    """
+    env = ReplayEnv(log_path)
+    agent = EventAgent()
+    agent.q_table = np.zeros_like(agent.q_table)
+    agent.visits = np.zeros_like(agent.visits)
+    agent.learning_rate = learning_rate
+    agent.discount_factor = discount_factor
+    errors = env.train(agent, agent.metrics_state_index, epochs=epochs)
+    for epoch, error in enumerate(errors):
+        print(f"Epoch {epoch+1}/{epochs}: mean |TD error| {error:.4f} over {len(env)} transitions")
+    agent.save_q_table(q_table_path, stats={"offline_epochs": epochs, "transitions": len(env),
+                                            "td_error": errors[-1] if errors else None})
+    return errors
 
 if __name__ == "__main__":
-    train_agent()
+    if len(sys.argv) > 1 and sys.argv[1] == "offline":
+        train_offline()
+    else:
+        train_agent()
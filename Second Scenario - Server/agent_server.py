@@ -1,7 +1,47 @@
 import numpy as np
 import psutil
 import os
-import time
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.q_learning import batch_q_update, flat_q_view
+from common.state_encoder import StateEncoder
+from common.tunables import shared_tunables
+from common.dyna import DynaPlanner
+from common.qtable_store import QTableReader, load_agent_q_table, publish_q_table, stamp_q_meta
+
+# Tunables written by each action (no_op writes nothing)
+ACTION_SETTINGS = {
+    "set_dirty_ratio_10": {"vm.dirty_ratio": 10},
+    "set_dirty_ratio_20": {"vm.dirty_ratio": 20},
+    "set_dirty_ratio_30": {"vm.dirty_ratio": 30},
+    "set_dirty_ratio_40": {"vm.dirty_ratio": 40},
+    "set_rmem_max_1M": {"net.core.rmem_max": 1048576},
+    "set_rmem_max_8M": {"net.core.rmem_max": 8388608},
+    "set_rmem_max_16M": {"net.core.rmem_max": 16777216},
+    "set_wmem_max_1M": {"net.core.wmem_max": 1048576},
+    "set_wmem_max_8M": {"net.core.wmem_max": 8388608},
+    "set_wmem_max_16M": {"net.core.wmem_max": 16777216},
+    "set_tcp_tw_reuse_0": {"net.ipv4.tcp_tw_reuse": 0},
+    "set_tcp_tw_reuse_1": {"net.ipv4.tcp_tw_reuse": 1},
+    "set_tcp_fin_timeout_10": {"net.ipv4.tcp_fin_timeout": 10},
+    "set_tcp_fin_timeout_30": {"net.ipv4.tcp_fin_timeout": 30},
+    "set_somaxconn_128": {"net.core.somaxconn": 128},
+    "set_somaxconn_1024": {"net.core.somaxconn": 1024},
+    "no_op": {},
+    "reset_rmem_max": {"net.core.rmem_max": 212992},
+    "reset_wmem_max": {"net.core.wmem_max": 212992},
+}
+
+# Values restored between episodes
+DEFAULT_SETTINGS = {
+    "vm.dirty_ratio": 20,
+    "net.core.rmem_max": 212992,
+    "net.core.wmem_max": 212992,
+    "net.ipv4.tcp_tw_reuse": 0,
+    "net.ipv4.tcp_fin_timeout": 60,
+    "net.core.somaxconn": 128,
+}
 
 class ServerAgent:
     def __init__(self, exploration_rate=1.0):
@@ -34,6 +74,7 @@ class ServerAgent:
             "reset_rmem_max",
             "reset_wmem_max",
         ]
+        self.tunables = shared_tunables()
 
         self.bins = {
             "cpu_usage": np.linspace(0, 100, 5), 
@@ -41,13 +82,18 @@ class ServerAgent:
             "requests_per_sec": np.linspace(170000, 210000, 9), 
             "latency": np.linspace(8, 20, 13)  
         }
-        q_table_shape = tuple(len(b) - 1 for b in self.bins.values()) + (len(self.actions),)
+        self.encoder = StateEncoder.from_bins(self.bins)
+        q_table_shape = self.encoder.shape + (len(self.actions),)
         self.q_table = np.zeros(q_table_shape)
+        # Live updates of each (state, action), saved with the Q-table
+        self.visits = np.zeros(q_table_shape, dtype=np.uint32)
 
         self.learning_rate = 0.1
         self.discount_factor = 0.9
         self.exploration_rate = exploration_rate
         self.exploration_decay = 0.995
+        self.planner = None
+        self.q_reader = None
 
         self.last_action_time = {}
 
@@ -75,79 +121,93 @@ class ServerAgent:
         """
         Discretize the normalized state vector into bin indices.
         """
-        idx = []
-        for i, name in enumerate(self.metric_names):
-            bin_idx = np.digitize([state[i]], self.bins[name])[0] - 1
-            bin_idx = min(bin_idx, len(self.bins[name]) - 2)
-            bin_idx = max(bin_idx, 0)
-            idx.append(bin_idx)
-        return tuple(idx)
+        return self.encoder.decode(self.encoder.encode(state))
 
     def select_action(self, state):
         """
         Select an action using epsilon-greedy policy.
         """
+        if self.q_reader is not None:
+            self.q_table = self.q_reader.table()
         if np.random.rand() < self.exploration_rate:
             return np.random.randint(len(self.actions))
-        idx = self.discretize_state(state)
-        return np.argmax(self.q_table[idx])
+        return np.argmax(flat_q_view(self.q_table)[self.encoder.encode(state)])
 
     def learn(self, state, action, reward, new_state):
         """
         Update the Q-table using the Q-learning update rule.
         """
-        idx = self.discretize_state(state)
-        new_idx = self.discretize_state(new_state)
-        best_next = np.max(self.q_table[new_idx])
+        if self.q_reader is not None:
+            return
+        q = flat_q_view(self.q_table)
+        idx = self.encoder.encode(state)
+        new_idx = self.encoder.encode(new_state)
+        best_next = np.max(q[new_idx])
         td_target = reward + self.discount_factor * best_next
-        td_error = td_target - self.q_table[idx][action]
-        self.q_table[idx][action] += self.learning_rate * td_error
+        td_error = td_target - q[idx, action]
+        q[idx, action] += self.learning_rate * td_error
+        flat_q_view(self.visits)[idx, action] += 1
+        if self.planner is not None:
+            self.planner.observe(idx, action, reward, new_idx)
+            self.planner.plan()
+
+    def enable_planning(self, planning_steps=20, **kwargs):
+        """
+        Follow every real update with planning_steps simulated ones (Dyna-Q with
+        prioritized sweeping, see common.dyna.DynaPlanner).
+        """
+        self.planner = DynaPlanner(self, planning_steps=planning_steps, **kwargs)
+        return self.planner
+
+    def q_table_meta(self):
+        """
+        Metadata saved with the Q-table (common.qtable_store): what its axes mean, checked
+        when loading it, and the hyperparameters it was trained with.
+        """
+        return {
+            "agent": type(self).__name__,
+            "shape": list(self.q_table.shape),
+            "metrics": self.metric_names,
+            "bins": self.bins,
+            "actions": self.actions,
+            "stresses": [],
+            "hyperparameters": {
+                "learning_rate": self.learning_rate,
+                "discount_factor": self.discount_factor,
+                "exploration_rate": self.exploration_rate,
+                "exploration_decay": self.exploration_decay,
+            },
+        }
+
+    def follow_q_table(self, path):
+        """
+        Act from the Q-table published at path, mapped read-only and shared with other
+        processes; each new version is used from the next decision. learn() does nothing.
+        """
+        self.q_reader = QTableReader(path, expect=self.q_table_meta())
+        self.q_table = self.q_reader.table()
+
+    def state_index(self, state):
+        """
+        Flat row index of a normalized state in the (n_states, n_actions) view of the Q-table.
+        """
+        return self.encoder.encode(state)
+
+    def learn_batch(self, state_idx, actions, rewards, new_state_idx, mode="sequential"):
+        """
+        Update the Q-table from arrays of transitions given as flat state indices.
+        """
+        return batch_q_update(self.q_table, state_idx, actions, rewards, new_state_idx,
+                              self.learning_rate, self.discount_factor, mode=mode)
 
     def apply_action(self, action_idx):
         """
-        Apply the selected action to the system, with logging before and after.
+        Apply the selected action to the system, with logging of the write latency.
         """
         action = self.actions[action_idx]
-
-        if action == "no_op":
-            pass
-        elif action == "set_dirty_ratio_10":
-            os.system("sudo sysctl -w vm.dirty_ratio=10")
-        elif action == "set_dirty_ratio_20":
-            os.system("sudo sysctl -w vm.dirty_ratio=20")
-        elif action == "set_dirty_ratio_30":
-            os.system("sudo sysctl -w vm.dirty_ratio=30")
-        elif action == "set_dirty_ratio_40":
-            os.system("sudo sysctl -w vm.dirty_ratio=40")
-        elif action == "set_rmem_max_1M":
-            os.system("sudo sysctl -w net.core.rmem_max=1048576")
-        elif action == "set_rmem_max_8M":
-            os.system("sudo sysctl -w net.core.rmem_max=8388608")
-        elif action == "set_rmem_max_16M":
-            os.system("sudo sysctl -w net.core.rmem_max=16777216")
-        elif action == "set_wmem_max_1M":
-            os.system("sudo sysctl -w net.core.wmem_max=1048576")
-        elif action == "set_wmem_max_8M":
-            os.system("sudo sysctl -w net.core.wmem_max=8388608")
-        elif action == "set_wmem_max_16M":
-            os.system("sudo sysctl -w net.core.wmem_max=16777216")
-        elif action == "set_tcp_tw_reuse_0":
-            os.system("sudo sysctl -w net.ipv4.tcp_tw_reuse=0")
-        elif action == "set_tcp_tw_reuse_1":
-            os.system("sudo sysctl -w net.ipv4.tcp_tw_reuse=1")
-        elif action == "set_tcp_fin_timeout_10":
-            os.system("sudo sysctl -w net.ipv4.tcp_fin_timeout=10")
-        elif action == "set_tcp_fin_timeout_30":
-            os.system("sudo sysctl -w net.ipv4.tcp_fin_timeout=30")
-        elif action == "set_somaxconn_128":
-            os.system("sudo sysctl -w net.core.somaxconn=128")
-        elif action == "set_somaxconn_1024":
-            os.system("sudo sysctl -w net.core.somaxconn=1024")
-        elif action == "reset_rmem_max":
-            os.system("sudo sysctl -w net.core.rmem_max=212992")
-        elif action == "reset_wmem_max":
-            os.system("sudo sysctl -w net.core.wmem_max=212992")
-        time.sleep(1)
+        latencies = self.tunables.apply(ACTION_SETTINGS[action])
+        for key, latency in latencies.items():
+            print(f"{key} written in {1000 * latency:.3f} ms")
 
     def compute_reward(self, metrics, latency=None, p99=None, debug=False, prev_rps=None):
         """
@@ -189,14 +249,23 @@ class ServerAgent:
         
         return 1.0
 
-    def save_q_table(self, path):
+    def save_q_table(self, path, stats=None, dtype=None):
         """
-        Save the Q-table to a file.
+        Save the Q-table with its metadata and visit counts, atomically so processes
+        following it never read a partial one. stats are training stats to record.
         """
-        np.save(path, self.q_table)
+        publish_q_table(path, self.q_table, meta=stamp_q_meta(self.q_table_meta(), self.visits, stats),
+                        visits=self.visits, dtype=dtype)
 
     def load_q_table(self, path):
         """
-        Load the Q-table from a file.
+        Load the Q-table from a file, keeping the current one if it was saved for other
+        bins or actions (a .npy of the same name is read if there is no container yet).
         """
-        self.q_table = np.load(path)
+        stored = load_agent_q_table(path, self.q_table_meta())
+        if stored is None:
+            print("Starting from a new Q-table.")
+            return
+        self.q_table = stored.q_table
+        if stored.visits is not None:
+            self.visits = stored.visits
@@ -3,36 +3,46 @@ import time
 import numpy as np
 from agent_server import ServerAgent
 from load_generator import run_wrk
-from train_server_agent import collect_metrics, reset_sys_params
+from train_server_agent import collect_metrics, reset_sys_params, transition_log
 
 def main(num_episodes=30, nb_steps_per_episode=10, sleep_interval=1, return_rewards=False):
     """Run a no-op agent on the server environment for a number of episodes."""
     agent = ServerAgent()
     rewards = []
+    reset_sys_params(full=True)
+    log = transition_log(agent, "noop")
     for episode in range(num_episodes):
         print(f"\n=== Episode {episode+1} / {num_episodes} ===")
         reset_sys_params()
         previous_actions = []
         requests_per_sec, latency, p99, _ = run_wrk(duration=2)
-        state = agent.get_state(collect_metrics(requests_per_sec, latency))
+        metrics = dict(collect_metrics(requests_per_sec, latency), p99=p99)
+        state = agent.get_state(metrics)
         total_reward = 0
         last_rps = requests_per_sec
         for step in range(nb_steps_per_episode):
+            step_start = time.monotonic()
             action_idx = agent.actions.index("no_op")
             print(f"Applying action: {agent.actions[action_idx]}")
             agent.apply_action(action_idx)
+            wrk_start = time.monotonic()
             requests_per_sec, latency, p99, _ = run_wrk()
-            next_state = agent.get_state(collect_metrics(requests_per_sec, latency))
-            metrics = collect_metrics(requests_per_sec, latency)
-            reward = agent.compute_reward(metrics, latency=latency, p99=p99, prev_rps=last_rps)
+            wrk_time = time.monotonic() - wrk_start
+            next_metrics = dict(collect_metrics(requests_per_sec, latency), p99=p99)
+            next_state = agent.get_state(next_metrics)
+            reward = agent.compute_reward(next_metrics, latency=latency, p99=p99, prev_rps=last_rps)
             last_rps = requests_per_sec
             print("reward:", reward)
             previous_actions.append(action_idx)
             total_reward += reward
+            log.record(metrics, action_idx, next_metrics, reward, episode=episode, step=step,
+                       wait_time=wrk_time, step_time=time.monotonic() - step_start)
+            metrics = next_metrics
             state = next_state
             time.sleep(sleep_interval)
         rewards.append(total_reward/nb_steps_per_episode)
         print(f"Average reward for episode {episode+1}: {total_reward/nb_steps_per_episode}")
+    log.close()
     os.makedirs("Second Scenario - Server/rewards", exist_ok=True)
     np.save("Second Scenario - Server/rewards/rewards_noop_server.npy", np.array(rewards))
     if return_rewards:
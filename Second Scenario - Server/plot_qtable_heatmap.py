@@ -1,9 +1,14 @@
-import numpy as np
+import os
+import sys
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# Load the Q-table saved as .npy (adapt the path if needed)
-q_table = np.load("Second Scenario - Server/q_table_server.npy")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.qtable_store import load_q_file, resolve_q_table_path
+
+# Map the Q-table saved by train_server_agent.py (adapt the path if needed)
+stored = load_q_file(resolve_q_table_path("Second Scenario - Server/q_table_server.qtab"), mmap=True)
+q_table = stored.q_table
 
 # If Q-table has more than 2 dimensions, flatten all but the last (actions)
 if q_table.ndim > 2:
@@ -12,7 +17,7 @@ else:
     heatmap_data = q_table
 
 plt.figure(figsize=(12, 7))
-sns.heatmap(heatmap_data, cmap="viridis", cbar=True)
+sns.heatmap(heatmap_data, cmap="viridis", cbar=True, xticklabels=stored.meta.get("actions", "auto"))
 plt.title("Q-table Heatmap (Server Scenario)")
 plt.xlabel("Actions")
 plt.ylabel("States")
@@ -1,7 +1,13 @@
 import time
 import psutil
 import os
-from agent_server import ServerAgent
+import sys
+from agent_server import ServerAgent, DEFAULT_SETTINGS
+from common.tunables import DROP_CACHES, shared_tunables
+from common.tuning_helper import run_privileged
+from common.transitions import ReplayEnv, TransitionLog
+from common.checkpoint import Checkpointer
+from common.session import Schedule, resume_session
 from load_generator import run_wrk
 import numpy as np
 import matplotlib.pyplot as plt
@@ -10,6 +16,10 @@ from typing import Dict
 import json
 from datetime import datetime
 
+# Raw metrics of each logged transition: collect_metrics() plus the wrk p99 latency
+TRANSITION_METRICS = ["cpu_usage", "mem_usage", "requests_per_sec", "latency", "p99"]
+TRANSITIONS_PATH = "Second Scenario - Server/transitions"
+
 @dataclass
 class Configuration:
     """Data class to hold configuration parameters and their associated metrics."""
@@ -42,38 +52,30 @@ def collect_metrics(requests_per_sec, latency):
         "latency": latency if latency is not None else 0.0
     }
 
-def reset_sys_params():
-    """Reset system parameters to default values between episodes."""
-    os.system("sudo sysctl -w vm.dirty_ratio=20")
-    time.sleep(0.1)
-    os.system("sudo sysctl -w net.core.rmem_max=212992")
-    time.sleep(0.1)
-    os.system("sudo sysctl -w net.core.wmem_max=212992")
-    time.sleep(0.1)
-    os.system("sudo sysctl -w net.ipv4.tcp_tw_reuse=0")
-    time.sleep(0.1)
-    os.system("sudo sysctl -w net.ipv4.tcp_fin_timeout=60") 
-    time.sleep(0.1)
-    os.system("sudo sysctl -w net.core.somaxconn=128")
-    time.sleep(0.1)
-    os.system("sudo systemctl restart nginx")
-    time.sleep(0.1)
-    os.system("sudo sh -c 'echo 3 > /proc/sys/vm/drop_caches'")
-    time.sleep(0.1)
-    os.system("pkill wrk")
-    time.sleep(0.1)
-    os.system("sudo truncate -s 0 /var/log/nginx/access.log")
-    time.sleep(1)  
+def reset_sys_params(full=False):
+    """
+    Reset system parameters to default values between episodes, writing only those that
+    differ from DEFAULT_SETTINGS. full also restarts nginx and drops caches for a cold start.
+    """
+    tunables = shared_tunables()
+    tunables.restore(DEFAULT_SETTINGS)
+    if full:
+        run_privileged([("restart", "nginx")])
+        tunables.set(DROP_CACHES, 3, force=True)
+    run_privileged([("pkill", "wrk"), ("truncate", "/var/log/nginx/access.log")])
+    if full:
+        time.sleep(1)
+
+def transition_log(agent, policy):
+    """Transition log shared by the training and policy scripts of this scenario."""
+    return TransitionLog(TRANSITIONS_PATH, TRANSITION_METRICS, agent.actions, policy=policy)
 
 def get_current_params():
     """Get current system parameters for logging and validation."""
+    tunables = shared_tunables()
     params = {}
-    params["dirty_ratio"] = os.popen("sysctl vm.dirty_ratio").read().split("=")[1].strip()
-    params["rmem_max"] = os.popen("sysctl net.core.rmem_max").read().split("=")[1].strip()
-    params["wmem_max"] = os.popen("sysctl net.core.wmem_max").read().split("=")[1].strip()
-    params["tcp_tw_reuse"] = os.popen("sysctl net.ipv4.tcp_tw_reuse").read().split("=")[1].strip()
-    params["tcp_fin_timeout"] = os.popen("sysctl net.ipv4.tcp_fin_timeout").read().split("=")[1].strip()
-    params["somaxconn"] = os.popen("sysctl net.core.somaxconn").read().split("=")[1].strip()
+    for key in DEFAULT_SETTINGS:
+        params[key.split(".")[-1]] = tunables.read(key, refresh=True)
     return params
 
 def validate_configuration(config_params, agent):
@@ -83,24 +85,31 @@ def validate_configuration(config_params, agent):
     reward = agent.compute_reward(metrics, latency=latency, p99=p99)
     return reward, rps, latency
 
-def run_episode(agent, nb_steps_per_episode, sleep_interval, previous_actions):
-    """Run a single episode of the reinforcement learning agent on the server environment."""
+def run_episode(agent, nb_steps_per_episode, sleep_interval, previous_actions, log=None, episode=0):
+    """
+    Run a single episode of the reinforcement learning agent on the server environment,
+    recording its transitions in log if given.
+    """
     reset_sys_params()
     requests_per_sec, latency, p99, _ = run_wrk(duration=2)
     print(f"wrk RPS: {requests_per_sec}, latency: {latency} ms, p99: {p99} ms")
-    state = agent.get_state(collect_metrics(requests_per_sec, latency))
+    metrics = dict(collect_metrics(requests_per_sec, latency), p99=p99)
+    state = agent.get_state(metrics)
     total_reward = 0
     last_rps = requests_per_sec
 
     for step in range(nb_steps_per_episode):
+        step_start = time.monotonic()
         action_idx = agent.select_action(state)
         print(f"Applying action: {agent.actions[action_idx]}")
         agent.apply_action(action_idx)
+        wrk_start = time.monotonic()
         requests_per_sec, latency, p99, _ = run_wrk()
-        next_state = agent.get_state(collect_metrics(requests_per_sec, latency))
-        metrics = collect_metrics(requests_per_sec, latency)
-        print("metrics:", metrics)
-        reward = agent.compute_reward(metrics, latency=latency, p99=p99, prev_rps=last_rps)
+        wrk_time = time.monotonic() - wrk_start
+        next_metrics = dict(collect_metrics(requests_per_sec, latency), p99=p99)
+        next_state = agent.get_state(next_metrics)
+        print("metrics:", next_metrics)
+        reward = agent.compute_reward(next_metrics, latency=latency, p99=p99, prev_rps=last_rps)
         last_rps = requests_per_sec
         #if agent.actions[action_idx] != "no_op":
         #    penalty_factor = agent.penalize_consecutive_actions(action_idx, previous_actions)
@@ -108,6 +117,10 @@ def run_episode(agent, nb_steps_per_episode, sleep_interval, previous_actions):
         print("reward:", reward)
         previous_actions.append(action_idx)
         agent.learn(state, action_idx, reward, next_state)
+        if log is not None:
+            log.record(metrics, action_idx, next_metrics, reward, episode=episode, step=step,
+                       wait_time=wrk_time, step_time=time.monotonic() - step_start)
+        metrics = next_metrics
         state = next_state
         total_reward += reward 
         time.sleep(sleep_interval)
@@ -155,34 +168,49 @@ def plot_rewards(rewards, plots_dir):
     plt.savefig(plot_path)
     print(f"Plot saved as {plot_path}")
 
-def train_agent(num_episodes=30, nb_steps_per_episode=10, sleep_interval=0.1, return_rewards=False, exploration_rate=0.1):
-    """Train a reinforcement learning agent for the server scenario."""
-    agent = ServerAgent(exploration_rate=exploration_rate)
-    qtable_path = "Second Scenario - Server/q_table_server.npy"
+def train_agent(num_episodes=30, nb_steps_per_episode=10, sleep_interval=0.1, return_rewards=False, exploration_rate=None,
+                planning_steps=0, seed=None):
+    """
+    Train a reinforcement learning agent for the server scenario. With planning_steps,
+    every real step is followed by that many Dyna-Q planning updates.
+    Training continues the saved session (epsilon schedule, RNG states, see common.session);
+    an explicit exploration_rate restarts the epsilon schedule from that value.
+    """
+    agent = ServerAgent()
+    if planning_steps:
+        agent.enable_planning(planning_steps)
+    qtable_path = "Second Scenario - Server/q_table_server.qtab"
     rewards_dir = "Second Scenario - Server/rewards"
     os.makedirs(rewards_dir, exist_ok=True)
     rewards_path = os.path.join(rewards_dir, "rewards_rl_server.npy")
-    if os.path.exists(qtable_path):
-        agent.load_q_table(qtable_path)
-    rewards = []
+    # Full table published every episode, for agents following it (ServerAgent.follow_q_table)
+    checkpointer = Checkpointer(agent, qtable_path, compact_every=1)
+    session = resume_session(checkpointer, num_episodes, Schedule(0.1, agent.exploration_decay, 0.05), seed=seed,
+                             exploration_rate=exploration_rate)
     previous_actions = []
     best_configs = []
     best_reward = float('-inf')
+    reset_sys_params(full=True)
+    log = transition_log(agent, "q_learning")
 
     try:
-        for episode in range(num_episodes):
-            print(f"\n=== Episode {episode+1} / {num_episodes} ===")
-            reward, requests_per_sec, latency = run_episode(agent, nb_steps_per_episode, sleep_interval, previous_actions)
-            rewards.append(reward/nb_steps_per_episode)
+        for episode in session.episodes(agent):
+            print(f"\n=== Episode {episode+1} / {session.target} ===")
+            reward, requests_per_sec, latency = run_episode(agent, nb_steps_per_episode, sleep_interval, previous_actions,
+                                                            log=log, episode=episode)
             print(f"Average reward of episode {episode+1} : {reward/nb_steps_per_episode}")
+            if agent.planner is not None:
+                print(f"Planning: {agent.planner.stats()}")
+            session.end_episode(reward / nb_steps_per_episode)
+            checkpointer.checkpoint(session.state())
 
             if reward > best_reward:
                 best_reward = reward
                 best_configs = update_best_configs(best_configs, reward, requests_per_sec, latency)
 
-            agent.exploration_rate = max(0.05, agent.exploration_rate * agent.exploration_decay)
-
-        agent.save_q_table(qtable_path)
+        log.close()
+        checkpointer.close()
+        rewards = session.run_rewards()
         np.save(rewards_path, np.array(rewards))
         plots_dir = "Second Scenario - Server/plots"
         plot_rewards(rewards, plots_dir)
@@ -197,9 +225,27 @@ def train_agent(num_episodes=30, nb_steps_per_episode=10, sleep_interval=0.1, re
 
     except KeyboardInterrupt:
         print("\nKeyboard interrupt detected. Saving Q-table and cleaning up...")
-        agent.save_q_table(qtable_path)
-        reset_sys_params()
+        log.close()
+        checkpointer.close(session.state())
+        reset_sys_params(full=True)
         print("Q-table saved. System parameters reset. Exiting.")
 
+def train_offline(epochs=20, learning_rate=0.1, discount_factor=0.9, log_path=TRANSITIONS_PATH,
+                  q_table_path="Second Scenario - Server/q_table_server_offline.qtab"):
+    """Train a new Q-table from the transitions of live runs, without running wrk."""
+    env = ReplayEnv(log_path)
+    agent = ServerAgent()
+    agent.learning_rate = learning_rate
+    agent.discount_factor = discount_factor
+    errors = env.train(agent, lambda metrics, stress: agent.state_index(agent.get_state(metrics)), epochs=epochs)
+    for epoch, error in enumerate(errors):
+        print(f"Epoch {epoch+1}/{epochs}: mean |TD error| {error:.4f} over {len(env)} transitions")
+    agent.save_q_table(q_table_path, stats={"offline_epochs": epochs, "transitions": len(env),
+                                            "td_error": errors[-1] if errors else None})
+    return errors
+
 if __name__ == "__main__":
-    train_agent()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "offline":
+        train_offline()
+    else:
+        train_agent()
\ No newline at end of file
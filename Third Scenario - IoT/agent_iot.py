@@ -1,10 +1,47 @@
 import os
 import numpy as np
 import time
-import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.q_learning import batch_q_update, flat_q_view
+from common.state_encoder import StateEncoder
+from common.qtable_store import QTableReader, load_agent_q_table, publish_q_table, stamp_q_meta
+
+# Uniform draws consumed by one simulation step: 4 per load spike rule
+# (temperature, disk I/O, error rate, network), then 5 for the natural drift.
+SPIKE_INTENSITIES = (1.0, 1.5, 0.7)
+NOISE_PER_STEP = 4 * len(SPIKE_INTENSITIES) + 5
+
+def uniform_from(u, low, high):
+    """Map a uniform draw in [0, 1) to [low, high). Works on floats and arrays."""
+    return low + (high - low) * u
+
+def randint_from(u, low, high):
+    """Map a uniform draw in [0, 1) to an integer in [low, high), kept as float."""
+    return low + (u * (high - low)) // 1
+
+def spike_increments(u, intensity):
+    """Return the (temperature, disk I/O, error rate, network) increments of a load spike."""
+    return (
+        uniform_from(u[0], 4, 8) * intensity,
+        randint_from(u[1], int(1e5), int(5e5) + 1) * intensity,
+        uniform_from(u[2], 0.05, 0.15) * intensity,
+        randint_from(u[3], int(1e5), int(5e5) + 1) * intensity,
+    )
+
+def drift_increments(u):
+    """Return the (temperature, battery drain, disk I/O, error rate, network) natural drift."""
+    return (
+        uniform_from(u[0], -0.2, 1.5),
+        uniform_from(u[1], 0.3, 1.0),
+        randint_from(u[2], int(1e4), int(1e5)),
+        uniform_from(u[3], -0.01, 0.02),
+        randint_from(u[4], -int(1e4), int(5e4)),
+    )
 
 class IoTAgent:
-    def __init__(self):
+    def __init__(self, seed=None):
         """Initialize the IoT agent with Q-learning parameters and state space."""
         self.actions = [
             "set_cpu_powersave",
@@ -33,13 +70,17 @@ class IoTAgent:
             "network_usage": np.linspace(0, 1e6, 5)          # Bytes/sec
         }
 
-        shape = tuple(len(b) - 1 for b in self.bins.values()) + (len(self.actions),)
+        self.encoder = StateEncoder.from_bins(self.bins)
+        shape = self.encoder.shape + (len(self.actions),)
         self.q_table = np.zeros(shape)
+        # Live updates of each (state, action), saved with the Q-table
+        self.visits = np.zeros(shape, dtype=np.uint32)
 
         self.learning_rate = 0.1
         self.discount_factor = 0.9
         self.exploration_rate = 1.0
         self.exploration_decay = 0.995
+        self.q_reader = None
 
         # Simulated state
         self.sim_cpu_freq = 2.0
@@ -50,6 +91,7 @@ class IoTAgent:
         self.sim_network_usage = 1e4
 
         self.sleep_mode_steps = 0
+        self.rng = np.random.default_rng(seed)
 
     def reset(self):
         """Reset the simulated environment to initial state."""
@@ -75,34 +117,45 @@ class IoTAgent:
 
     def normalize_state(self, raw_state):
         """Normalize the raw state into a tuple of indices based on defined bins."""
-        normalized = []
-        for key in self.metrics:
-            value = raw_state[key]
-            bin_edges = self.bins[key]
-            bin_idx = np.digitize([value], bin_edges)[0] - 1
-            bin_idx = max(0, min(bin_idx, len(bin_edges) - 2))
-            normalized.append(bin_idx)
-        return tuple(normalized)
-
-    def select_action(self, state_tuple):
-        """Select an action based on the current state using epsilon-greedy policy."""
+        return self.encoder.decode(self.state_index(raw_state))
+
+    def select_action(self, state_idx):
+        """Select an action for a flat state index (see state_index) using epsilon-greedy policy."""
         if self.sleep_mode_steps > 0:
             return self.actions.index("no_op")
+        if self.q_reader is not None:
+            self.q_table = self.q_reader.table()
         if np.random.rand() < self.exploration_rate:
             return np.random.randint(len(self.actions))
-        return np.argmax(self.q_table[state_tuple])
+        return np.argmax(flat_q_view(self.q_table)[state_idx])
 
     def learn(self, state, action_idx, reward, next_state):
         """Update the Q-table based on the action taken and the received reward."""
-        s = self.normalize_state(state)
-        s_prime = self.normalize_state(next_state)
-        best_next = np.max(self.q_table[s_prime])
+        if self.q_reader is not None:
+            return
+        q = flat_q_view(self.q_table)
+        s = self.state_index(state)
+        s_prime = self.state_index(next_state)
+        best_next = np.max(q[s_prime])
         td_target = reward + self.discount_factor * best_next
-        td_error = td_target - self.q_table[s][action_idx]
-        self.q_table[s][action_idx] += self.learning_rate * td_error
+        td_error = td_target - q[s, action_idx]
+        q[s, action_idx] += self.learning_rate * td_error
+        flat_q_view(self.visits)[s, action_idx] += 1
+
+    def state_index(self, raw_state):
+        """Flat row index of a raw state in the (n_states, n_actions) view of the Q-table."""
+        return self.encoder.encode([raw_state[key] for key in self.metrics])
 
-    def load_spikes(self):
+    def learn_batch(self, state_idx, action_idx, rewards, next_state_idx, dones=None, mode="sequential"):
+        """Update the Q-table from arrays of transitions given as flat state indices."""
+        return batch_q_update(self.q_table, state_idx, action_idx, rewards, next_state_idx,
+                              self.learning_rate, self.discount_factor, mode=mode, dones=dones)
+
+    def load_spikes(self, noise=None):
         """Simulate load spikes based on specific conditions."""
+        if noise is None:
+            noise = self.rng.random(4 * len(SPIKE_INTENSITIES)).tolist()
+
         if (
             self.sim_temperature > 42
             and self.sim_cpu_freq > 1.8
@@ -110,11 +163,7 @@ class IoTAgent:
             and self.sim_error_rate < 0.02
         ):
             print("[EVENT] Load spike! (classic)")
-            intensity = 1.0
-            self.sim_temperature += random.uniform(4, 8) * intensity
-            self.sim_disk_io += random.randint(int(1e5), int(5e5)) * intensity
-            self.sim_error_rate = min(1.0, self.sim_error_rate + random.uniform(0.05, 0.15) * intensity)
-            self.sim_network_usage += random.randint(int(1e5), int(5e5)) * intensity
+            self._apply_spike(noise[0:4], SPIKE_INTENSITIES[0])
 
         if (
             self.sim_battery > 95
@@ -122,22 +171,22 @@ class IoTAgent:
             and self.sim_cpu_freq < 1.3
         ):
             print("[EVENT] Load spike! (high battery, calm system)")
-            intensity = 1.5
-            self.sim_temperature += random.uniform(4, 8) * intensity
-            self.sim_disk_io += random.randint(int(1e5), int(5e5)) * intensity
-            self.sim_error_rate = min(1.0, self.sim_error_rate + random.uniform(0.05, 0.15) * intensity)
-            self.sim_network_usage += random.randint(int(1e5), int(5e5)) * intensity
+            self._apply_spike(noise[4:8], SPIKE_INTENSITIES[1])
 
         if (
             self.sim_network_usage < 100000
             and 38 < self.sim_temperature < 45
         ):
             print("[EVENT] Load spike! (low net, moderate temp)")
-            intensity = 0.7
-            self.sim_temperature += random.uniform(4, 8) * intensity
-            self.sim_disk_io += random.randint(int(1e5), int(5e5)) * intensity
-            self.sim_error_rate = min(1.0, self.sim_error_rate + random.uniform(0.05, 0.15) * intensity)
-            self.sim_network_usage += random.randint(int(1e5), int(5e5)) * intensity
+            self._apply_spike(noise[8:12], SPIKE_INTENSITIES[2])
+
+    def _apply_spike(self, noise, intensity):
+        """Add the increments of one load spike to the simulated state."""
+        d_temp, d_disk, d_error, d_net = spike_increments(noise, intensity)
+        self.sim_temperature += d_temp
+        self.sim_disk_io += d_disk
+        self.sim_error_rate = min(1.0, self.sim_error_rate + d_error)
+        self.sim_network_usage += d_net
 
     def apply_action(self, action_idx):
         """Apply the selected action to the simulated environment."""
@@ -174,18 +223,27 @@ class IoTAgent:
                 self.sim_error_rate = max(0, self.sim_error_rate - 0.01)
             # no_op does nothing
 
+        # One block of draws per step keeps the seeded sequence identical to BatchIoTEnv
+        noise = self.rng.random(NOISE_PER_STEP).tolist()
+
         # Simulate load spikes after action
-        self.load_spikes() 
+        self.load_spikes(noise[:-5])
 
         # Natural evolution
-        self.sim_temperature += np.random.uniform(-0.2, 1.5) 
-        self.sim_battery = max(0, self.sim_battery - np.random.uniform(0.3, 1.0))  
-        self.sim_disk_io += np.random.randint(int(1e4), int(1e5))
-        self.sim_error_rate = min(1.0, max(0, self.sim_error_rate + np.random.uniform(-0.01, 0.02)))
-        self.sim_network_usage = max(0, self.sim_network_usage + np.random.randint(-int(1e4), int(5e4)))
+        d_temp, d_battery, d_disk, d_error, d_net = drift_increments(noise[-5:])
+        self.sim_temperature += d_temp
+        self.sim_battery = max(0, self.sim_battery - d_battery)
+        self.sim_disk_io += d_disk
+        self.sim_error_rate = min(1.0, max(0, self.sim_error_rate + d_error))
+        self.sim_network_usage = max(0, self.sim_network_usage + d_net)
 
     def compute_reward(self, state_before, state_after, action=None):
-        """Hybrid reward: combines delta and absolute state penalties/bonuses."""
+        """
+        Hybrid reward: combines delta and absolute state penalties/bonuses. action is the
+        action taken, as its index in self.actions (what apply_action takes) or its name.
+        """
+        if isinstance(action, (int, np.integer)):
+            action = self.actions[action]
         delta_temp = state_after["temperature"] - state_before["temperature"]
         delta_battery = state_after["battery"] - state_before["battery"]
         delta_diskio = state_after["disk_write_bytes"] - state_before["disk_write_bytes"]
@@ -265,12 +323,40 @@ class IoTAgent:
               f"Temp={temp:.1f}, Battery={battery:.1f}, Error={error:.3f} → Reward={reward:.2f}")
         return reward
 
-    def save_q_table(self, path="q_table_iot.npy"):
-        """Save the Q-table to a file."""
-        np.save(path, self.q_table)
+    def q_table_meta(self):
+        """Metadata saved with the Q-table: what its axes mean (checked on load) and its hyperparameters."""
+        return {
+            "agent": type(self).__name__,
+            "shape": list(self.q_table.shape),
+            "metrics": self.metrics,
+            "bins": self.bins,
+            "actions": self.actions,
+            "stresses": [],
+            "hyperparameters": {
+                "learning_rate": self.learning_rate,
+                "discount_factor": self.discount_factor,
+                "exploration_rate": self.exploration_rate,
+                "exploration_decay": self.exploration_decay,
+            },
+        }
 
-    def load_q_table(self, path="q_table_iot.npy"):
-        """Load the Q-table from a file if it exists."""
-        if os.path.exists(path):
-            self.q_table = np.load(path)
-            print("[Q-TABLE] Loaded from file.")
+    def save_q_table(self, path="q_table_iot.qtab", stats=None, dtype=None):
+        """Save the Q-table with its metadata and visit counts, atomically (see common.qtable_store)."""
+        publish_q_table(path, self.q_table, meta=stamp_q_meta(self.q_table_meta(), self.visits, stats),
+                        visits=self.visits, dtype=dtype)
+
+    def follow_q_table(self, path="q_table_iot.qtab"):
+        """Act from the Q-table published at path, mapped read-only and reloaded when it changes."""
+        self.q_reader = QTableReader(path, expect=self.q_table_meta())
+        self.q_table = self.q_reader.table()
+
+    def load_q_table(self, path="q_table_iot.qtab"):
+        """Load the Q-table from a file if it exists and was saved for these bins and actions."""
+        stored = load_agent_q_table(path, self.q_table_meta())
+        if stored is None:
+            print(f"[Q-TABLE] {path} not loaded.")
+            return
+        self.q_table = stored.q_table
+        if stored.visits is not None:
+            self.visits = stored.visits
+        print("[Q-TABLE] Loaded from file.")
@@ -0,0 +1,248 @@
+import time
+import numpy as np
+from agent_iot import IoTAgent, SPIKE_INTENSITIES, NOISE_PER_STEP, spike_increments, drift_increments
+
+# Row order of the state matrix, same as IoTAgent.metrics
+CPU_FREQ, TEMPERATURE, BATTERY, DISK_IO, ERROR_RATE, NETWORK = range(6)
+
+INITIAL_STATE = np.array([2.0, 40.0, 100.0, 1e6, 0.01, 1e4])
+
+# Effect of each action on a metric, applied as clip(value + delta, low, high).
+# Mirrors the branches of IoTAgent.apply_action; missing metrics are left untouched.
+ACTION_EFFECTS = {
+    "set_cpu_powersave": {
+        "cpu_freq": (-0.3, 0.8, np.inf),
+        "temperature": (-2, 20, np.inf),
+        "battery": (0.5, -np.inf, 100),
+    },
+    "set_cpu_ondemand": {
+        "cpu_freq": (0.3, -np.inf, 2.5),
+        "temperature": (2, -np.inf, 80),
+        "battery": (-1, 0, np.inf),
+    },
+    "reduce_writeback_interval": {
+        "disk_write_bytes": (-2e5, 0, np.inf),
+        "battery": (0.2, -np.inf, 100),
+    },
+    "enable_sleep_mode": {},
+    "reduce_screen_brightness": {
+        "battery": (0.7, -np.inf, 100),
+        "temperature": (-0.5, 20, np.inf),
+        "error_rate": (-0.01, 0, np.inf),
+    },
+    "no_op": {},
+}
+
+# Applied instead of the chosen action while a device is in sleep mode
+SLEEP_EFFECTS = {
+    "cpu_freq": (0, 0.8, 0.8),
+    "temperature": (-3, 20, np.inf),
+    "battery": (1, -np.inf, 100),
+    "disk_write_bytes": (-1e5, 0, np.inf),
+    "error_rate": (-0.05, 0, np.inf),
+    "network_usage": (-1e5, 0, np.inf),
+}
+
+class BatchIoTEnv:
+    def __init__(self, num_devices, seed=None):
+        """Simulate num_devices IoT devices at once as a (6, N) struct-of-arrays state."""
+        template = IoTAgent()
+        self.actions = template.actions
+        self.metrics = template.metrics
+        self.bins = template.bins
+        self.encoder = template.encoder
+        self.num_devices = num_devices
+        self.rng = np.random.default_rng(seed)
+
+        self.state = np.tile(INITIAL_STATE[:, None], (1, num_devices))
+        self.sleep_mode_steps = np.zeros(num_devices, dtype=np.int64)
+
+        # Effect tables with one column per action plus a last column for sleep mode
+        effects = [ACTION_EFFECTS[a] for a in self.actions] + [SLEEP_EFFECTS]
+        self.delta = np.zeros((len(self.metrics), len(effects)))
+        self.low = np.full((len(self.metrics), len(effects)), -np.inf)
+        self.high = np.full((len(self.metrics), len(effects)), np.inf)
+        for col, effect in enumerate(effects):
+            for key, (delta, low, high) in effect.items():
+                row = self.metrics.index(key)
+                self.delta[row, col], self.low[row, col], self.high[row, col] = delta, low, high
+        self.sleep_column = len(self.actions)
+
+        self.powersave = self.actions.index("set_cpu_powersave")
+        self.sleep = self.actions.index("enable_sleep_mode")
+
+    def reset(self, mask=None):
+        """Reset all devices, or only those selected by a boolean mask, to the initial state."""
+        if mask is None:
+            mask = np.ones(self.num_devices, dtype=bool)
+        self.state[:, mask] = INITIAL_STATE[:, None]
+        self.sleep_mode_steps[mask] = 0
+        return self.get_state()
+
+    def get_state(self):
+        """Return a copy of the (6, N) state, rows ordered as IoTAgent.metrics."""
+        return self.state.copy()
+
+    def state_dict(self, i):
+        """Return the state of device i as the dict IoTAgent.get_state would produce."""
+        return dict(zip(self.metrics, self.state[:, i].tolist()))
+
+    def state_index(self, states):
+        """Flat Q-table row index of every device for a (6, N) state."""
+        return self.encoder.encode_batch(states.T)
+
+    def sleeping(self):
+        """Boolean mask of devices still in sleep mode (their action is ignored)."""
+        return self.sleep_mode_steps > 0
+
+    def apply_action(self, actions, noise=None):
+        """Apply one action per device, then load spikes and natural drift."""
+        actions = np.asarray(actions)
+        asleep = self.sleeping()
+        self.sleep_mode_steps[asleep] -= 1
+        self.sleep_mode_steps[~asleep & (actions == self.sleep)] = 3
+
+        column = np.where(asleep, self.sleep_column, actions)
+        np.clip(self.state + self.delta[:, column], self.low[:, column], self.high[:, column], out=self.state)
+
+        if noise is None:
+            noise = self.rng.random((self.num_devices, NOISE_PER_STEP))
+        noise = np.ascontiguousarray(noise.T)
+
+        self.load_spikes(noise[:-5])
+
+        s = self.state
+        d_temp, d_battery, d_disk, d_error, d_net = drift_increments(noise[-5:])
+        s[TEMPERATURE] += d_temp
+        np.maximum(0, s[BATTERY] - d_battery, out=s[BATTERY])
+        s[DISK_IO] += d_disk
+        np.clip(s[ERROR_RATE] + d_error, 0, 1.0, out=s[ERROR_RATE])
+        np.maximum(0, s[NETWORK] + d_net, out=s[NETWORK])
+
+    def load_spikes(self, noise):
+        """Apply the three load spike rules as boolean masks. noise has shape (12, N)."""
+        cpu, temp, battery, disk, error, net = self.state
+
+        # Each rule sees the state left by the previous one, as in IoTAgent.load_spikes
+        masks = [
+            lambda: (temp > 42) & (cpu > 1.8) & (net > 400000) & (error < 0.02),
+            lambda: (battery > 95) & (disk < 1e5) & (cpu < 1.3),
+            lambda: (net < 100000) & (38 < temp) & (temp < 45),
+        ]
+        for rule, (condition, intensity) in enumerate(zip(masks, SPIKE_INTENSITIES)):
+            m = condition()
+            if not m.any():
+                continue
+            d_temp, d_disk, d_error, d_net = spike_increments(noise[4 * rule:4 * rule + 4, m], intensity)
+            temp[m] += d_temp
+            disk[m] += d_disk
+            error[m] = np.minimum(1.0, error[m] + d_error)
+            net[m] += d_net
+
+    def compute_reward(self, before, after, actions=None):
+        """Vectorized IoTAgent.compute_reward over (6, N) states. Returns one reward per device."""
+        _, d_temp, d_battery, d_disk, d_error, d_net = after - before
+
+        reward = np.zeros(after.shape[1])
+
+        reward += np.where(d_temp > 1.5, -1.5 * d_temp ** 2, np.where(d_temp < -1.0, 1.2 * np.abs(d_temp), 0))
+        reward += np.where(d_battery < -0.6, -5 * np.abs(d_battery), 2 * d_battery)
+        reward += np.where(d_error > 0.01, -300 * d_error, np.where(d_error < -0.005, 100 * np.abs(d_error), 0))
+
+        big_net = d_net > 20000
+        reward += np.where(big_net & (d_temp < 1) & (d_error < 0.005), 0.002 * d_net,
+                           np.where(big_net, -0.001 * d_net, 0))
+        reward += np.where((d_disk < -100000) & (d_error > 0.005), -0.001 * np.abs(d_disk),
+                           np.where(d_disk < 0, 0.0005 * np.abs(d_disk), 0))
+
+        reward += np.where((d_temp < 0) & (d_battery > 0) & (d_error < 0) & (d_net < 0), 5, 0)
+
+        temp, battery = after[TEMPERATURE], after[BATTERY]
+        reward += np.where(temp > 70, -50, np.where(temp < 45, 10, 0))
+        reward += np.where(battery < 10, -20, np.where(battery > 50, 5, 0))
+        reward += np.where(np.abs(after[DISK_IO]) < 1e5, 2, 0)
+        reward += np.where(after[ERROR_RATE] > 0.2, -10, 0)
+
+        if actions is not None:
+            unneeded = (np.asarray(actions) == self.powersave) & (temp < 40) & (after[CPU_FREQ] < 1.2)
+            reward += np.where(unneeded, -20, 0)
+        return reward
+
+    def done_mask(self, states=None):
+        """Devices whose episode ends: battery too low or error rate too high."""
+        if states is None:
+            states = self.state
+        return (states[BATTERY] < 5) | (states[ERROR_RATE] > 0.8)
+
+    def step(self, actions):
+        """Step every device once. Return (next_states, rewards, dones)."""
+        before = self.get_state()
+        self.apply_action(actions)
+        after = self.get_state()
+        rewards = self.compute_reward(before, after, actions)
+        return after, rewards, self.done_mask(after)
+
+def check_equivalence(num_steps=3000, seed=0):
+    """
+    Step a seeded IoTAgent and a seeded 1-device BatchIoTEnv through the same random
+    actions and check that they go through the same states and rewards. Returns the
+    number of steps compared.
+    """
+    import contextlib
+    import os
+
+    agent = IoTAgent(seed=seed)
+    env = BatchIoTEnv(1, seed=seed)
+    state = agent.reset()
+    env.reset()
+    actions = np.random.default_rng(seed + 1).integers(len(env.actions), size=num_steps)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for step, action_idx in enumerate(actions):
+            agent.apply_action(action_idx)
+            next_state = agent.get_state()
+            reward = agent.compute_reward(state, next_state, action_idx)
+            after, rewards, dones = env.step(np.array([action_idx]))
+            expected = np.array([next_state[metric] for metric in env.metrics])
+            if not np.allclose(after[:, 0], expected) or not np.isclose(rewards[0], reward):
+                raise AssertionError(f"Step {step}: batch state {after[:, 0]} reward {rewards[0]}, "
+                                     f"scalar state {expected} reward {reward}")
+            state = next_state
+            if dones[0]:
+                state = agent.reset()
+                env.reset()
+    return num_steps
+
+def benchmark(num_devices=1024, num_steps=100, scalar_steps=2000):
+    """Compare steps/sec of the train_iot_agent loop body (without sleep) with BatchIoTEnv.step."""
+    import contextlib
+    import os
+
+    agent = IoTAgent(seed=0)
+    state = agent.reset()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for _ in range(scalar_steps):
+            print(f"[STATE] {state}")
+            action_idx = agent.select_action(agent.state_index(state))
+            agent.apply_action(action_idx)
+            next_state = agent.get_state()
+            reward = agent.compute_reward(state, next_state, action_idx)
+            agent.learn(state, action_idx, reward, next_state)
+            state = agent.reset() if next_state["battery"] < 5 or next_state["error_rate"] > 0.8 else next_state
+        scalar_rate = scalar_steps / (time.perf_counter() - start)
+
+    env = BatchIoTEnv(num_devices, seed=0)
+    env.reset()
+    actions = np.random.default_rng(0).integers(len(env.actions), size=(num_steps, num_devices))
+    start = time.perf_counter()
+    for step_actions in actions:
+        _, _, dones = env.step(step_actions)
+        env.reset(dones)
+    batch_rate = num_steps * num_devices / (time.perf_counter() - start)
+
+    print(f"Scalar IoTAgent : {scalar_rate:,.0f} steps/sec")
+    print(f"BatchIoTEnv (N={num_devices}) : {batch_rate:,.0f} steps/sec ({batch_rate / scalar_rate:.0f}x)")
+
+if __name__ == "__main__":
+    print(f"Scalar and batch paths agree over {check_equivalence()} seeded steps")
+    benchmark()
@@ -14,12 +14,13 @@ def moving_average(data, window):
     """Calculate the moving average of a given data array."""
     return np.convolve(data, np.ones(window)/window, mode='valid')
 
-def run_and_get_rewards(agent_main_func, rewards_var_name):
+def run_and_get_rewards(agent_main_func, rewards_var_name, **kwargs):
     """Run the agent's main function and return the rewards."""
     rewards = agent_main_func(
         num_episodes=NUM_EPISODES,
         sleep_interval=SLEEP_INTERVAL,
-        return_rewards=True  
+        return_rewards=True,
+        **kwargs
     )
     return np.array(rewards)
 
@@ -32,7 +33,8 @@ def main():
     print("Running heuristic policy...")
     rewards_heuristic = run_and_get_rewards(heuristic_agent_iot.main, "rewards")
     print("Running RL policy...")
-    rewards_rl = run_and_get_rewards(train_iot_agent.main, "rewards")
+    # A learning curve from scratch, not the continuation of the saved training session
+    rewards_rl = run_and_get_rewards(train_iot_agent.main, "rewards", fresh=True)
 
     plt.figure(figsize=(12, 6))
 #    plt.plot(rewards_random, label=f"Random (mean={np.mean(rewards_random):.1f})")
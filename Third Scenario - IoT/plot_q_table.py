@@ -1,21 +1,27 @@
 import numpy as np
+from agent_iot import IoTAgent
+from common.qtable_store import load_q_file, resolve_q_table_path
 
-QTABLE_PATH = "Third Scenario - IoT/q_table_iot.npy"
+QTABLE_PATH = "Third Scenario - IoT/q_table_iot.qtab"
 
 def main():
-    q_table = np.load(QTABLE_PATH)
+    stored = load_q_file(resolve_q_table_path(QTABLE_PATH), mmap=True)
+    q_table = stored.q_table
     print(f"Forme de la Q-table : {q_table.shape}")
     print(f"Valeur min : {q_table.min():.4f}")
     print(f"Valeur max : {q_table.max():.4f}")
     print(f"Valeur moyenne : {q_table.mean():.4f}")
     print(f"Nombre de cases non nulles : {(q_table != 0).sum()} / {q_table.size}")
+    if "stats" in stored.meta:
+        print(f"Entraînement : {stored.meta['stats']}")
 
     best_actions = np.argmax(q_table, axis=-1)
     unique, counts = np.unique(best_actions, return_counts=True)
     print("\nActions les plus souvent choisies comme optimales :")
     for action, count in zip(unique, counts):
         print(f"  Action {action} : {count} états")
-    actions = ["action_1", "action_2", "action_3"]  # Replace with actual action names
+    # Tables in the former .npy format carry no action names
+    actions = stored.meta.get("actions") or IoTAgent().actions
     print("\nCorrespondance index → action :")
     for idx, name in enumerate(actions):
         print(f"  {idx}: {name}")
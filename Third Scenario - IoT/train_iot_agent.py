@@ -1,49 +1,163 @@
 import time
 import numpy as np
 from agent_iot import IoTAgent
+from common.checkpoint import Checkpointer
+from common.session import Schedule, resume_session
 import matplotlib.pyplot as plt
 import os
+import sys
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
 
-def main(num_episodes=100, sleep_interval=0.1, return_rewards=False):
-    """Train the IoT agent using Q-learning."""
+def run_episode(agent, sleep_interval):
+    """Run one training episode and return its total reward."""
+    state = agent.reset()
+    episode_reward = 0
+
+    for step in range(100): 
+        print(f"[STATE] {state}")
+        action_idx = agent.select_action(agent.state_index(state))
+        agent.apply_action(action_idx)
+        next_state = agent.get_state()
+        reward = agent.compute_reward(state, next_state, action_idx)
+        agent.learn(state, action_idx, reward, next_state)
+        episode_reward += reward
+        state = next_state
+
+        # End episode if battery too low or error rate too high
+        if state["battery"] < 5 or state["error_rate"] > 0.8:
+            print("[INFO] Battery too low or error rate too high, ending episode.")
+            break
+
+        time.sleep(sleep_interval)
+
+    return episode_reward
+
+def train_serial(num_episodes, sleep_interval, q_table_path, fresh=False):
+    """
+    Train a single IoTAgent in this process, checkpointing every episode and the training
+    session in the background. Returns the rewards of the run's episodes.
+    """
     agent = IoTAgent()
-    rewards = []
-    q_table_path = "Third Scenario - IoT/q_table_iot.npy"
+    checkpointer = Checkpointer(agent, q_table_path)
+    session = resume_session(checkpointer, num_episodes, Schedule(1.0, agent.exploration_decay), fresh=fresh)
 
     try:
-        for episode in range(num_episodes):
-            print(f"\n=== Episode {episode + 1} / {num_episodes} ===")
-            state = agent.reset()
-            episode_reward = 0
-
-            for step in range(100): 
-                print(f"[STATE] {state}")
-                state_tuple = agent.normalize_state(state)
-                action_idx = agent.select_action(state_tuple)
-                agent.apply_action(action_idx)
-                next_state = agent.get_state()
-                reward = agent.compute_reward(state, next_state, action_idx)
-                agent.learn(state, action_idx, reward, next_state)
-                episode_reward += reward
-                state = next_state
-
-                # End episode if battery too low or error rate too high
-                if state["battery"] < 5 or state["error_rate"] > 0.8:
-                    print("[INFO] Battery too low or error rate too high, ending episode.")
+        for episode in session.episodes(agent):
+            print(f"\n=== Episode {episode + 1} / {session.target} ===")
+            session.end_episode(run_episode(agent, sleep_interval))
+            checkpointer.checkpoint(session.state())
+
+    except KeyboardInterrupt:
+        print("Training interrupted, Q-table will be saved.")
+
+    checkpointer.close(session.state())
+    return session.run_rewards()
+
+def _parallel_worker(seed, shm_name, shape, next_episode, num_episodes, exploration_rate, learning_rate, results, sleep_interval):
+    """Worker process: run episodes on its own simulator, updating the shared Q-table without locks."""
+    sys.stdout = open(os.devnull, "w")
+    shm = shared_memory.SharedMemory(name=shm_name)
+    agent = IoTAgent(seed=seed)
+    np.random.seed(seed.generate_state(1)[0])  # select_action uses the global NumPy RNG
+    agent.q_table = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    try:
+        while True:
+            with next_episode.get_lock():
+                episode = next_episode.value
+                if episode >= num_episodes:
                     break
+                next_episode.value += 1
+            agent.exploration_rate = exploration_rate.value
+            agent.learning_rate = learning_rate.value
+            results.put((episode, run_episode(agent, sleep_interval)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.q_table = None
+        shm.close()
 
-                time.sleep(sleep_interval)
+def train_parallel(num_episodes, sleep_interval, q_table_path, num_workers, seed=None, fresh=False):
+    """
+    Hogwild-style training: num_workers processes share one Q-table in shared memory.
+    The parent advances the training session (epsilon and learning rate schedules, rewards
+    in completion order) and checkpoints the Q-table after every episode (without visit
+    counts, which stay in the workers).
+    """
+    agent = IoTAgent()
+    agent.visits = None
+    checkpointer = Checkpointer(agent, q_table_path)
+    session = resume_session(checkpointer, num_episodes, Schedule(1.0, agent.exploration_decay), seed=seed, fresh=fresh)
+    session.apply(agent)
+    shm = shared_memory.SharedMemory(create=True, size=agent.q_table.nbytes)
+    q_table = np.ndarray(agent.q_table.shape, dtype=np.float64, buffer=shm.buf)
+    q_table[:] = agent.q_table
+    agent.q_table = q_table
 
-            rewards.append(episode_reward)
-            agent.exploration_rate *= agent.exploration_decay
+    next_episode = mp.Value("i", session.episode)
+    exploration_rate = mp.Value("d", agent.exploration_rate, lock=False)
+    learning_rate = mp.Value("d", agent.learning_rate, lock=False)
+    results = mp.Queue()
+    workers = [
+        mp.Process(
+            target=_parallel_worker,
+            args=(worker_seed, shm.name, q_table.shape, next_episode, session.target, exploration_rate, learning_rate,
+                  results, sleep_interval),
+            daemon=True,
+        )
+        for worker_seed in np.random.SeedSequence(session.seed).spawn(num_workers)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        while session.episode < session.target:
+            try:
+                episode, episode_reward = results.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    raise RuntimeError("All training workers exited before the last episode.")
+                continue
+            session.end_episode(episode_reward)
+            session.apply(agent)
+            exploration_rate.value = agent.exploration_rate
+            learning_rate.value = agent.learning_rate
+            print(f"=== Episode {session.episode} / {session.target} (#{episode + 1}) | reward: {episode_reward:.2f} | epsilon: {exploration_rate.value:.3f} ===")
+            checkpointer.checkpoint(session.state())
 
-            # Save periodically
-            if (episode + 1) % 10 == 0:
-                agent.save_q_table(q_table_path)
+        for worker in workers:
+            worker.join()
 
     except KeyboardInterrupt:
         print("Training interrupted, Q-table will be saved.")
-        agent.save_q_table(q_table_path)
+
+    finally:
+        # Also on errors: stop the workers, save the table (read from shared memory, so
+        # before unlinking it) and release the shared memory
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        try:
+            checkpointer.close(session.state())
+        finally:
+            agent.q_table = None
+            del q_table
+            shm.close()
+            shm.unlink()
+    return session.run_rewards()
+
+def main(num_episodes=100, sleep_interval=0.1, return_rewards=False, num_workers=1, fresh=False):
+    """
+    Train the IoT agent using Q-learning, on num_workers processes if greater than 1.
+    Training continues the saved session (see common.session) unless fresh.
+    """
+    q_table_path = "Third Scenario - IoT/q_table_iot.qtab"
+
+    if num_workers > 1:
+        rewards = train_parallel(num_episodes, sleep_interval, q_table_path, num_workers, fresh=fresh)
+    else:
+        rewards = train_serial(num_episodes, sleep_interval, q_table_path, fresh=fresh)
 
     if return_rewards:
         return rewards
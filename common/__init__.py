@@ -0,0 +1 @@
+"""Code shared by the Desktop, Server and IoT scenarios."""
@@ -0,0 +1,293 @@
+import copy
+import json
+import os
+import queue
+import random
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from common.q_learning import flat_q_view
+from common.qtable_store import load_agent_q_table, publish_q_table, stamp_q_meta
+
+# Delta record: header, training state patch and RNG states (JSON), changed row indices (<i8), their Q-values
+# (<f8) and visit counts (<u4, if FLAG_VISITS), then the CRC32 of everything before it.
+RECORD_HEADER = struct.Struct("<4sIIIII")  # magic, seq, flags, rows, row width, state bytes
+RECORD_MAGIC = b"QDLT"
+FLAG_VISITS = 1
+
+def rng_state(agent=None):
+    """State of the Python and NumPy global RNGs (and of agent.rng, a Generator, if any) as JSON types."""
+    name, keys, pos, has_gauss, cached = np.random.get_state()
+    version, internal, gauss = random.getstate()
+    state = {
+        "numpy": [name, keys.tolist(), pos, has_gauss, cached],
+        "python": [version, list(internal), gauss],
+    }
+    if isinstance(getattr(agent, "rng", None), np.random.Generator):
+        state["agent"] = agent.rng.bit_generator.state
+    return state
+
+def set_rng_state(state, agent=None):
+    """Restore the RNGs from rng_state()."""
+    name, keys, pos, has_gauss, cached = state["numpy"]
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached))
+    version, internal, gauss = state["python"]
+    random.setstate((version, tuple(internal), gauss))
+    if "agent" in state and isinstance(getattr(agent, "rng", None), np.random.Generator):
+        agent.rng.bit_generator.state = state["agent"]
+
+def state_patch(old, new):
+    """
+    Changes from the JSON-like dict old to new: lists new only appended to (episode
+    rewards) give just the appended items, nested dicts are patched recursively, other
+    changed values are given whole. Applied by apply_state_patch.
+    """
+    patch = {}
+    for key, value in new.items():
+        if key not in old:
+            patch.setdefault("set", {})[key] = value
+            continue
+        previous = old[key]
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = state_patch(previous, value)
+            if nested:
+                patch.setdefault("dicts", {})[key] = nested
+        elif (isinstance(value, list) and isinstance(previous, list) and len(value) >= len(previous)
+              and value[:len(previous)] == previous):
+            if len(value) > len(previous):
+                patch.setdefault("extend", {})[key] = value[len(previous):]
+        elif value != previous:
+            patch.setdefault("set", {})[key] = value
+    removed = [key for key in old if key not in new]
+    if removed:
+        patch["unset"] = removed
+    return patch
+
+def apply_state_patch(state, patch):
+    """Apply a state_patch() to state in place and return it."""
+    state.update(patch.get("set", {}))
+    for key, items in patch.get("extend", {}).items():
+        state[key].extend(items)
+    for key, nested in patch.get("dicts", {}).items():
+        apply_state_patch(state[key], nested)
+    for key in patch.get("unset", []):
+        state.pop(key, None)
+    return state
+
+def delta_path(path):
+    return os.path.splitext(path)[0] + ".deltas"
+
+def read_records(path, width):
+    """
+    Yield (seq, end offset, state, rows, q_rows, visit_rows) of every complete record of a
+    delta log. Reading stops at the first truncated or corrupt record (a crash mid-write).
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        magic, seq, flags, n, row_width, state_len = RECORD_HEADER.unpack_from(data, offset)
+        if magic != RECORD_MAGIC or row_width != width:
+            return
+        sizes = [state_len, 8 * n, 8 * n * width, 4 * n * width if flags & FLAG_VISITS else 0]
+        end = offset + RECORD_HEADER.size + sum(sizes)
+        if end + 4 > len(data) or zlib.crc32(data[offset:end]) != int.from_bytes(data[end:end + 4], "little"):
+            return
+        pos = offset + RECORD_HEADER.size
+        state = json.loads(data[pos:pos + state_len])
+        pos += state_len
+        rows = np.frombuffer(data, dtype="<i8", count=n, offset=pos)
+        pos += sizes[1]
+        q_rows = np.frombuffer(data, dtype="<f8", count=n * width, offset=pos).reshape(n, width)
+        pos += sizes[2]
+        visit_rows = None
+        if flags & FLAG_VISITS:
+            visit_rows = np.frombuffer(data, dtype="<u4", count=n * width, offset=pos).reshape(n, width)
+        offset = end + 4
+        yield seq, offset, state, rows, q_rows, visit_rows
+
+class Checkpointer:
+    def __init__(self, agent, path, compact_every=10):
+        """
+        Incremental checkpoints of agent's Q-table (and visit counts) written by a background
+        thread. checkpoint() finds the rows changed since the previous checkpoint by
+        comparing with a shadow copy and appends only those, with what changed in the
+        training state since the previous checkpoint (state_patch: new episode rewards, not
+        the whole list) and the RNG states, to the delta log next to path. Every
+        compact_every checkpoints, or once the log outgrows the table, the full table and
+        the full state are published to path (common.qtable_store) and the log is emptied.
+        restore() resumes from the last checkpoint that reached the disk.
+        """
+        self.agent = agent
+        self.path = path
+        self.delta_path = delta_path(path)
+        self.compact_every = compact_every
+        self.seq = 0
+        self.shadow = None
+        self.shadow_visits = None
+        self._since_compaction = None
+        self._log_bytes = 0
+        # State of the previous checkpoint, which the next delta record patches
+        self._last_state = None
+        self.error = None
+        self.counters = {"checkpoints": 0, "compactions": 0, "rows": 0, "bytes": 0, "write_time": 0.0}
+        # Bounded: checkpoint() blocks if the disk falls more than 2 checkpoints behind
+        self._queue = queue.Queue(maxsize=2)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _visits(self):
+        return getattr(self.agent, "visits", None)
+
+    def restore(self):
+        """
+        Load the last checkpoint into the agent: the published table, then the delta records
+        written after it. Restore the RNG states and return the training state saved with it,
+        or None if there is no checkpoint.
+        """
+        stored = load_agent_q_table(self.path, self.agent.q_table_meta())
+        checkpoint = {"seq": 0, "state": None, "rng": None}
+        if stored is not None:
+            self.agent.q_table = stored.q_table
+            if stored.visits is not None and self._visits() is not None:
+                self.agent.visits = stored.visits
+            checkpoint = stored.meta.get("checkpoint", checkpoint)
+        q = flat_q_view(self.agent.q_table)
+        visits = self._visits()
+        valid_end = 0
+        for seq, end, state, rows, q_rows, visit_rows in read_records(self.delta_path, q.shape[1]):
+            valid_end = end
+            if seq <= checkpoint["seq"]:
+                continue
+            q[rows] = q_rows
+            if visit_rows is not None and visits is not None:
+                flat_q_view(visits)[rows] = visit_rows
+            if "patch" in state:
+                saved = apply_state_patch(copy.deepcopy(checkpoint["state"]) or {}, state["patch"])
+            else:
+                # Records written before state patches carry the whole state
+                saved = state["state"]
+            checkpoint = {"seq": seq, "state": saved, "rng": state["rng"]}
+        if os.path.exists(self.delta_path) and os.path.getsize(self.delta_path) > valid_end:
+            print(f"Dropping {os.path.getsize(self.delta_path) - valid_end} bytes of incomplete checkpoint in {self.delta_path}.")
+            os.truncate(self.delta_path, valid_end)
+        self.seq = checkpoint["seq"]
+        if checkpoint["rng"] is not None:
+            set_rng_state(checkpoint["rng"], self.agent)
+        return checkpoint["state"]
+
+    def checkpoint(self, state):
+        """
+        Queue a checkpoint of the agent with state (a JSON-serializable dict). Only the
+        row diff is computed here; the write happens in the background. Return the number of
+        rows written (all of them for a compaction).
+        """
+        self._raise_error()
+        q = flat_q_view(self.agent.q_table)
+        visits = self._visits()
+        self.seq += 1
+        self.counters["checkpoints"] += 1
+        rng = rng_state(self.agent)
+        compact = (
+            self.shadow is None
+            or self._since_compaction >= self.compact_every - 1
+            or self._log_bytes >= q.nbytes
+        )
+        if compact:
+            self.shadow = q.copy()
+            self.shadow_visits = None if visits is None else flat_q_view(visits).copy()
+            self._since_compaction = 0
+            self._log_bytes = 0
+            self._last_state = copy.deepcopy(state)
+            self._queue.put(("compact", self.seq, {"state": self._last_state, "rng": rng}, self.shadow.copy(),
+                             None if visits is None else self.shadow_visits.copy()))
+            return len(q)
+        dirty = np.any(q != self.shadow, axis=1)
+        if visits is not None:
+            dirty |= np.any(flat_q_view(visits) != self.shadow_visits, axis=1)
+        rows = np.flatnonzero(dirty)
+        q_rows = q[rows]
+        self.shadow[rows] = q_rows
+        visit_rows = None
+        if visits is not None:
+            visit_rows = flat_q_view(visits)[rows]
+            self.shadow_visits[rows] = visit_rows
+        # Serialized here so that its size counts towards compaction
+        # (default: NumPy scalars (rewards) as Python numbers)
+        record_state = json.dumps({"patch": state_patch(self._last_state, state), "rng": rng},
+                                  default=lambda value: value.item()).encode()
+        self._last_state = copy.deepcopy(state)
+        self._since_compaction += 1
+        self._log_bytes += (len(record_state) + rows.size * 8 + q_rows.nbytes
+                            + (0 if visit_rows is None else visit_rows.nbytes))
+        self._queue.put(("delta", self.seq, record_state, rows, q_rows, visit_rows))
+        return len(rows)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            started = time.monotonic()
+            try:
+                if task[0] == "compact":
+                    self._compact(*task[1:])
+                else:
+                    self._append(*task[1:])
+            except Exception as e:
+                self.error = e
+            self.counters["write_time"] += time.monotonic() - started
+
+    def _append(self, seq, state, rows, q_rows, visit_rows):
+        parts = [
+            RECORD_HEADER.pack(RECORD_MAGIC, seq, FLAG_VISITS if visit_rows is not None else 0,
+                               len(rows), q_rows.shape[1], len(state)),
+            state,
+            np.ascontiguousarray(rows, dtype="<i8").tobytes(),
+            np.ascontiguousarray(q_rows, dtype="<f8").tobytes(),
+        ]
+        if visit_rows is not None:
+            parts.append(np.ascontiguousarray(visit_rows, dtype="<u4").tobytes())
+        record = b"".join(parts)
+        record += zlib.crc32(record).to_bytes(4, "little")
+        with open(self.delta_path, "ab") as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        self.counters["rows"] += len(rows)
+        self.counters["bytes"] += len(record)
+
+    def _compact(self, seq, record_state, q_rows, visit_rows):
+        shape = self.agent.q_table.shape
+        meta = stamp_q_meta(self.agent.q_table_meta(), visit_rows, record_state["state"])
+        meta["checkpoint"] = {"seq": seq, **record_state}
+        publish_q_table(self.path, q_rows.reshape(shape), meta=meta,
+                        visits=None if visit_rows is None else visit_rows.reshape(shape))
+        # Every record is now older than the snapshot
+        with open(self.delta_path, "wb") as f:
+            os.fsync(f.fileno())
+        self.counters["compactions"] += 1
+        self.counters["rows"] += len(q_rows)
+        self.counters["bytes"] += os.path.getsize(self.path)
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f"Checkpoint to {self.path} failed: {error}") from error
+
+    def close(self, state=None):
+        """Write a last full checkpoint with state (if given), wait for pending writes and stop."""
+        if state is not None:
+            self.shadow = None
+            self.checkpoint(state)
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def stats(self):
+        """Checkpoints taken, compactions, rows and bytes written, seconds spent writing."""
+        return dict(self.counters)
@@ -0,0 +1,121 @@
+import time
+
+# ProcSample fields that only ever grow (until they wrap or the source is reset).
+# They carry no information as raw values and are turned into per-second rates.
+CUMULATIVE_FIELDS = (
+    "ctx_switches",
+    "interrupts",
+    "soft_interrupts",
+    "page_faults",
+    "major_faults",
+    "pages_in",
+    "pages_out",
+    "swap_in",
+    "swap_out",
+    "net_sent",
+    "net_recv",
+    "psi_cpu_some_total",
+    "psi_io_some_total",
+    "psi_memory_some_total",
+)
+
+def counter_delta(previous, current):
+    """
+    Increase of a kernel counter between two readings, handling wraparound.
+    Counters below 2**32 are assumed to be 32-bit (e.g. net/dev on 32-bit kernels),
+    larger ones 64-bit. A wrapped delta larger than half the counter range means the
+    counter was reset (e.g. an interface came back up), and counts from 0.
+    """
+    if current >= previous:
+        return current - previous
+    modulus = 2 ** 32 if previous < 2 ** 32 else 2 ** 64
+    delta = current + modulus - previous
+    return delta if delta < modulus // 2 else current
+
+def cpu_percentages(before, after):
+    """
+    Return (cpu usage %, iowait %) between two ProcSamples: the share of CPU time spent
+    busy (as psutil.cpu_percent) and waiting for I/O (as the "wa" column of vmstat).
+    """
+    d_total = after.cpu_total - before.cpu_total
+    if d_total <= 0:
+        return 0.0, 0.0
+    cpu_usage = 100 * (after.cpu_busy - before.cpu_busy) / d_total
+    io_wait = 100 * (after.cpu_iowait - before.cpu_iowait) / d_total
+    return round(cpu_usage, 1), round(io_wait, 1)
+
+def counter_rates(before, after, fields=CUMULATIVE_FIELDS):
+    """Per-second rate of each cumulative field between two ProcSamples, as a dict."""
+    elapsed = after.time - before.time
+    if elapsed <= 0:
+        return {field: 0.0 for field in fields}
+    return {
+        field: counter_delta(getattr(before, field), getattr(after, field)) / elapsed
+        for field in fields
+    }
+
+class CounterRates:
+    def __init__(self, collector, fields=CUMULATIVE_FIELDS):
+        """
+        Turn the cumulative counters of a ProcCollector into per-second rates over the
+        time between two update() calls (the sampling window of the caller).
+        """
+        self.collector = collector
+        self.fields = fields
+        self.previous = collector.sample()
+
+    def update(self):
+        """
+        Take a new sample and return (sample, rates). rates holds one per-second rate per
+        cumulative field plus cpu_usage and io_wait in % of CPU time since the last update.
+        """
+        sample = self.collector.sample()
+        rates = counter_rates(self.previous, sample, self.fields)
+        rates["cpu_usage"], rates["io_wait"] = cpu_percentages(self.previous, sample)
+        self.previous = sample
+        return sample, rates
+
+def disk_rates(before, after, elapsed):
+    """
+    iostat -x style rates of every device present in two DiskStats.read() results taken
+    elapsed seconds apart: {device: {reads_per_s, writes_per_s, read_kb_per_s,
+    write_kb_per_s, await_ms, queue_depth, util}}. queue_depth is the average number of
+    requests in flight (aqu-sz), await_ms the mean time per completed request and util the
+    % of time the device was busy.
+    """
+    rates = {}
+    if elapsed <= 0:
+        return rates
+    for device, current in after.items():
+        previous = before.get(device)
+        if previous is None:
+            continue
+        reads = counter_delta(previous.reads, current.reads)
+        writes = counter_delta(previous.writes, current.writes)
+        wait_ms = counter_delta(previous.read_ms, current.read_ms) + counter_delta(previous.write_ms, current.write_ms)
+        rates[device] = {
+            "reads_per_s": reads / elapsed,
+            "writes_per_s": writes / elapsed,
+            # Sectors are 512 bytes whatever the device's block size
+            "read_kb_per_s": counter_delta(previous.read_sectors, current.read_sectors) / 2 / elapsed,
+            "write_kb_per_s": counter_delta(previous.write_sectors, current.write_sectors) / 2 / elapsed,
+            "await_ms": wait_ms / (reads + writes) if reads + writes else 0.0,
+            "queue_depth": counter_delta(previous.weighted_io_ms, current.weighted_io_ms) / (1000 * elapsed),
+            "util": min(100.0, counter_delta(previous.io_ms, current.io_ms) / (10 * elapsed)),
+        }
+    return rates
+
+class DiskRates:
+    def __init__(self, disk_stats):
+        """Per-device rates of a DiskStats over the time between two update() calls."""
+        self.disk_stats = disk_stats
+        self.previous_time = time.monotonic()
+        self.previous = disk_stats.read()
+
+    def update(self):
+        """Return {device: rates} (see disk_rates) since the last update."""
+        now = time.monotonic()
+        current = self.disk_stats.read()
+        rates = disk_rates(self.previous, current, now - self.previous_time)
+        self.previous, self.previous_time = current, now
+        return rates
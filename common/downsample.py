@@ -0,0 +1,41 @@
+import numpy as np
+
+def lttb(x, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of the series ys (k, n) sharing x (n,).
+    Return the (k, threshold) indices of the points kept for each series: the first and
+    last points, then in each of threshold - 2 buckets the point forming the largest
+    triangle with the point kept before it and the mean of the next bucket, so peaks
+    survive. All k series are processed together, one NumPy pass per bucket. Below
+    2 * threshold points (not worth reducing, and buckets could be empty) every index is
+    kept. NaN counts as 0 when choosing points.
+    """
+    ys = np.atleast_2d(ys)
+    k, n = ys.shape
+    if 2 * threshold > n or threshold < 3:
+        return np.tile(np.arange(n), (k, 1))
+    x = np.asarray(x, dtype=np.float64)
+    values = np.nan_to_num(ys.astype(np.float64, copy=False))
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    rows = np.arange(k)
+    # Mean point of every bucket, and of the last point standing for the bucket after the last
+    counts = np.diff(np.append(edges, n - 1))
+    counts[-1] = 1
+    bounds = np.append(edges[:-1], n - 1)
+    mean_x = np.add.reduceat(x, bounds) / counts
+    mean_y = np.add.reduceat(values, bounds, axis=1) / counts
+    kept = np.empty((k, threshold), dtype=np.int64)
+    kept[:, 0] = 0
+    kept[:, -1] = n - 1
+    previous = np.zeros(k, dtype=np.int64)
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        px = x[previous]
+        py = values[rows, previous]
+        area = np.abs(
+            (px - mean_x[bucket + 1])[:, None] * (values[:, start:end] - py[:, None])
+            - (px[:, None] - x[None, start:end]) * (mean_y[:, bucket + 1] - py)[:, None]
+        )
+        previous = start + area.argmax(axis=1)
+        kept[:, bucket + 1] = previous
+    return kept
@@ -0,0 +1,98 @@
+import heapq
+import numpy as np
+from common.q_learning import flat_q_view
+
+class DynaPlanner:
+    def __init__(self, agent, planning_steps=20, batch_size=8, theta=1e-3, seed=None):
+        """
+        Dyna-Q with prioritized sweeping for a tabular agent (anything with q_table,
+        discount_factor and learn_batch). Real transitions, given as flat Q-table rows,
+        feed a learned model: visit counts of every next state and the mean reward of each
+        (state, action). plan() then replays the (state, action) pairs whose value is the
+        most out of date, in batches through agent.learn_batch, and queues the predecessors
+        of every state whose value changed. Pairs whose priority (|TD error|) is below theta
+        are not queued.
+        """
+        self.agent = agent
+        self.planning_steps = planning_steps
+        self.batch_size = batch_size
+        self.theta = theta
+        self.rng = np.random.default_rng(seed)
+        # (state, action) -> [visits, reward sum, {next_state: visits}]
+        self.model = {}
+        # next_state -> {(state, action)} that led to it
+        self.predecessors = {}
+        # Max-heap of (-priority, state, action); stale entries are skipped when popped
+        self.queue = []
+        self.priority = {}
+        self.counters = {"real": 0, "planned": 0}
+
+    def observe(self, state, action, reward, next_state):
+        """Add a real transition to the model and queue its pair by its remaining TD error."""
+        entry = self.model.setdefault((state, action), [0, 0.0, {}])
+        entry[0] += 1
+        entry[1] += reward
+        entry[2][next_state] = entry[2].get(next_state, 0) + 1
+        self.predecessors.setdefault(next_state, set()).add((state, action))
+        self.counters["real"] += 1
+        self._push(state, action, self._td_error(state, action, entry[1] / entry[0], next_state))
+
+    def _td_error(self, state, action, reward, next_state):
+        q = flat_q_view(self.agent.q_table)
+        return abs(reward + self.agent.discount_factor * q[next_state].max() - q[state, action])
+
+    def _push(self, state, action, priority):
+        if priority <= self.theta or priority <= self.priority.get((state, action), 0.0):
+            return
+        self.priority[(state, action)] = priority
+        heapq.heappush(self.queue, (-priority, state, action))
+
+    def _pop(self, n):
+        """Up to n distinct pairs of highest priority."""
+        pairs = []
+        while self.queue and len(pairs) < n:
+            priority, state, action = heapq.heappop(self.queue)
+            if self.priority.get((state, action)) != -priority:
+                continue
+            del self.priority[(state, action)]
+            pairs.append((state, action))
+        return pairs
+
+    def _sample(self, state, action):
+        """A next state drawn from the model's visit counts, and the mean reward."""
+        visits, reward_sum, next_states = self.model[(state, action)]
+        choices = list(next_states)
+        if len(choices) == 1:
+            return choices[0], reward_sum / visits
+        counts = np.fromiter(next_states.values(), dtype=np.float64, count=len(choices))
+        return choices[self.rng.choice(len(choices), p=counts / visits)], reward_sum / visits
+
+    def plan(self, n=None):
+        """
+        Run up to n (default: planning_steps) simulated updates, highest priority first.
+        Return the number of updates made (fewer if the queue runs dry).
+        """
+        n = self.planning_steps if n is None else n
+        done = 0
+        while done < n:
+            pairs = self._pop(min(self.batch_size, n - done))
+            if not pairs:
+                break
+            states = np.fromiter((s for s, _ in pairs), dtype=np.intp, count=len(pairs))
+            actions = np.fromiter((a for _, a in pairs), dtype=np.intp, count=len(pairs))
+            samples = [self._sample(s, a) for s, a in pairs]
+            next_states = np.fromiter((s for s, _ in samples), dtype=np.intp, count=len(pairs))
+            rewards = np.fromiter((r for _, r in samples), dtype=np.float64, count=len(pairs))
+            self.agent.learn_batch(states, actions, rewards, next_states)
+            done += len(pairs)
+            for state in set(states.tolist()):
+                for pred_state, pred_action in self.predecessors.get(state, ()):
+                    visits, reward_sum, _ = self.model[(pred_state, pred_action)]
+                    self._push(pred_state, pred_action,
+                               self._td_error(pred_state, pred_action, reward_sum / visits, state))
+        self.counters["planned"] += done
+        return done
+
+    def stats(self):
+        """Real transitions observed, simulated updates made, and model / queue sizes."""
+        return dict(self.counters, pairs=len(self.model), queued=len(self.priority))
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+
+class EventQueue:
+    def __init__(self, maxsize=16):
+        """
+        Bounded FIFO of events waiting to be handled. An event whose type is already waiting
+        is coalesced into it (its context is replaced by the newest one) instead of being
+        queued twice. When maxsize distinct events are waiting, new ones are dropped.
+        """
+        self.maxsize = maxsize
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self.counters = {"posted": 0, "coalesced": 0, "dropped": 0}
+
+    def put(self, event_type, context=None):
+        """Queue an event. Return False if it was coalesced or dropped."""
+        with self._lock:
+            self.counters["posted"] += 1
+            if event_type in self._pending:
+                posted_at, _, merged = self._pending[event_type]
+                self._pending[event_type] = (posted_at, context, merged + 1)
+                self.counters["coalesced"] += 1
+                return False
+            if len(self._pending) >= self.maxsize:
+                self.counters["dropped"] += 1
+                return False
+            self._pending[event_type] = (time.monotonic(), context, 1)
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Return the oldest (event_type, context, posted_at, merged) event, or None after timeout.
+        merged is the number of posts coalesced into it.
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._pending, timeout):
+                return None
+            event_type, (posted_at, context, merged) = self._pending.popitem(last=False)
+            return event_type, context, posted_at, merged
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+class EventWorker:
+    def __init__(self, queue, handler):
+        """
+        Handle the events of queue one at a time in a dedicated thread, calling
+        handler(event_type, context=context). Keeps per-event-type latency counters.
+        """
+        self.queue = queue
+        self.handler = handler
+        self.running = False
+        self.thread = None
+        self._lock = threading.Lock()
+        # event_type -> [handled, total queue wait, max queue wait, total handling, max handling]
+        self.latency = {}
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop after the event being handled, if any."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        while self.running:
+            event = self.queue.get(timeout=0.5)
+            if event is None:
+                continue
+            event_type, context, posted_at, _ = event
+            started = time.monotonic()
+            try:
+                self.handler(event_type, context=context)
+            except Exception as e:
+                print(f"Error handling event {event_type}: {e}")
+            self._record(event_type, started - posted_at, time.monotonic() - started)
+
+    def _record(self, event_type, waited, handled):
+        with self._lock:
+            counts = self.latency.setdefault(event_type, [0, 0.0, 0.0, 0.0, 0.0])
+            counts[0] += 1
+            counts[1] += waited
+            counts[2] = max(counts[2], waited)
+            counts[3] += handled
+            counts[4] = max(counts[4], handled)
+
+    def stats(self):
+        """
+        Return {event_type: {handled, mean/max queue wait, mean/max handling time in s}}
+        plus the queue counters under "queue".
+        """
+        with self._lock:
+            stats = {
+                event_type: {
+                    "handled": n,
+                    "mean_wait": wait / n,
+                    "max_wait": max_wait,
+                    "mean_handling": handling / n,
+                    "max_handling": max_handling,
+                }
+                for event_type, (n, wait, max_wait, handling, max_handling) in self.latency.items()
+            }
+        stats["queue"] = dict(self.queue.counters, pending=len(self.queue))
+        return stats
@@ -0,0 +1,103 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class TaskRunner:
+    def __init__(self, root, workers=4, poll_ms=20, budget=0.02):
+        """
+        Run blocking work (actions, agent reactions) off the Tk main thread. Tasks run on
+        a pool of worker threads; their results, and callbacks posted by other threads with
+        call_soon(), go through a thread-safe queue drained on the Tk thread by root.after
+        every poll_ms. A drain runs callbacks for at most budget seconds, leaving the rest
+        for the next one, so the event loop keeps a short frame time under load.
+        """
+        self.root = root
+        self.poll_ms = poll_ms
+        self.budget = budget
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gui-task")
+        self.callbacks = queue.SimpleQueue()
+        self.running = True
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._due = None
+        self.counters = {"tasks": 0, "failed": 0, "callbacks": 0, "task_time": 0.0, "max_task": 0.0,
+                         "max_drain": 0.0, "max_lag": 0.0}
+        self._schedule()
+
+    def submit(self, work, *args, on_done=None, on_error=None):
+        """
+        Run work(*args) on a worker. on_done(result), or on_error(exception) if it raised,
+        is then called on the Tk thread. Errors without on_error are printed.
+        """
+        with self._lock:
+            self._pending += 1
+            self.counters["tasks"] += 1
+        return self.pool.submit(self._run, work, args, on_done, on_error)
+
+    def _run(self, work, args, on_done, on_error):
+        started = time.monotonic()
+        error = None
+        try:
+            result = work(*args)
+        except Exception as e:
+            error = e
+        elapsed = time.monotonic() - started
+        # Counted done before its callback runs, so the callback sees pending() without it
+        with self._lock:
+            self._pending -= 1
+            self.counters["failed"] += error is not None
+            self.counters["task_time"] += elapsed
+            self.counters["max_task"] = max(self.counters["max_task"], elapsed)
+        if error is None:
+            if on_done is not None:
+                self.call_soon(on_done, result)
+        elif on_error is not None:
+            self.call_soon(on_error, error)
+        else:
+            print(f"Error in GUI task {getattr(work, '__name__', work)}: {error}")
+
+    def call_soon(self, callback, *args):
+        """Call callback(*args) on the Tk thread at the next drain; safe from any thread."""
+        self.callbacks.put((callback, args))
+
+    def pending(self):
+        """Number of tasks queued or running on the workers."""
+        with self._lock:
+            return self._pending
+
+    def _schedule(self):
+        self._due = time.monotonic() + self.poll_ms / 1000
+        self.root.after(self.poll_ms, self._drain)
+
+    def _drain(self):
+        if not self.running:
+            return
+        started = time.monotonic()
+        # How late the event loop ran this drain: the time it spent on something else
+        self.counters["max_lag"] = max(self.counters["max_lag"], started - self._due)
+        while time.monotonic() - started < self.budget:
+            try:
+                callback, args = self.callbacks.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in GUI callback {getattr(callback, '__name__', callback)}: {e}")
+            self.counters["callbacks"] += 1
+        self.counters["max_drain"] = max(self.counters["max_drain"], time.monotonic() - started)
+        self._schedule()
+
+    def stats(self):
+        """Tasks run and failed, mean/max task time, callbacks run, max drain time and event loop lag (s)."""
+        with self._lock:
+            stats = dict(self.counters, pending=self._pending)
+        done = stats["tasks"] - stats["pending"]
+        stats["mean_task"] = stats.pop("task_time") / done if done else 0.0
+        return stats
+
+    def shutdown(self, wait=False):
+        """Stop draining and discard tasks not started yet; running ones finish in the background unless wait."""
+        self.running = False
+        self.pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,97 @@
+import csv
+import os
+import numpy as np
+
+class MetricHistory:
+    def __init__(self, fields, capacity=21600, spill_path=None, spill_block=1024):
+        """
+        Fixed-capacity history of numeric metrics, one preallocated float64 ring per field
+        (None is stored as NaN). Each sample is written twice, at i and i + capacity, so the
+        last capacity samples are always one contiguous slice: column() and view() return
+        views, never copies, and memory does not grow with uptime. With spill_path, samples
+        about to be overwritten are first appended to that file spill_block at a time
+        (little-endian float64 rows of every field), and history() / write_csv() read them
+        back through a memory map.
+        """
+        self.fields = list(fields)
+        self.index = {field: i for i, field in enumerate(self.fields)}
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.spill_block = min(spill_block, capacity)
+        self.buffer = np.full((len(self.fields), 2 * capacity), np.nan)
+        self.clear()
+
+    def clear(self):
+        """Forget every sample, including the spilled ones."""
+        self.total = 0
+        self.spilled = 0
+        self.buffer.fill(np.nan)
+        if self.spill_path is not None:
+            open(self.spill_path, "wb").close()
+
+    def append(self, sample):
+        """Add a sample: a dict of field values (missing or None fields are NaN)."""
+        if self.total - self.capacity >= self.spilled:
+            self._spill()
+        values = np.array([np.nan if sample.get(field) is None else sample[field] for field in self.fields])
+        pos = self.total % self.capacity
+        self.buffer[:, pos] = values
+        self.buffer[:, pos + self.capacity] = values
+        self.total += 1
+
+    def _spill(self):
+        """Write the oldest spill_block samples still in memory to the spill file."""
+        if self.spill_path is None:
+            self.spilled = self.total - self.capacity + self.spill_block
+            return
+        start = self.spilled % self.capacity
+        block = self.buffer[:, start:start + self.spill_block]
+        with open(self.spill_path, "ab") as f:
+            f.write(np.ascontiguousarray(block.T, dtype="<f8").tobytes())
+        self.spilled += self.spill_block
+
+    def __len__(self):
+        """Number of samples in memory."""
+        return min(self.total, self.capacity)
+
+    def view(self):
+        """(fields, len(self)) view of the samples in memory, oldest first."""
+        end = self.total % self.capacity + (self.capacity if self.total >= self.capacity else 0)
+        return self.buffer[:, end - len(self):end]
+
+    def column(self, field):
+        """View of one field over the samples in memory."""
+        return self.view()[self.index[field]]
+
+    def spilled_rows(self):
+        """
+        (n, fields) read-only map of the samples older than those in memory, or None.
+        Rows spilled but still in memory are excluded.
+        """
+        n = self.total - len(self)
+        if self.spill_path is None or n == 0:
+            return None
+        return np.memmap(self.spill_path, dtype="<f8", mode="r", shape=(n, len(self.fields)))
+
+    def history(self, field):
+        """Every recorded value of field (spilled ones included, as a copy)."""
+        older = self.spilled_rows()
+        if older is None:
+            return self.column(field)
+        return np.concatenate([older[:, self.index[field]], self.column(field)])
+
+    def write_csv(self, f, chunk=4096):
+        """Write the header and every recorded sample to the text file f, NaN as an empty cell."""
+        writer = csv.writer(f)
+        writer.writerow(self.fields)
+        older = self.spilled_rows()
+        parts = ([] if older is None else [older]) + [self.view().T]
+        for rows in parts:
+            for start in range(0, len(rows), chunk):
+                for row in rows[start:start + chunk].tolist():
+                    writer.writerow(["" if value != value else value for value in row])
+
+    def close(self, remove=True):
+        """Delete the spill file (unless not remove)."""
+        if remove and self.spill_path is not None and os.path.exists(self.spill_path):
+            os.unlink(self.spill_path)
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import deque, namedtuple
+from common.procfs import ProcCollector, disk_usage
+from common.counters import counter_rates, cpu_percentages
+
+# Immutable view of the system published by MetricSampler. Keys match EventAgent.state.
+MetricSnapshot = namedtuple("MetricSnapshot", [
+    "time",
+    "cpu_usage",
+    "memory_usage",
+    "swap_usage",
+    "load_average",
+    "disk_usage",
+    "temperature",
+    "io_wait",
+])
+
+class MetricSampler:
+    def __init__(self, period=0.1, window=1.0, history=None):
+        """
+        Sample system metrics in a background thread, read through a ProcCollector.
+
+        period is the time between two samples, window the length over which CPU usage
+        is averaged (the psutil.cpu_percent interval it replaces). history is how many
+        seconds of samples are kept for after() and rates() queries (default: 10 windows).
+        CPU usage and iowait are both % of CPU time over the window.
+        """
+        self.period = period
+        self.window = window
+        history = history if history is not None else 10 * window
+        self._samples = deque(maxlen=max(2, int(history / period) + 2))
+        self._lock = threading.Lock()
+        self._new_sample = threading.Condition(self._lock)
+        self._latest = None
+        self._collector = None
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Start the sampling thread and wait for the first sample."""
+        if self._running:
+            return self
+        self._running = True
+        if self._collector is None:
+            self._collector = ProcCollector()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the sampling thread."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._collector is not None:
+            self._collector.close()
+            self._collector = None
+
+    def _run(self):
+        next_time = time.monotonic()
+        while self._running:
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"Error sampling metrics: {e}")
+
+    def _sample(self):
+        """Take one sample and publish a new snapshot."""
+        sample = self._collector.sample()
+        disk = disk_usage('/')
+        now = sample.time
+        with self._lock:
+            self._samples.append(sample)
+            cpu_usage, io_wait = cpu_percentages(self._sample_at(now - self.window), sample)
+            self._latest = MetricSnapshot(
+                now, cpu_usage, sample.memory_usage, sample.swap_usage, sample.load1, disk,
+                sample.temperature, io_wait,
+            )
+            self._new_sample.notify_all()
+
+    def _sample_at(self, since):
+        """Last sample taken at or before since, or the oldest one kept."""
+        for sample in reversed(self._samples):
+            if sample.time <= since:
+                return sample
+        return self._samples[0]
+
+    def latest(self):
+        """
+        Return the newest snapshot without blocking (CPU averaged over the last window).
+        """
+        return self._latest
+
+    def after(self, since, window=None):
+        """
+        Return a snapshot measured after time since (a time.monotonic() value).
+        Waits until window seconds (default: the sampler window) have passed since then;
+        CPU usage and iowait are averaged over the last window seconds, never reaching before since.
+        """
+        window = self.window if window is None else window
+        deadline = since + window
+        with self._new_sample:
+            self._new_sample.wait_for(lambda: self._latest.time >= deadline or not self._running)
+            latest = self._latest
+            before = self._sample_at(max(since, latest.time - window))
+            cpu_usage, io_wait = cpu_percentages(before, self._samples[-1])
+        return latest._replace(cpu_usage=cpu_usage, io_wait=io_wait)
+
+    def rates(self, window=None):
+        """
+        Per-second rates of the cumulative counters (context switches, interrupts, page
+        faults, network bytes, ...) over the last window seconds, as a dict.
+        """
+        window = self.window if window is None else window
+        with self._lock:
+            newest = self._samples[-1]
+            return counter_rates(self._sample_at(newest.time - window), newest)
@@ -0,0 +1,393 @@
+import os
+import time
+from collections import namedtuple
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+# One reading of every source kept open by ProcCollector. Counters (cpu_*, ctx_switches,
+# interrupts, soft_interrupts, vmstat and network bytes, psi_*_total) are cumulative since boot.
+ProcSample = namedtuple("ProcSample", [
+    "time",
+    "cpu_busy",
+    "cpu_total",
+    "cpu_iowait",
+    "ctx_switches",
+    "interrupts",
+    "soft_interrupts",
+    "procs_running",
+    "procs_blocked",
+    "memory_usage",
+    "swap_usage",
+    "load1",
+    "load5",
+    "load15",
+    "page_faults",
+    "major_faults",
+    "pages_in",
+    "pages_out",
+    "swap_in",
+    "swap_out",
+    "net_sent",
+    "net_recv",
+    "psi_cpu_some",
+    "psi_io_some",
+    "psi_io_full",
+    "psi_memory_some",
+    "psi_memory_full",
+    "psi_cpu_some_total",
+    "psi_io_some_total",
+    "psi_memory_some_total",
+    "temperature",
+])
+
+MEMINFO_FIELDS = (b"MemTotal:", b"MemAvailable:", b"SwapTotal:", b"SwapFree:")
+VMSTAT_FIELDS = (b"pgfault", b"pgmajfault", b"pgpgin", b"pgpgout", b"pswpin", b"pswpout")
+PSI_RESOURCES = ("cpu", "io", "memory")
+
+# Cumulative per-device counters of /proc/diskstats used by DiskStats (I/O times in ms)
+DiskCounters = namedtuple("DiskCounters", [
+    "reads", "read_sectors", "read_ms", "writes", "write_sectors", "write_ms",
+    "in_flight", "io_ms", "weighted_io_ms",
+])
+
+class ProcFile:
+    def __init__(self, path, size=4096):
+        """
+        Keep a /proc or /sys file open and re-read it from offset 0 into a preallocated buffer.
+        """
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    def read(self):
+        """
+        Re-read the whole file and return its length. The content is in self.buffer[:length].
+        The buffer doubles until the file fits, so later reads need a single syscall; a
+        larger buffer replaces self.buffer, so only take self.buffer after read().
+        """
+        while True:
+            length = os.preadv(self.fd, [self.view], 0)
+            if length < len(self.buffer):
+                return length
+            self.buffer = bytearray(2 * len(self.buffer))
+            self.view = memoryview(self.buffer)
+
+    def content(self):
+        """Re-read the whole file and return its content (a copy)."""
+        length = self.read()
+        return self.buffer[:length]
+
+    def close(self):
+        if self.fd is not None:
+            self.view.release()
+            os.close(self.fd)
+            self.fd = None
+
+def open_optional(path, size=4096):
+    """Open a ProcFile, or return None if the kernel does not provide it."""
+    try:
+        return ProcFile(path, size)
+    except OSError:
+        return None
+
+def find_cpu_thermal_zone():
+    """
+    Return the temp file of the thermal zone closest to the CPU (x86_pkg_temp, then any
+    zone whose type mentions cpu/core/pkg/soc, then the first zone), or None.
+    """
+    root = "/sys/class/thermal"
+    try:
+        zones = sorted(name for name in os.listdir(root) if name.startswith("thermal_zone"))
+    except OSError:
+        return None
+    types = {}
+    for zone in zones:
+        try:
+            with open(os.path.join(root, zone, "type")) as f:
+                types[zone] = f.read().strip().lower()
+        except OSError:
+            continue
+    if not types:
+        return None
+    ranked = sorted(types, key=lambda zone: (
+        types[zone] != "x86_pkg_temp",
+        not any(key in types[zone] for key in ("cpu", "core", "pkg", "soc")),
+    ))
+    return os.path.join(root, ranked[0], "temp")
+
+def field_after(buffer, key, start, end):
+    """Return the first integer following key in buffer[start:end], or None."""
+    position = buffer.find(key, start, end)
+    if position < 0:
+        return None
+    position += len(key)
+    stop = buffer.find(b"\n", position, end)
+    if stop < 0:
+        stop = end
+    return int(buffer[position:stop].split(None, 1)[0])
+
+class ProcCollector:
+    def __init__(self, net_interfaces=None):
+        """
+        Read system metrics straight from /proc and /sys through persistent file handles.
+
+        Every file is opened once and re-read with preadv on each sample(), and only the
+        fields the agents, GUI and monitor use are parsed. net_interfaces restricts the
+        network counters to some interfaces (default: all, like psutil.net_io_counters).
+        Sources the kernel does not provide (PSI, thermal zones) read as 0.
+        """
+        self.stat = ProcFile("/proc/stat", 16384)
+        self.meminfo = ProcFile("/proc/meminfo")
+        self.vmstat = ProcFile("/proc/vmstat", 16384)
+        self.loadavg = ProcFile("/proc/loadavg", 256)
+        self.net_dev = ProcFile("/proc/net/dev")
+        self.pressure = {name: open_optional(f"/proc/pressure/{name}", 256) for name in PSI_RESOURCES}
+        thermal_path = find_cpu_thermal_zone()
+        self.thermal = open_optional(thermal_path, 64) if thermal_path else None
+        self.net_interfaces = None if net_interfaces is None else [
+            name.encode() + b":" for name in net_interfaces
+        ]
+
+    def read_cpu(self):
+        """
+        Return (busy, total, iowait, ctx_switches, interrupts, soft_interrupts, running, blocked).
+        CPU times are in seconds and follow psutil.cpu_percent (guest time is part of user).
+        """
+        end = self.stat.read()
+        buffer = self.stat.buffer
+        line_end = buffer.find(b"\n", 0, end)
+        ticks = [int(x) for x in buffer[5:line_end].split()[:8]]
+        total = sum(ticks) / CLOCK_TICKS
+        idle, iowait = ticks[3] / CLOCK_TICKS, ticks[4] / CLOCK_TICKS
+        return (
+            total - idle - iowait,
+            total,
+            iowait,
+            field_after(buffer, b"\nctxt ", line_end, end),
+            field_after(buffer, b"\nintr ", line_end, end),
+            field_after(buffer, b"\nsoftirq ", line_end, end),
+            field_after(buffer, b"\nprocs_running ", line_end, end),
+            field_after(buffer, b"\nprocs_blocked ", line_end, end),
+        )
+
+    def read_memory(self):
+        """Return (memory %, swap %) with the same definitions as psutil."""
+        end = self.meminfo.read()
+        buffer = self.meminfo.buffer
+        total, available, swap_total, swap_free = (
+            field_after(buffer, key, 0, end) or 0 for key in MEMINFO_FIELDS
+        )
+        memory = round(100 * (total - available) / total, 1) if total else 0.0
+        swap = round(100 * (swap_total - swap_free) / swap_total, 1) if swap_total else 0.0
+        return memory, swap
+
+    def read_vmstat(self):
+        """Return the cumulative (pgfault, pgmajfault, pgpgin, pgpgout, pswpin, pswpout) counters."""
+        end = self.vmstat.read()
+        buffer = self.vmstat.buffer
+        values = []
+        for key in VMSTAT_FIELDS:
+            # Match "\nkey " so that pgfault does not hit pgmajfault
+            value = field_after(buffer, b"\n" + key + b" ", 0, end)
+            if value is None and buffer.startswith(key + b" "):
+                value = field_after(buffer, key + b" ", 0, end)
+            values.append(value or 0)
+        return tuple(values)
+
+    def read_loadavg(self):
+        """Return the (1, 5, 15) minute load averages."""
+        fields = self.loadavg.content().split(None, 3)
+        return float(fields[0]), float(fields[1]), float(fields[2])
+
+    def read_network(self):
+        """Return cumulative (bytes sent, bytes received) over the selected interfaces."""
+        end = self.net_dev.read()
+        buffer = self.net_dev.buffer
+        sent = recv = 0
+        # The first two lines are headers
+        line_start = buffer.find(b"\n", buffer.find(b"\n", 0, end) + 1, end) + 1
+        while 0 < line_start < end:
+            line_end = buffer.find(b"\n", line_start, end)
+            if line_end < 0:
+                line_end = end
+            name, _, counters = buffer[line_start:line_end].partition(b":")
+            name = name.strip() + b":"
+            if self.net_interfaces is None or name in self.net_interfaces:
+                fields = counters.split()
+                recv += int(fields[0])
+                sent += int(fields[8])
+            line_start = line_end + 1
+        return sent, recv
+
+    def read_pressure(self, name):
+        """Return (some avg10, full avg10, some total in µs) for one PSI resource, zeros if missing."""
+        source = self.pressure[name]
+        if source is None:
+            return 0.0, 0.0, 0
+        try:
+            end = source.read()
+        except OSError:
+            # The file can exist without being readable (e.g. PSI disabled at boot: EOPNOTSUPP)
+            return 0.0, 0.0, 0
+        buffer = source.buffer
+        some = buffer.find(b"avg10=", 0, end) + 6
+        some_avg = float(buffer[some:buffer.find(b" ", some, end)])
+        some_total = field_after(buffer, b"total=", 0, end)
+        full = buffer.find(b"full avg10=", 0, end)
+        full_avg = float(buffer[full + 11:buffer.find(b" ", full + 11, end)]) if full >= 0 else 0.0
+        return some_avg, full_avg, some_total
+
+    def read_temperature(self):
+        """Return the CPU thermal zone temperature in °C, or 0 without thermal zone."""
+        if self.thermal is None:
+            return 0
+        try:
+            return int(self.thermal.content()) / 1000
+        except (OSError, ValueError):
+            # Some zones fail to read while the sensor is suspended
+            return 0
+
+    def sample(self):
+        """Read every source once and return a ProcSample."""
+        now = time.monotonic()
+        busy, total, iowait, ctx, intr, softirq, running, blocked = self.read_cpu()
+        memory, swap = self.read_memory()
+        load1, load5, load15 = self.read_loadavg()
+        faults, major_faults, pages_in, pages_out, swap_in, swap_out = self.read_vmstat()
+        sent, recv = self.read_network()
+        cpu_some, _, cpu_total = self.read_pressure("cpu")
+        io_some, io_full, io_total = self.read_pressure("io")
+        memory_some, memory_full, memory_total = self.read_pressure("memory")
+        return ProcSample(
+            now, busy, total, iowait, ctx, intr, softirq, running, blocked,
+            memory, swap, load1, load5, load15,
+            faults, major_faults, pages_in, pages_out, swap_in, swap_out,
+            sent, recv,
+            cpu_some, io_some, io_full, memory_some, memory_full,
+            cpu_total, io_total, memory_total,
+            self.read_temperature(),
+        )
+
+    def close(self):
+        """Close every file handle."""
+        sources = [self.stat, self.meminfo, self.vmstat, self.loadavg, self.net_dev, self.thermal]
+        for source in sources + list(self.pressure.values()):
+            if source is not None:
+                source.close()
+
+class DiskStats:
+    def __init__(self, partitions=False):
+        """
+        Per-device counters of /proc/diskstats, re-read through a persistent handle. Like
+        iostat, partitions are left out unless partitions, as are devices that never did
+        any I/O (unused loop and ram devices).
+        """
+        self.file = ProcFile("/proc/diskstats", 16384)
+        self.partitions = partitions
+        # Device name -> whether it is a partition, looked up in sysfs once per device
+        self._is_partition = {}
+
+    def is_partition(self, name):
+        if name not in self._is_partition:
+            self._is_partition[name] = os.path.exists(f"/sys/class/block/{name}/partition")
+        return self._is_partition[name]
+
+    def read(self):
+        """Return {device: DiskCounters}."""
+        devices = {}
+        for line in bytes(self.file.content()).splitlines():
+            fields = line.split()
+            if len(fields) < 14:
+                continue
+            name = fields[2].decode()
+            counters = DiskCounters(*(int(fields[i]) for i in (3, 5, 6, 7, 9, 10, 11, 12, 13)))
+            if counters.reads == 0 and counters.writes == 0:
+                continue
+            if not self.partitions and self.is_partition(name):
+                continue
+            devices[name] = counters
+        return devices
+
+    def close(self):
+        self.file.close()
+
+class CpuFrequency:
+    def __init__(self):
+        """Current frequency of every CPU from cpufreq sysfs, through persistent handles."""
+        paths = []
+        root = "/sys/devices/system/cpu"
+        try:
+            names = os.listdir(root)
+        except OSError:
+            names = []
+        for name in sorted(names):
+            if name.startswith("cpu") and name[3:].isdigit():
+                paths.append(os.path.join(root, name, "cpufreq", "scaling_cur_freq"))
+        self.files = [f for f in (open_optional(path, 64) for path in paths) if f is not None]
+
+    def read(self):
+        """Mean frequency in MHz (as psutil.cpu_freq().current), or None without cpufreq."""
+        if not self.files:
+            return None
+        return sum(int(f.content()) for f in self.files) / len(self.files) / 1000
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+def disk_space(path="/"):
+    """
+    Return (total, used, free) bytes and the usage % of the filesystem at path from a
+    single statvfs, with the same definitions as shutil.disk_usage and psutil.disk_usage.
+    """
+    st = os.statvfs(path)
+    total = st.f_blocks * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    percent = round(100 * used / (used + free), 1) if used + free else 0.0
+    return total, used, free, percent
+
+def disk_usage(path="/"):
+    """Percentage of the filesystem at path in use, as psutil.disk_usage(path).percent."""
+    return disk_space(path)[3]
+
+def process_count():
+    """Number of processes, as len(psutil.pids())."""
+    return sum(1 for entry in os.scandir("/proc") if entry.name.isdigit())
+
+def benchmark(num_samples=2000):
+    """Compare the per-sample cost of ProcCollector with the psutil calls it replaces."""
+    import psutil
+
+    def psutil_sample():
+        times = psutil.cpu_times()
+        psutil.cpu_times()
+        psutil.virtual_memory()
+        psutil.swap_memory()
+        os.getloadavg()
+        psutil.disk_usage('/')
+        psutil.sensors_temperatures()
+        stats = psutil.cpu_stats()
+        psutil.cpu_stats()
+        psutil.cpu_stats()
+        psutil.net_io_counters()
+        return times, stats
+
+    collector = ProcCollector()
+
+    def collector_sample():
+        collector.sample()
+        disk_usage('/')
+
+    for name, sample in [("psutil", psutil_sample), ("ProcCollector", collector_sample)]:
+        sample()
+        start = time.perf_counter()
+        for _ in range(num_samples):
+            sample()
+        cost = (time.perf_counter() - start) / num_samples
+        print(f"{name:14s}: {cost * 1e6:8.1f} µs/sample")
+    collector.close()
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,96 @@
+import errno
+import os
+import select
+import time
+
+PSI_ROOT = "/proc/pressure"
+
+# Default triggers: fire when tasks stall for stall_us within any window_us window.
+# The kernel accepts windows between 500 ms and 10 s (multiples of 2 s for unprivileged users).
+DEFAULT_TRIGGERS = {
+    "cpu": ("some", 150000, 1000000),
+    "memory": ("some", 100000, 1000000),
+    "io": ("full", 100000, 1000000),
+}
+
+def psi_available():
+    """True if the kernel exposes pressure stall information."""
+    return all(os.path.exists(os.path.join(PSI_ROOT, name)) for name in DEFAULT_TRIGGERS)
+
+class PressureTrigger:
+    def __init__(self, resource, kind="some", stall_us=150000, window_us=1000000):
+        """
+        Register a PSI trigger on /proc/pressure/<resource>. The file becomes readable with
+        EPOLLPRI when tasks were stalled for stall_us within the last window_us. If the
+        process may not use that window, the next multiple of 2 s is used instead.
+        """
+        self.resource = resource
+        self.fd = os.open(os.path.join(PSI_ROOT, resource), os.O_RDWR | os.O_NONBLOCK)
+        try:
+            try:
+                os.write(self.fd, f"{kind} {stall_us} {window_us}\0".encode())
+            except OSError as e:
+                # Without CAP_SYS_RESOURCE the window must be a multiple of 2 s
+                unprivileged_window = -(-window_us // 2000000) * 2000000
+                if e.errno != errno.EINVAL or unprivileged_window == window_us:
+                    raise
+                os.write(self.fd, f"{kind} {stall_us} {unprivileged_window}\0".encode())
+                window_us = unprivileged_window
+        except OSError:
+            os.close(self.fd)
+            raise
+        self.window_us = window_us
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class PressureEvents:
+    def __init__(self, triggers=None):
+        """
+        Wait on several PSI triggers at once with epoll. triggers maps a resource to
+        (kind, stall_us, window_us), DEFAULT_TRIGGERS by default. Raises OSError if the
+        kernel refuses a trigger (no PSI, or not permitted), so callers can fall back to polling.
+        """
+        self.triggers = {}
+        self.epoll = select.epoll()
+        try:
+            for resource, (kind, stall_us, window_us) in (triggers or DEFAULT_TRIGGERS).items():
+                trigger = PressureTrigger(resource, kind, stall_us, window_us)
+                self.triggers[trigger.fd] = trigger
+                self.epoll.register(trigger.fd, select.EPOLLPRI)
+        except OSError:
+            self.close()
+            raise
+
+    def wait(self, timeout=None):
+        """
+        Block until some triggers fire or timeout seconds pass (no CPU is used meanwhile).
+        Return the list of (resource, monotonic time) that fired, empty on timeout.
+        """
+        events = self.epoll.poll(-1 if timeout is None else timeout)
+        now = time.monotonic()
+        fired = []
+        for fd, mask in events:
+            if mask & select.EPOLLERR:
+                raise OSError(f"PSI trigger on {self.triggers[fd].resource} was removed")
+            if mask & select.EPOLLPRI:
+                fired.append((self.triggers[fd].resource, now))
+        return fired
+
+    def close(self):
+        for trigger in self.triggers.values():
+            trigger.close()
+        self.triggers = {}
+        self.epoll.close()
+
+if __name__ == "__main__":
+    events = PressureEvents()
+    print(f"Waiting for pressure stalls on {', '.join(t.resource for t in events.triggers.values())}...")
+    try:
+        while True:
+            for resource, when in events.wait():
+                print(f"{when:.3f}: {resource} pressure stall")
+    except KeyboardInterrupt:
+        events.close()
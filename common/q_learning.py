@@ -0,0 +1,95 @@
+import numpy as np
+
+def flat_q_view(q_table):
+    """
+    Return the Q-table as a 2-D (n_states, n_actions) view sharing its memory.
+    """
+    if not q_table.flags.c_contiguous:
+        raise ValueError("Q-table must be C-contiguous to be updated through a flat view.")
+    return q_table.reshape(-1, q_table.shape[-1])
+
+def last_write_before(written_rows, rows):
+    """
+    For each position i, return the largest j < i with written_rows[j] == rows[i], or -1.
+    """
+    n = len(written_rows)
+    positions = np.arange(n, dtype=np.int64)
+    keys = np.sort(written_rows.astype(np.int64) * n + positions)
+    query = rows.astype(np.int64) * n + positions
+    found = np.searchsorted(keys, query, side="left") - 1
+    found_keys = keys[np.maximum(found, 0)]
+    hit = (found >= 0) & (found_keys // n == rows)
+    return np.where(hit, found_keys % n, -1)
+
+def conflict_free_segments(states, next_states):
+    """
+    Split a batch of transitions into consecutive segments in which no transition reads
+    a Q-table row (its state or next state) written by an earlier transition of the same
+    segment. Updating each segment in one vectorized pass is then equivalent to applying
+    its transitions one by one.
+    """
+    n = len(states)
+    conflict = np.maximum(last_write_before(states, states), last_write_before(states, next_states))
+    start = 0
+    while start < n:
+        stop = n
+        window = 64
+        lo = start + 1
+        while lo < n:
+            hi = min(n, lo + window)
+            hits = np.flatnonzero(conflict[lo:hi] >= start)
+            if len(hits):
+                stop = lo + hits[0]
+                break
+            lo = hi
+            window *= 2
+        yield start, stop
+        start = stop
+
+def _update(q, states, actions, rewards, next_states, learning_rate, discount_factor, not_done):
+    """Apply independent Q-learning updates (no repeated rows) and return their TD errors."""
+    best_next = q[next_states].max(axis=1)
+    if not_done is not None:
+        best_next = best_next * not_done
+    td_target = rewards + discount_factor * best_next
+    td_error = td_target - q[states, actions]
+    q[states, actions] += learning_rate * td_error
+    return td_error
+
+def batch_q_update(q_table, states, actions, rewards, next_states, learning_rate, discount_factor,
+                   mode="sequential", dones=None):
+    """
+    Apply a batch of tabular Q-learning updates and return the TD error of each transition.
+
+    states and next_states are flat row indices into the (n_states, n_actions) view of
+    q_table (see flat_q_view). Transitions flagged in dones do not bootstrap.
+
+    mode="sequential" gives the same table as calling learn() on each transition in order.
+    mode="accumulate" computes every target from the table as it was before the batch and
+    sums the updates of repeated (state, action) pairs, like np.add.at.
+    """
+    q = flat_q_view(q_table)
+    states = np.asarray(states, dtype=np.intp)
+    actions = np.asarray(actions, dtype=np.intp)
+    rewards = np.asarray(rewards, dtype=q.dtype)
+    next_states = np.asarray(next_states, dtype=np.intp)
+    not_done = None if dones is None else ~np.asarray(dones, dtype=bool)
+
+    if mode == "accumulate":
+        best_next = q[next_states].max(axis=1)
+        if not_done is not None:
+            best_next = best_next * not_done
+        td_error = rewards + discount_factor * best_next - q[states, actions]
+        np.add.at(q, (states, actions), learning_rate * td_error)
+        return td_error
+
+    if mode != "sequential":
+        raise ValueError(f"Unknown update mode: {mode}")
+
+    td_error = np.empty(len(states), dtype=q.dtype)
+    for start, stop in conflict_free_segments(states, next_states):
+        td_error[start:stop] = _update(
+            q, states[start:stop], actions[start:stop], rewards[start:stop], next_states[start:stop],
+            learning_rate, discount_factor, None if not_done is None else not_done[start:stop],
+        )
+    return td_error
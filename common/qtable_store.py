@@ -0,0 +1,311 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+from collections import namedtuple
+import numpy as np
+
+# Q-table container (.qtab): MAGIC, the header length as a little-endian uint32, a JSON
+# header, then each array section (q_table, optionally visits) raw in C order, starting on
+# a SECTION_ALIGN boundary so it can be memory-mapped. Paths ending in .npy are plain
+# arrays, written and read as before.
+MAGIC = b"RLQTABLE"
+SCHEMA_VERSION = 1
+SECTION_ALIGN = 64
+STORAGE_DTYPES = ("float64", "float32", "float16")
+NPY_MAGIC = b"\x93NUMPY"
+# Header keys that must match what an agent expects; hyperparameters and stats may differ
+VALIDATED_KEYS = ("shape", "metrics", "bins", "actions", "stresses")
+
+# Agent of each scenario (file relative to the repository root, class), whose
+# q_table_meta() describes the tables it saves; used to convert .npy tables
+SCENARIO_AGENTS = {
+    "desktop": ("First Scenario - Desktop/agent.py", "EventAgent"),
+    "light": ("First Scenario - Desktop/light_first_scenario/light_agent.py", "LightEventAgent"),
+    "server": ("Second Scenario - Server/agent_server.py", "ServerAgent"),
+    "iot": ("Third Scenario - IoT/agent_iot.py", "IoTAgent"),
+}
+
+StoredQTable = namedtuple("StoredQTable", ["q_table", "visits", "meta"])
+
+class QTableFormatError(ValueError):
+    pass
+
+def _to_json(value):
+    """Metadata values as JSON types (bins are numpy arrays)."""
+    if isinstance(value, dict):
+        return {str(k): _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _padding(offset):
+    return -offset % SECTION_ALIGN
+
+def _header(q_table, visits, meta, dtype):
+    """Header dict and the section arrays, laid out after a header of unknown length."""
+    dtype = np.dtype(dtype or q_table.dtype).name
+    if dtype not in STORAGE_DTYPES:
+        raise QTableFormatError(f"Q-table dtype must be one of {STORAGE_DTYPES}, not {dtype}.")
+    arrays = {"q_table": np.ascontiguousarray(q_table, dtype=np.dtype(dtype).newbyteorder("<"))}
+    if visits is not None:
+        if visits.shape != q_table.shape:
+            raise QTableFormatError(f"Visit counts have shape {visits.shape}, expected {q_table.shape}.")
+        arrays["visits"] = np.ascontiguousarray(visits, dtype="<u4")
+    header = _to_json(dict(meta or {}))
+    header.update({
+        "format": "rl-qtable",
+        "schema_version": SCHEMA_VERSION,
+        "shape": list(q_table.shape),
+        "sections": {},
+    })
+    offset = 0
+    for name, array in arrays.items():
+        header["sections"][name] = {
+            "dtype": array.dtype.str,
+            "offset": offset,
+            "nbytes": array.nbytes,
+            "crc32": zlib.crc32(memoryview(array).cast("B")),
+        }
+        offset += array.nbytes + _padding(array.nbytes)
+    return header, arrays
+
+def write_q_file(f, q_table, meta=None, visits=None, dtype=None):
+    """
+    Write a Q-table container to the binary file f: q_table stored as dtype (float64,
+    float32 or float16, default its own), the optional visit counts (same shape) and the
+    metadata of meta (bins, action and stress names, hyperparameters, training stats).
+    Section offsets in the header are relative to the first section.
+    """
+    header, arrays = _header(q_table, visits, meta, dtype)
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    start = len(MAGIC) + 4 + len(encoded)
+    encoded += b" " * _padding(start)
+    f.write(MAGIC + len(encoded).to_bytes(4, "little") + encoded)
+    for array in arrays.values():
+        f.write(memoryview(array).cast("B"))
+        f.write(b"\0" * _padding(array.nbytes))
+
+def read_q_header(path):
+    """Return (header, offset of the first section) of a .qtab file."""
+    with open(path, "rb") as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if prefix[:len(MAGIC)] != MAGIC or len(prefix) < len(MAGIC) + 4:
+            raise QTableFormatError(f"{path} is not a Q-table container.")
+        length = int.from_bytes(prefix[len(MAGIC):], "little")
+        try:
+            header = json.loads(f.read(length))
+        except ValueError as e:
+            raise QTableFormatError(f"{path} has a corrupt header: {e}")
+    if header.get("schema_version", 0) > SCHEMA_VERSION:
+        raise QTableFormatError(f"{path} uses schema version {header['schema_version']}, "
+                                f"this code reads up to {SCHEMA_VERSION}.")
+    return header, len(MAGIC) + 4 + length
+
+def check_q_meta(meta, expect, path):
+    """Raise QTableFormatError listing every VALIDATED_KEYS entry of meta that differs from expect."""
+    expect = _to_json(expect or {})
+    problems = [
+        f"{key} is {meta[key]}, expected {expect[key]}"
+        for key in VALIDATED_KEYS
+        if key in meta and key in expect and meta[key] != expect[key]
+    ]
+    if problems:
+        raise QTableFormatError(f"Q-table in {path} does not match the agent: " + "; ".join(problems))
+
+def _load_npy(path, mmap):
+    q_table = np.load(path, mmap_mode="r" if mmap else None)
+    return StoredQTable(q_table, None, {"shape": list(q_table.shape)})
+
+def load_q_file(path, mmap=False, verify=None, expect=None):
+    """
+    Load a Q-table container (or a plain .npy) as StoredQTable(q_table, visits, meta).
+    With mmap, arrays are read-only maps in their stored dtype, read lazily; otherwise
+    they are loaded and the Q-table is converted to float64 for learning. The checksums
+    are verified unless verify is False (default: only when not mapping). expect holds the
+    shape, bins, action/stress names... the agent requires (see check_q_meta).
+    """
+    with open(path, "rb") as f:
+        is_npy = f.read(len(NPY_MAGIC)) == NPY_MAGIC
+    if is_npy:
+        stored = _load_npy(path, mmap)
+        check_q_meta(stored.meta, expect, path)
+        return stored
+    meta, start = read_q_header(path)
+    check_q_meta(meta, expect, path)
+    size = os.path.getsize(path)
+    shape = tuple(meta["shape"])
+    arrays = {}
+    for name, section in meta["sections"].items():
+        offset = start + section["offset"]
+        if offset + section["nbytes"] > size:
+            raise QTableFormatError(f"{path} is truncated: section {name} ends past the end of the file.")
+        if section["nbytes"] == 0:
+            array = np.zeros(shape, dtype=section["dtype"])
+        elif mmap:
+            array = np.memmap(path, dtype=section["dtype"], mode="r", offset=offset, shape=shape)
+        else:
+            array = np.fromfile(path, dtype=section["dtype"], count=int(np.prod(shape)), offset=offset).reshape(shape)
+        if verify if verify is not None else not mmap:
+            if zlib.crc32(memoryview(np.ascontiguousarray(array)).cast("B")) != section["crc32"]:
+                raise QTableFormatError(f"Checksum mismatch in section {name} of {path}.")
+        arrays[name] = array
+    q_table = arrays["q_table"]
+    if not mmap:
+        q_table = q_table.astype(np.float64)
+    return StoredQTable(q_table, arrays.get("visits"), meta)
+
+def resolve_q_table_path(path):
+    """path, or the plain .npy of the same name (the former format) if only that one exists."""
+    legacy = os.path.splitext(path)[0] + ".npy"
+    if not os.path.exists(path) and os.path.exists(legacy):
+        return legacy
+    return path
+
+def load_agent_q_table(path, expect):
+    """
+    StoredQTable of path (see resolve_q_table_path) for an agent, or None if there is none
+    or it does not match expect.
+    """
+    found = resolve_q_table_path(path)
+    if not os.path.exists(found):
+        return None
+    if found != path:
+        print(f"Reading the former Q-table format from {found}; the next save writes {path}.")
+    try:
+        return load_q_file(found, expect=expect)
+    except QTableFormatError as e:
+        print(e)
+        return None
+
+def publish_q_table(path, q_table, meta=None, visits=None, dtype=None):
+    """
+    Save q_table to path atomically: it is written to a temporary file of the same
+    directory, synced, then renamed over path. Readers mapping the previous version keep
+    it intact and see either the old or the new table, never a partial one. A .npy path
+    gets a plain array, any other a container with meta and visits (see write_q_file).
+    """
+    fd, tmp = tempfile.mkstemp(prefix=".q_table-", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        # mkstemp creates 0600 files; published tables are readable like np.save output
+        umask = os.umask(0)
+        os.umask(umask)
+        os.fchmod(fd, 0o666 & ~umask)
+        with os.fdopen(fd, "wb") as f:
+            if path.endswith(".npy"):
+                np.save(f, q_table if dtype is None else q_table.astype(dtype))
+            else:
+                write_q_file(f, q_table, meta=meta, visits=visits, dtype=dtype)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def scenario_q_meta(scenario):
+    """q_table_meta() of a fresh agent of scenario (a SCENARIO_AGENTS key)."""
+    import contextlib
+    import importlib.util
+    if scenario not in SCENARIO_AGENTS:
+        raise ValueError(f"Unknown scenario {scenario}, expected one of {', '.join(SCENARIO_AGENTS)}")
+    file, class_name = SCENARIO_AGENTS[scenario]
+    file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), file)
+    # Agents import their sibling modules
+    sys.path.insert(0, os.path.dirname(file))
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(file))[0], file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # The agent reports loading its own table, irrelevant here
+    with contextlib.redirect_stdout(None):
+        agent = getattr(module, class_name)()
+    return agent.q_table_meta()
+
+def convert_npy(npy_path, meta, path=None, dtype=None):
+    """
+    Convert a plain .npy Q-table into a container (default: same name, .qtab), with the
+    metadata of meta (agent.q_table_meta() or scenario_q_meta()), whose shape must match.
+    meta must describe every VALIDATED_KEYS entry, so loaders can check the table against
+    their agent. Return the path.
+    """
+    missing = [key for key in VALIDATED_KEYS if key not in (meta or {})]
+    if missing:
+        raise ValueError(f"Metadata for {npy_path} lacks {', '.join(missing)}; pass the agent's q_table_meta()")
+    path = path or os.path.splitext(npy_path)[0] + ".qtab"
+    q_table = np.load(npy_path)
+    check_q_meta({"shape": list(q_table.shape)}, meta, npy_path)
+    meta = dict(meta)
+    meta.setdefault("stats", {})["converted_from"] = os.path.basename(npy_path)
+    publish_q_table(path, q_table, meta=meta, dtype=dtype)
+    return path
+
+def stamp_q_meta(meta, visits=None, stats=None):
+    """meta with the training stats of a save: stats, live updates counted by visits, time."""
+    meta = dict(meta)
+    meta["stats"] = dict(stats or {})
+    if visits is not None:
+        meta["stats"]["updates"] = int(visits.sum())
+    meta["stats"]["saved_at"] = time.time()
+    return meta
+
+def load_shared_q_table(path):
+    """
+    Map a Q-table read-only instead of copying it: every process mapping the same file
+    shares its page-cache pages.
+    """
+    return load_q_file(path, mmap=True).q_table
+
+class QTableReader:
+    def __init__(self, path, expect=None):
+        """
+        Read-only view of the Q-table published at path. table() checks (one stat) whether
+        a writer published a new version since the last call and maps it if so.
+        expect (shape, bins, action names... see check_q_meta) is required of every version.
+        """
+        self.path = path
+        self.expect = expect
+        self.version = 0
+        self.meta = None
+        self._identity = None
+        self._table = None
+        self.table()
+
+    def table(self):
+        """Current Q-table, switching to a newly published file if there is one."""
+        st = os.stat(self.path)
+        identity = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        if identity != self._identity:
+            try:
+                stored = load_q_file(self.path, mmap=True, expect=self.expect)
+            except QTableFormatError as e:
+                if self._table is None:
+                    raise
+                # Keep acting from the last valid version
+                print(f"Ignoring Q-table published in {self.path}: {e}")
+            else:
+                self._table, self.meta = stored.q_table, stored.meta
+                self.version += 1
+            self._identity = identity
+        return self._table
+
+if __name__ == "__main__":
+    # python -m common.qtable_store info <file>
+    # python -m common.qtable_store convert <file.npy> <desktop|light|server|iot> [<file.qtab>] [float64|float32|float16]
+    if len(sys.argv) > 2 and sys.argv[1] == "info":
+        stored = load_q_file(sys.argv[2], verify=True)
+        print(json.dumps({k: v for k, v in stored.meta.items() if k != "bins"}, indent=2))
+        print(f"Q min {stored.q_table.min():.4f} | max {stored.q_table.max():.4f} | "
+              f"non-zero {np.count_nonzero(stored.q_table)} / {stored.q_table.size}")
+    elif len(sys.argv) > 3 and sys.argv[1] == "convert" and sys.argv[3] in SCENARIO_AGENTS:
+        args = sys.argv[4:]
+        dtype = args.pop() if args and args[-1] in STORAGE_DTYPES else None
+        meta = scenario_q_meta(sys.argv[3])
+        print(f"Written {convert_npy(sys.argv[2], meta, args[0] if args else None, dtype=dtype)}")
+    else:
+        print(f"usage: python -m common.qtable_store info <file> | "
+              f"convert <file.npy> <{'|'.join(SCENARIO_AGENTS)}> [<file.qtab>] [dtype]")
@@ -0,0 +1,151 @@
+import random
+import numpy as np
+
+class Schedule:
+    def __init__(self, start, decay=1.0, minimum=0.0, origin=0):
+        """
+        Exponential decay per episode with a floor: start at episode origin, then
+        multiplied by decay every episode, never below minimum.
+        """
+        self.start = start
+        self.decay = decay
+        self.minimum = minimum
+        self.origin = origin
+
+    def value(self, episode):
+        return max(self.minimum, self.start * self.decay ** max(episode - self.origin, 0))
+
+    def to_dict(self):
+        return {"start": self.start, "decay": self.decay, "minimum": self.minimum, "origin": self.origin}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(**state)
+
+class TrainingSession:
+    def __init__(self, exploration, learning=None, seed=None):
+        """
+        Position of a training run across processes: episodes completed, the exploration
+        and learning-rate schedules (Schedule, indexed by episode), the seed the RNGs were
+        seeded with and the reward of every episode. Saved in the checkpoint state next to
+        the Q-table (common.checkpoint), so the next run continues the schedules instead of
+        restarting them.
+        """
+        self.exploration = exploration
+        self.learning = learning or Schedule(0.1)
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.episode = 0
+        # Episodes at which the current run started and ends
+        self.run_start = 0
+        self.target = 0
+        self.finished = True
+        self.runs = 0
+        self.rewards = []
+
+    def seed_rngs(self):
+        """Seed the Python and NumPy global RNGs from seed (fresh sessions; resumed ones restore their states)."""
+        random.seed(self.seed)
+        np.random.seed(np.random.SeedSequence(self.seed).generate_state(1)[0])
+
+    def override(self, exploration_rate=None, exploration_decay=None, learning_rate=None):
+        """
+        Restart a schedule at the current episode when the caller gives one of its
+        parameters explicitly; None keeps the saved schedule.
+        """
+        if exploration_rate is not None or exploration_decay is not None:
+            self.exploration = Schedule(
+                self.exploration.value(self.episode) if exploration_rate is None else exploration_rate,
+                self.exploration.decay if exploration_decay is None else exploration_decay,
+                self.exploration.minimum, origin=self.episode,
+            )
+        if learning_rate is not None:
+            self.learning = Schedule(learning_rate, self.learning.decay, self.learning.minimum, origin=self.episode)
+
+    def begin(self, num_episodes):
+        """Start a run of num_episodes more episodes, unless an interrupted one is being resumed."""
+        if self.finished:
+            self.run_start = self.episode
+            self.target = self.episode + num_episodes
+            self.finished = False
+            self.runs += 1
+
+    def episodes(self, agent=None):
+        """
+        Episode indices left in the current run. Before each, agent's exploration and
+        learning rates are set from the schedules.
+        """
+        while self.episode < self.target:
+            if agent is not None:
+                self.apply(agent)
+            yield self.episode
+
+    def apply(self, agent):
+        agent.exploration_rate = self.exploration.value(self.episode)
+        agent.learning_rate = self.learning.value(self.episode)
+
+    def end_episode(self, reward):
+        self.rewards.append(float(reward))
+        self.episode += 1
+        if self.episode >= self.target:
+            self.finished = True
+
+    def run_rewards(self):
+        """Rewards of the episodes of the current run (including those before an interruption)."""
+        return self.rewards[self.run_start:]
+
+    def state(self):
+        """Checkpoint state (see common.checkpoint.Checkpointer.checkpoint)."""
+        return {
+            "session": {
+                "exploration": self.exploration.to_dict(),
+                "learning": self.learning.to_dict(),
+                "seed": self.seed,
+                "episode": self.episode,
+                "run_start": self.run_start,
+                "target": self.target,
+                "finished": self.finished,
+                "runs": self.runs,
+                "rewards": self.rewards,
+            },
+            "episodes": self.episode,
+            "exploration_rate": self.exploration.value(self.episode),
+            "learning_rate": self.learning.value(self.episode),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        saved = state["session"]
+        session = cls(Schedule.from_dict(saved["exploration"]), Schedule.from_dict(saved["learning"]))
+        session.seed = saved["seed"]
+        for key in ("episode", "run_start", "target", "finished", "runs", "rewards"):
+            setattr(session, key, saved[key])
+        return session
+
+def resume_session(checkpointer, num_episodes, exploration, learning=None, seed=None, fresh=False, **overrides):
+    """
+    Restore the checkpoint of checkpointer (see Checkpointer.restore) and the training
+    session saved with it, then start a run of num_episodes. An interrupted run is resumed
+    where it stopped; after a finished one, the schedules continue from the episode
+    reached. exploration and learning (Schedule) and seed only apply to a new session (a
+    Q-table saved without one is kept), and overrides (exploration_rate, exploration_decay,
+    learning_rate) not None restart their schedule. With fresh, the saved table and session
+    are ignored.
+    """
+    state = checkpointer.restore()
+    if state is not None and "session" in state and not fresh:
+        session = TrainingSession.from_state(state)
+        if session.finished:
+            print(f"Continuing training after episode {session.episode} (exploration rate "
+                  f"{session.exploration.value(session.episode):.3f}).")
+        else:
+            print(f"Resuming interrupted training at episode {session.episode+1}/{session.target}.")
+    else:
+        if fresh:
+            checkpointer.agent.q_table = np.zeros_like(checkpointer.agent.q_table)
+            if getattr(checkpointer.agent, "visits", None) is not None:
+                checkpointer.agent.visits = np.zeros_like(checkpointer.agent.visits)
+        session = TrainingSession(exploration, learning, seed)
+        session.seed_rngs()
+    session.override(**overrides)
+    session.begin(num_episodes)
+    return session
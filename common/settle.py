@@ -0,0 +1,70 @@
+import time
+import numpy as np
+
+# Metrics watched by default and the change under which each counts as stable:
+# its spread (standard deviation) and drift (least-squares slope per second) over the
+# settle window must both stay below the tolerance. The load average is left out, as
+# its 1-minute decay keeps it drifting long after the system has settled.
+DEFAULT_TOLERANCES = {
+    "cpu_usage": 5.0,
+    "memory_usage": 1.0,
+    "swap_usage": 1.0,
+    "io_wait": 3.0,
+}
+
+def is_stable(times, values, tolerance):
+    """True if values (sampled at times) have a spread and a slope per second below tolerance."""
+    values = np.asarray(values, dtype=float)
+    if values.std() > tolerance:
+        return False
+    times = np.asarray(times, dtype=float)
+    times = times - times.mean()
+    spread = np.dot(times, times)
+    if spread == 0:
+        return True
+    slope = np.dot(times, values - values.mean()) / spread
+    return abs(slope) <= tolerance
+
+class SettleDetector:
+    def __init__(self, sampler, tolerances=None, window=0.5):
+        """
+        Wait until the metrics of a running MetricSampler stop moving after an action,
+        instead of sleeping a fixed time. Metrics are stable once every metric of tolerances
+        (DEFAULT_TOLERANCES) stayed within its tolerance over the last window seconds.
+        """
+        self.sampler = sampler
+        self.tolerances = tolerances or DEFAULT_TOLERANCES
+        self.window = window
+
+    def wait(self, since, max_wait):
+        """
+        Block until the metrics measured after since (a time.monotonic() value) are stable,
+        or max_wait seconds after since. Return (snapshot, waited, settled): the snapshot
+        measured when stopping (CPU and iowait averaged over at most the sampler window,
+        never reaching before since), the seconds waited and whether the metrics settled.
+        """
+        if max_wait <= 0:
+            return self.sampler.latest(), 0.0, False
+        deadline = since + max_wait
+        times = []
+        series = {metric: [] for metric in self.tolerances}
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            window = min(self.sampler.window, max(now - since, self.sampler.period))
+            snapshot = self.sampler.after(since, window=window)
+            times.append(snapshot.time)
+            for metric, values in series.items():
+                values.append(getattr(snapshot, metric))
+            # Only judge once a full settle window of measurements was taken
+            if snapshot.time - since >= self.window:
+                first = next(i for i, t in enumerate(times) if t >= snapshot.time - self.window)
+                if all(
+                    is_stable(times[first:], values[first:], self.tolerances[metric])
+                    for metric, values in series.items()
+                ):
+                    return snapshot, time.monotonic() - since, True
+            time.sleep(self.sampler.period)
+        window = min(self.sampler.window, max(max_wait, self.sampler.period))
+        return self.sampler.after(since, window=window), time.monotonic() - since, False
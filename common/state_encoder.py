@@ -0,0 +1,87 @@
+from bisect import bisect_right
+import numpy as np
+
+class StateEncoder:
+    def __init__(self, bin_edges, names=None, extra_dims=()):
+        """
+        Precompile the bins of an agent into a flat state encoder.
+
+        bin_edges is one array of edges per metric, in state order. extra_dims are the sizes
+        of trailing categorical dimensions (e.g. the stress index of the Desktop agents).
+        A state maps to a row of the (n_states, n_actions) view of the Q-table, with the
+        same bin as np.digitize(value, edges) - 1 clamped to the valid range.
+        """
+        self.bin_edges = [np.asarray(edges, dtype=float) for edges in bin_edges]
+        self.names = list(names) if names is not None else [f"metric_{i}" for i in range(len(self.bin_edges))]
+        self.shape = tuple(len(edges) - 1 for edges in self.bin_edges) + tuple(extra_dims)
+        self.n_metrics = len(self.bin_edges)
+        self.n_states = int(np.prod(self.shape))
+        self.extra_dims = tuple(extra_dims)
+
+        strides = np.cumprod((1,) + self.shape[:0:-1])[::-1]
+        self.strides = strides.astype(np.int64)
+        self._strides = [int(s) for s in strides[:len(self.bin_edges)]]
+        self._extra_strides = [int(s) for s in strides[len(self.bin_edges):]]
+        # Searching the interior edges gives the clamped bin index directly
+        self._interior = [edges[1:-1].tolist() for edges in self.bin_edges]
+        self._interior_arrays = [edges[1:-1] for edges in self.bin_edges]
+        # A plain function, not a method: called once per decision, it must stay under 1 µs
+        self.encode = self._compile_encode()
+
+    def __reduce__(self):
+        # encode is generated code, rebuilt rather than pickled
+        return type(self), (self.bin_edges, self.names, self.extra_dims)
+
+    def _compile_encode(self):
+        """
+        Return encode(values, *extra): map one raw metric vector (a list, or an array
+        converted first) plus one index per extra dimension (0 if left out) to a flat row
+        index. Values beyond the encoder's metrics are ignored; a shorter vector raises
+        ValueError. The edges and strides are compiled in as constants, one bisect per
+        metric in a single expression, with no loop, iterator or attribute lookup.
+        """
+        terms = [f"bisect(edges[{i}], v[{i}]) * {stride}" for i, stride in enumerate(self._strides)]
+        terms += [f"x{j} * {stride}" for j, stride in enumerate(self._extra_strides)]
+        params = "".join(f", x{j}=0" for j in range(len(self._extra_strides)))
+        source = (
+            f"def encode(v{params}, bisect=bisect_right, edges=edges, ndarray=ndarray):\n"
+            f"    if v.__class__ is ndarray:\n"
+            f"        v = v.tolist()\n"
+            f"    if len(v) < {self.n_metrics}:\n"
+            f"        raise ValueError(f'Expected at least {self.n_metrics} metric values, got {{len(v)}}')\n"
+            f"    return {' + '.join(terms) or '0'}\n"
+        )
+        namespace = {"bisect_right": bisect_right, "ndarray": np.ndarray,
+                     "edges": tuple(tuple(edges) for edges in self._interior)}
+        exec(source, namespace)
+        return namespace["encode"]
+
+    @classmethod
+    def from_bins(cls, bins, extra_dims=()):
+        """Build the encoder from an agent's bins dict, keeping its key order."""
+        return cls(list(bins.values()), names=list(bins.keys()), extra_dims=extra_dims)
+
+    def encode_batch(self, values, *extra):
+        """
+        Map an (N, n_metrics) array of raw metrics (plus index arrays for the extra
+        dimensions) to an int32 array of flat row indices.
+        """
+        values = np.asarray(values, dtype=float)
+        rows = np.zeros(len(values), dtype=np.int64)
+        for i, (edges, stride) in enumerate(zip(self._interior_arrays, self._strides)):
+            rows += np.searchsorted(edges, values[:, i], side="right") * stride
+        for stride, index in zip(self._extra_strides, extra):
+            rows += np.asarray(index, dtype=np.int64) * stride
+        return rows.astype(np.int32)
+
+    def decode(self, rows):
+        """Map flat row indices back to per-dimension bin indices (tuple, one entry per dimension)."""
+        return tuple(int(i) if np.ndim(i) == 0 else i for i in np.unravel_index(rows, self.shape))
+
+    def describe(self, row):
+        """Return {metric: (low_edge, high_edge)} for the bins of one flat row, for analysis tools."""
+        indices = self.decode(row)
+        return {
+            name: (float(edges[i]), float(edges[i + 1]))
+            for name, edges, i in zip(self.names, self.bin_edges, indices)
+        }
@@ -0,0 +1,193 @@
+import csv
+import os
+import sys
+import threading
+import time
+import numpy as np
+from common.transitions import read_meta, write_meta
+
+SEGMENT_PREFIX = "segment_"
+
+def record_dtype(fields):
+    """Structured little-endian dtype of [(name, dtype), ...] records, packed without padding."""
+    return np.dtype([(name, np.dtype(dtype).newbyteorder("<")) for name, dtype in fields])
+
+def segment_paths(path):
+    """Segment files of a stream log, oldest first."""
+    if not os.path.isdir(path):
+        return []
+    names = sorted(name for name in os.listdir(path) if name.startswith(SEGMENT_PREFIX) and name.endswith(".bin"))
+    return [os.path.join(path, name) for name in names]
+
+class StreamLog:
+    def __init__(self, path, fields, labels=(), segment_bytes=64 << 20, fsync_interval=5.0):
+        """
+        Append-only log of fixed-width binary records in the directory path: fields is a
+        list of (name, dtype), labels the fields holding strings, stored as int16 indices
+        into the names listed in meta.json. Every append() is written to the current
+        segment file straight away, so a crash of the process loses nothing; the file is
+        fsynced at most every fsync_interval s (and on close), which bounds what a power
+        loss can take. A new segment_<n>.bin is started once a segment would exceed
+        segment_bytes. Appending to an existing log requires the same fields. Once closed,
+        append() drops its records (counted as dropped) instead of raising.
+        """
+        self.path = path
+        self.fields = [(name, np.dtype("<i2").str if name in labels else np.dtype(dtype).str) for name, dtype in fields]
+        self.dtype = record_dtype(self.fields)
+        self.segment_bytes = max(segment_bytes, self.dtype.itemsize)
+        self.fsync_interval = fsync_interval
+        os.makedirs(path, exist_ok=True)
+        meta = {"fields": self.fields, "labels": {name: [] for name in labels}}
+        if os.path.exists(os.path.join(path, "meta.json")):
+            existing = read_meta(path)
+            if [list(field) for field in existing["fields"]] != [list(field) for field in self.fields]:
+                raise ValueError(f"Stream log {path} was recorded with other fields: {existing['fields']}")
+            meta = existing
+        else:
+            write_meta(path, meta)
+        self.meta = meta
+        self.label_index = {name: {value: i for i, value in enumerate(values)} for name, values in meta["labels"].items()}
+        self._lock = threading.Lock()
+        # Missing fields: NaN for floats, 0 otherwise
+        self._empty = np.zeros(1, dtype=self.dtype)
+        for name in self.dtype.names:
+            if self.dtype[name].kind == "f":
+                self._empty[name] = np.nan
+        self._record = self._empty.copy()
+        segments = segment_paths(path)
+        self.segment = len(segments) - 1 if segments else 0
+        self.file = None
+        self._open_segment(self.segment)
+        self.last_sync = time.monotonic()
+        self.counters = {"records": 0, "bytes": 0, "fsyncs": 0, "rotations": 0, "dropped": 0}
+
+    def _open_segment(self, number):
+        if self.file is not None:
+            self._sync()
+            self.file.close()
+        self.segment = number
+        self.file = open(os.path.join(self.path, f"{SEGMENT_PREFIX}{number:05d}.bin"), "ab")
+        # Drop a record a crash cut short, so records stay aligned
+        size = self.file.tell()
+        if size % self.dtype.itemsize:
+            self.file.truncate(size - size % self.dtype.itemsize)
+            self.file.seek(0, os.SEEK_END)
+
+    def _label(self, name, value):
+        index = self.label_index[name]
+        if value not in index:
+            index[value] = len(index)
+            self.meta["labels"][name].append(value)
+            write_meta(self.path, self.meta)
+        return index[value]
+
+    def append(self, record):
+        """
+        Append a record, a dict of field values (missing or None float fields are NaN).
+        Return False, writing nothing, if the log is closed.
+        """
+        with self._lock:
+            if self.file is None:
+                self.counters["dropped"] += 1
+                return False
+            row = self._record
+            row[:] = self._empty
+            for name, value in record.items():
+                if name in self.label_index:
+                    value = self._label(name, str(value))
+                elif value is None:
+                    value = np.nan
+                row[name] = value
+            if self.file.tell() + self.dtype.itemsize > self.segment_bytes:
+                self._open_segment(self.segment + 1)
+                self.counters["rotations"] += 1
+            self.file.write(row.tobytes())
+            self.file.flush()
+            self.counters["records"] += 1
+            self.counters["bytes"] += self.dtype.itemsize
+            if time.monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+            return True
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+        self.counters["fsyncs"] += 1
+
+    def stats(self):
+        """Records and bytes written, fsyncs, segment rotations and records dropped after close()."""
+        with self._lock:
+            return dict(self.counters, segment=self.segment)
+
+    def close(self):
+        with self._lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
+
+def load_segments(path):
+    """
+    Return (meta, [read-only record array per segment]) of a stream log, memory-mapped.
+    A record a crash left incomplete at the end of a segment is ignored.
+    """
+    meta = read_meta(path)
+    dtype = record_dtype(meta["fields"])
+    segments = []
+    for segment in segment_paths(path):
+        n = os.path.getsize(segment) // dtype.itemsize
+        if n:
+            segments.append(np.memmap(segment, dtype=dtype, mode="r", shape=(n,)))
+    return meta, segments
+
+def load_stream(path):
+    """
+    Return (meta, records) of a stream log: a structured array with one field per logged
+    field. A single segment is a memory map; several are concatenated into one copy.
+    """
+    meta, segments = load_segments(path)
+    if not segments:
+        return meta, np.empty(0, dtype=record_dtype(meta["fields"]))
+    if len(segments) == 1:
+        return meta, segments[0]
+    return meta, np.concatenate(segments)
+
+def export_csv(path, f, chunk=65536):
+    """Write a stream log to the text file f as CSV: labels as their names, NaN as an empty cell."""
+    meta, segments = load_segments(path)
+    names = [name for name, _ in meta["fields"]]
+    labels = meta["labels"]
+    writer = csv.writer(f)
+    writer.writerow(names)
+    for records in segments:
+        for start in range(0, len(records), chunk):
+            block = records[start:start + chunk]
+            columns = []
+            for name in names:
+                values = block[name].tolist()
+                if name in labels:
+                    values = [labels[name][value] for value in values]
+                elif block.dtype[name].kind == "f":
+                    values = ["" if value != value else value for value in values]
+                columns.append(values)
+            writer.writerows(zip(*columns))
+
+if __name__ == "__main__":
+    # python -m common.stream_log info <log directory>
+    # python -m common.stream_log csv <log directory> [<file.csv>]
+    if len(sys.argv) > 2 and sys.argv[1] == "info":
+        started = time.perf_counter()
+        meta, records = load_stream(sys.argv[2])
+        elapsed = time.perf_counter() - started
+        print(f"{len(records)} records of {records.dtype.itemsize} bytes in {len(segment_paths(sys.argv[2]))} "
+              f"segment(s), loaded in {elapsed * 1e3:.1f} ms")
+        print(f"Fields: {', '.join(name for name, _ in meta['fields'])}")
+    elif len(sys.argv) > 2 and sys.argv[1] == "csv":
+        if len(sys.argv) > 3:
+            with open(sys.argv[3], "w", newline="") as f:
+                export_csv(sys.argv[2], f)
+        else:
+            export_csv(sys.argv[2], sys.stdout)
+    else:
+        print("usage: python -m common.stream_log info <log directory> | csv <log directory> [<file.csv>]")
@@ -0,0 +1,249 @@
+import json
+import os
+import time
+import numpy as np
+
+# On-disk columns of a transition log: name -> (dtype, values per row, or None for one per metric)
+COLUMNS = {
+    "time": ("<f8", 1),
+    "episode": ("<i4", 1),
+    "step": ("<i4", 1),
+    "policy": ("<i1", 1),
+    "stress": ("<i1", 1),
+    "action": ("<i2", 1),
+    "reward": ("<f4", 1),
+    "metrics": ("<f4", None),
+    "next_metrics": ("<f4", None),
+    "wait_time": ("<f4", 1),
+    "step_time": ("<f4", 1),
+}
+META_FILE = "meta.json"
+
+def read_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+def write_meta(path, meta):
+    """Replace meta.json atomically, so a reader never sees half of it."""
+    tmp = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+def row_width(meta, column):
+    width = COLUMNS[column][1]
+    return len(meta["metric_names"]) if width is None else width
+
+def row_bytes(meta, column):
+    return np.dtype(meta["columns"][column]).itemsize * row_width(meta, column)
+
+def complete_rows(path, meta):
+    """Number of rows present in every column file of a log (a crash may leave some longer)."""
+    sizes = []
+    for column in meta["columns"]:
+        file_path = os.path.join(path, f"{column}.bin")
+        sizes.append(os.path.getsize(file_path) // row_bytes(meta, column) if os.path.exists(file_path) else 0)
+    return min(sizes)
+
+class TransitionLog:
+    def __init__(self, path, metric_names, actions, stresses=(), policy="train", flush_every=1):
+        """
+        Append-only columnar log of the transitions of live runs, one raw little-endian file
+        per column (<column>.bin) in the directory path, described by meta.json.
+        metric_names orders the raw metrics of each row; actions and stresses name the
+        action and stress indices. Appending to an existing log requires the same names.
+        Rows are written every flush_every transitions (default: each one, as live steps
+        take seconds) and on close(). Column files a crash left at different lengths are
+        truncated to their common row count on open, so appended rows stay aligned.
+        """
+        self.path = path
+        self.flush_every = flush_every
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            "metric_names": list(metric_names),
+            "actions": list(actions),
+            "stresses": list(stresses),
+            "policies": [],
+            "columns": {name: dtype for name, (dtype, _) in COLUMNS.items()},
+        }
+        if os.path.exists(os.path.join(path, META_FILE)):
+            existing = read_meta(path)
+            for key in ("metric_names", "actions", "stresses", "columns"):
+                if existing[key] != meta[key]:
+                    raise ValueError(f"Transition log {path} was recorded with other {key}: {existing[key]}")
+            meta = existing
+        if policy not in meta["policies"]:
+            meta["policies"].append(policy)
+            write_meta(path, meta)
+        self.meta = meta
+        self.policy = meta["policies"].index(policy)
+        self.stress_index = {name: i for i, name in enumerate(meta["stresses"])}
+        rows = complete_rows(path, meta)
+        self.files = {}
+        for name in COLUMNS:
+            f = open(os.path.join(path, f"{name}.bin"), "ab")
+            if f.tell() != rows * row_bytes(meta, name):
+                f.truncate(rows * row_bytes(meta, name))
+                f.seek(0, os.SEEK_END)
+            self.files[name] = f
+        self.pending = []
+
+    def _metric_row(self, metrics):
+        """Raw metric values in metric_names order, from a dict (missing/None -> NaN) or a sequence."""
+        if isinstance(metrics, dict):
+            metrics = [metrics.get(name) for name in self.meta["metric_names"]]
+        return [np.nan if value is None else value for value in metrics]
+
+    def record(self, metrics, action, next_metrics, reward, stress=None, episode=0, step=0,
+               wait_time=0.0, step_time=0.0):
+        """
+        Log one transition: raw metrics before the action, the action index, raw metrics after
+        it and the reward, with the stress running (a name of stresses, or None), the seconds
+        spent waiting for the system (settling, load tests) and the whole step duration.
+        """
+        self.pending.append((
+            time.time(),
+            episode, step, self.policy, self.stress_index.get(stress, -1), action, reward,
+            self._metric_row(metrics), self._metric_row(next_metrics), wait_time, step_time,
+        ))
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows, one contiguous block per column."""
+        if not self.pending:
+            return
+        for column, values in zip(COLUMNS, zip(*self.pending)):
+            self.files[column].write(np.asarray(values, dtype=COLUMNS[column][0]).tobytes())
+        for f in self.files.values():
+            f.flush()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+def load_transitions(path):
+    """
+    Return (meta, {column: read-only array}) of a transition log, memory-mapped. Rows a
+    crash left incomplete in some column are ignored.
+    """
+    meta = read_meta(path)
+    n = complete_rows(path, meta)
+    columns = {}
+    for column, dtype in meta["columns"].items():
+        width = row_width(meta, column)
+        if n == 0:
+            array = np.empty((0, width) if COLUMNS[column][1] is None else 0, dtype=dtype)
+        else:
+            array = np.memmap(os.path.join(path, f"{column}.bin"), dtype=dtype, mode="r", shape=(n * width,))
+            if COLUMNS[column][1] is None:
+                array = array.reshape(n, width)
+        columns[column] = array
+    return meta, columns
+
+class ReplayEnv:
+    def __init__(self, path, seed=None):
+        """
+        Offline environment over a transition log: replays the recorded transitions in
+        batches, bootstraps them, or steps a model that resamples the recorded outcomes of
+        (state, action) pairs, so Q-tables can be trained without touching the system.
+        """
+        self.meta, self.columns = load_transitions(path)
+        self.metric_names = self.meta["metric_names"]
+        self.actions = self.meta["actions"]
+        self.stresses = self.meta["stresses"]
+        self.rng = np.random.default_rng(seed)
+        self.states = None
+        self.next_states = None
+        self._outcomes = None
+
+    def __len__(self):
+        return len(self.columns["action"])
+
+    def transition(self, i):
+        """Transition i as a dict with metrics / next_metrics dicts and the stress name (or None)."""
+        stress = int(self.columns["stress"][i])
+        return {
+            "metrics": dict(zip(self.metric_names, self.columns["metrics"][i].tolist())),
+            "next_metrics": dict(zip(self.metric_names, self.columns["next_metrics"][i].tolist())),
+            "stress": self.stresses[stress] if stress >= 0 else None,
+            "action": int(self.columns["action"][i]),
+            "reward": float(self.columns["reward"][i]),
+            "episode": int(self.columns["episode"][i]),
+            "step": int(self.columns["step"][i]),
+            "policy": self.meta["policies"][self.columns["policy"][i]],
+        }
+
+    def encode(self, state_index):
+        """
+        Map every transition to Q-table rows with state_index(metrics dict, stress name),
+        e.g. the agent's own normalization and encoder. Returns (states, next_states).
+        """
+        states = np.empty(len(self), dtype=np.intp)
+        next_states = np.empty(len(self), dtype=np.intp)
+        for i in range(len(self)):
+            t = self.transition(i)
+            states[i] = state_index(t["metrics"], t["stress"])
+            next_states[i] = state_index(t["next_metrics"], t["stress"])
+        self.states, self.next_states = states, next_states
+        self._outcomes = None
+        return states, next_states
+
+    def rewards(self, reward_fn=None):
+        """Recorded rewards, or reward_fn(transition dict) recomputed for every transition."""
+        if reward_fn is None:
+            return np.asarray(self.columns["reward"], dtype=np.float64)
+        return np.array([reward_fn(self.transition(i)) for i in range(len(self))], dtype=np.float64)
+
+    def batches(self, batch_size=256, shuffle=True):
+        """Index arrays covering every transition once, in recorded or shuffled order."""
+        order = self.rng.permutation(len(self)) if shuffle else np.arange(len(self))
+        for start in range(0, len(order), batch_size):
+            yield order[start:start + batch_size]
+
+    def resample(self, size):
+        """Indices of size transitions drawn with replacement (a bootstrap of the log)."""
+        return self.rng.integers(0, len(self), size=size)
+
+    def reset(self):
+        """Q-table row of a recorded episode start, drawn at random (requires encode())."""
+        starts = np.flatnonzero(np.asarray(self.columns["step"]) == 0)
+        starts = starts if len(starts) else np.arange(len(self))
+        return int(self.states[self.rng.choice(starts)])
+
+    def step(self, state, action):
+        """
+        Resample a recorded outcome of taking action in state (a Q-table row, requires
+        encode()). Return the transition index, or None if that pair was never observed.
+        """
+        if self._outcomes is None:
+            keys = self.states * len(self.actions) + np.asarray(self.columns["action"], dtype=np.intp)
+            order = np.argsort(keys, kind="stable")
+            unique, first, counts = np.unique(keys[order], return_index=True, return_counts=True)
+            self._outcomes = (order, dict(zip(unique.tolist(), zip(first.tolist(), counts.tolist()))))
+        order, index = self._outcomes
+        found = index.get(state * len(self.actions) + action)
+        if found is None:
+            return None
+        first, count = found
+        return int(order[first + self.rng.integers(count)])
+
+    def train(self, agent, state_index, reward_fn=None, epochs=10, batch_size=256, mode="sequential"):
+        """
+        Fit agent's Q-table on the log with its learning rate and discount factor: epochs
+        passes of shuffled batches through agent.learn_batch. Return the mean |TD error| of
+        every epoch.
+        """
+        states, next_states = self.encode(state_index)
+        actions = np.asarray(self.columns["action"], dtype=np.intp)
+        rewards = self.rewards(reward_fn)
+        errors = []
+        for _ in range(epochs):
+            total = 0.0
+            for batch in self.batches(batch_size):
+                td_error = agent.learn_batch(states[batch], actions[batch], rewards[batch], next_states[batch], mode=mode)
+                total += np.abs(td_error).sum()
+            errors.append(float(total / max(len(self), 1)))
+        return errors
@@ -0,0 +1,204 @@
+import glob
+import os
+import time
+from common.tuning_helper import HelperError, run_privileged
+
+SYSCTL_ROOT = "/proc/sys"
+CPU_GOVERNOR = "/sys/devices/system/cpu/cpu0/cpufreq/scaling_governor"
+ZSWAP_ENABLED = "/sys/module/zswap/parameters/enabled"
+DROP_CACHES = "vm.drop_caches"
+
+# Every sysctl an agent action or reset may write
+TUNABLE_SYSCTLS = (
+    "vm.dirty_ratio",
+    "vm.swappiness",
+    "net.core.rmem_max",
+    "net.core.wmem_max",
+    "net.core.somaxconn",
+    "net.ipv4.tcp_tw_reuse",
+    "net.ipv4.tcp_fin_timeout",
+)
+
+def sysctl_path(key):
+    """Map a sysctl name (vm.dirty_ratio) or a /proc or /sys path to the file to write."""
+    if key.startswith("/"):
+        return key
+    return os.path.join(SYSCTL_ROOT, *key.split("."))
+
+def read_ahead_path(device):
+    """
+    read_ahead_kb file of the disk holding device (e.g. /dev/sda1 -> /sys/block/sda).
+    blockdev --setra N sets N 512-byte sectors, i.e. N / 2 in read_ahead_kb.
+    """
+    name = os.path.basename(os.path.realpath(device))
+    block = os.path.realpath(os.path.join("/sys/class/block", name))
+    if os.path.exists(os.path.join(block, "partition")):
+        block = os.path.dirname(block)
+    return os.path.join(block, "queue", "read_ahead_kb")
+
+def tunable_keys():
+    """
+    Every knob the agents can change on this system: TUNABLE_SYSCTLS, the governor of
+    every CPU, zswap and the read-ahead of every disk (keyed like read_ahead_path).
+    """
+    keys = list(TUNABLE_SYSCTLS)
+    keys += sorted(glob.glob("/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_governor"))
+    keys.append(ZSWAP_ENABLED)
+    keys += sorted(os.path.realpath(path) for path in glob.glob("/sys/block/*/queue/read_ahead_kb"))
+    return keys
+
+# Boolean module parameters (zswap enabled) read back as Y/N but are written as 1/0
+BOOLEAN_VALUES = {"Y": "1", "N": "0"}
+
+def normalize(value):
+    """Compare values the way the kernel prints them (multi-value sysctls use tabs)."""
+    value = " ".join(str(value).split())
+    return BOOLEAN_VALUES.get(value, value)
+
+class Tunables:
+    def __init__(self, privileged=True):
+        """
+        Write sysctl and sysfs tunables directly instead of forking sudo sysctl / sh -c echo.
+
+        Keys are sysctl names (vm.dirty_ratio) or absolute /proc or /sys paths. The last value
+        read or written for each key is cached, so writes that would change nothing are
+        skipped. Writes this process is not allowed to do are pipelined to the privileged
+        tuning helper (common/tuning_helper.py) when privileged is True.
+        """
+        self.privileged = privileged
+        self.cache = {}
+        # Latency in seconds of every write, per key, as (count, total, max)
+        self.latency = {}
+
+    def read(self, key, refresh=False):
+        """Return the current value of a tunable as a string, or None if it cannot be read."""
+        if not refresh and key in self.cache:
+            return self.cache[key]
+        try:
+            with open(sysctl_path(key)) as f:
+                value = normalize(f.read())
+        except OSError as e:
+            print(f"Error reading {key}: {e}")
+            self.cache.pop(key, None)
+            return None
+        self.cache[key] = value
+        return value
+
+    def invalidate(self, keys=None):
+        """Forget cached values (all, or some keys) after something else changed them."""
+        if keys is None:
+            self.cache.clear()
+        else:
+            for key in keys:
+                self.cache.pop(key, None)
+
+    def apply(self, settings, force=False):
+        """
+        Apply a {key: value} configuration in one call and return {key: latency in seconds}
+        for the keys actually written. Keys already at their value are skipped unless force
+        (for write-only triggers such as vm.drop_caches).
+        """
+        latencies = {}
+        denied = []
+        for key, value in settings.items():
+            value = normalize(value)
+            if not force and self.read(key) == value:
+                continue
+            start = time.perf_counter()
+            try:
+                with open(sysctl_path(key), "w") as f:
+                    f.write(value)
+            except PermissionError:
+                denied.append((key, value))
+                continue
+            except OSError as e:
+                print(f"Error writing {key}={value}: {e}")
+                self.cache.pop(key, None)
+                continue
+            latencies[key] = time.perf_counter() - start
+            self.cache[key] = value
+
+        if denied:
+            latencies.update(self._apply_privileged(denied))
+        for key, latency in latencies.items():
+            count, total, worst = self.latency.get(key, (0, 0.0, 0.0))
+            self.latency[key] = (count + 1, total + latency, max(worst, latency))
+        return latencies
+
+    def _apply_privileged(self, denied):
+        """
+        Pipeline every denied write through the tuning helper (or one sudo call without it).
+        Each write is charged the whole round trip.
+        """
+        if not self.privileged:
+            for key, value in denied:
+                print(f"Error writing {key}={value}: permission denied")
+            return {}
+        start = time.perf_counter()
+        results = run_privileged([("write", sysctl_path(key), value) for key, value in denied])
+        elapsed = time.perf_counter() - start
+        latencies = {}
+        for (key, value), result in zip(denied, results):
+            if isinstance(result, HelperError):
+                self.cache.pop(key, None)
+            else:
+                self.cache[key] = value
+                latencies[key] = elapsed
+        return latencies
+
+    def snapshot(self, keys=None):
+        """
+        Read the live value of every tunable of keys (default: tunable_keys()) in one pass
+        and return them as a {key: value} configuration. Keys missing here are left out.
+        """
+        snapshot = {}
+        for key in tunable_keys() if keys is None else keys:
+            if not os.path.exists(sysctl_path(key)):
+                continue
+            value = self.read(key, refresh=True)
+            if value is not None:
+                snapshot[key] = value
+        return snapshot
+
+    def restore(self, snapshot):
+        """
+        Bring the system back to a snapshot (or any {key: value} configuration), diffing it
+        against the live values rather than the cache: only tunables that changed, whoever
+        changed them, are written. Return {key: latency in seconds} of those writes.
+        """
+        self.invalidate(snapshot)
+        return self.apply(snapshot)
+
+    def set(self, key, value, force=False):
+        """Apply a single tunable. Return its write latency in seconds, or None if skipped."""
+        return self.apply({key: value}, force=force).get(key)
+
+    def latency_report(self):
+        """Print the number of writes and mean / max latency of every tunable written so far."""
+        for key, (count, total, worst) in sorted(self.latency.items()):
+            print(f"{key}: {count} writes, mean {1000 * total / count:.3f} ms, max {1000 * worst:.3f} ms")
+
+# Shared by every agent of a process so that the skip-unchanged cache sees all writes
+_shared = None
+
+def shared_tunables():
+    """Return the process-wide Tunables instance."""
+    global _shared
+    if _shared is None:
+        _shared = Tunables()
+    return _shared
+
+if __name__ == "__main__":
+    tunables = shared_tunables()
+    start = time.perf_counter()
+    snapshot = tunables.snapshot()
+    print(f"Snapshot of {len(snapshot)} tunables took {1000 * (time.perf_counter() - start):.3f} ms")
+    start = time.perf_counter()
+    tunables.restore(snapshot)
+    print(f"Restoring an unchanged snapshot took {1000 * (time.perf_counter() - start):.3f} ms")
+    keys = ["vm.dirty_ratio", "vm.swappiness", "net.core.somaxconn", CPU_GOVERNOR, ZSWAP_ENABLED]
+    current = {key: tunables.read(key) for key in keys}
+    print(current)
+    start = time.perf_counter()
+    tunables.apply({key: value for key, value in current.items() if value is not None})
+    print(f"Re-applying the current configuration took {1000 * (time.perf_counter() - start):.3f} ms")
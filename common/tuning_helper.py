@@ -0,0 +1,320 @@
+import fnmatch
+import os
+import re
+import shlex
+import shutil
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+# Started once with privileges, e.g. `sudo python common/tuning_helper.py`; agents connect to it
+SOCKET_PATH = os.environ.get("RL_TUNING_SOCKET", "/run/rl_tuning.sock")
+
+# Files the helper may write (matched after resolving symlinks)
+ALLOWED_WRITES = (
+    "/proc/sys/vm/dirty_ratio",
+    "/proc/sys/vm/swappiness",
+    "/proc/sys/vm/drop_caches",
+    "/proc/sys/net/core/rmem_max",
+    "/proc/sys/net/core/wmem_max",
+    "/proc/sys/net/core/somaxconn",
+    "/proc/sys/net/ipv4/tcp_tw_reuse",
+    "/proc/sys/net/ipv4/tcp_fin_timeout",
+    "/sys/devices/system/cpu/cpu*/cpufreq/scaling_governor",
+    "/sys/module/zswap/parameters/enabled",
+    "/sys/devices/*/queue/read_ahead_kb",
+)
+# pkill -f patterns used by the reaction actions and resets
+ALLOWED_KILLS = ("stress-ng", "stress-ng --io", "stress", "yes", "vlc", "iperf3", "wrk", "glxgears", "ping")
+# pgrep patterns whose processes may be reniced
+ALLOWED_RENICE = ("stress",)
+ALLOWED_TRUNCATE = ("/var/log/nginx/access.log",)
+ALLOWED_RESTART = ("nginx",)
+
+class HelperError(Exception):
+    pass
+
+def allowed_path(path):
+    """Resolve path and check it against ALLOWED_WRITES."""
+    real = os.path.realpath(path)
+    if not any(fnmatch.fnmatchcase(real, pattern) for pattern in ALLOWED_WRITES):
+        raise HelperError(f"not allowed: {path}")
+    return real
+
+def matching_pids(pattern, full=True):
+    """Pids whose command line (full=True, pkill -f) or name (pgrep) matches pattern."""
+    regex = re.compile(pattern)
+    own = os.getpid()
+    pids = []
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit() or int(entry.name) == own:
+            continue
+        try:
+            if full:
+                with open(f"/proc/{entry.name}/cmdline", "rb") as f:
+                    text = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+            else:
+                with open(f"/proc/{entry.name}/comm") as f:
+                    text = f.read().strip()
+        except OSError:
+            continue
+        if text and regex.search(text):
+            pids.append(int(entry.name))
+    return pids
+
+def op_write(path, value):
+    with open(allowed_path(path), "w") as f:
+        f.write(value)
+    return ""
+
+def op_read(path):
+    with open(allowed_path(path)) as f:
+        return " ".join(f.read().split())
+
+def op_pkill(pattern):
+    if pattern not in ALLOWED_KILLS:
+        raise HelperError(f"not allowed: pkill {pattern}")
+    killed = 0
+    for pid in matching_pids(re.escape(pattern)):
+        try:
+            os.kill(pid, signal.SIGTERM)
+            killed += 1
+        except ProcessLookupError:
+            pass
+    return str(killed)
+
+def op_renice(increment, pattern):
+    increment = int(increment)
+    if pattern not in ALLOWED_RENICE or not 0 <= increment <= 19:
+        raise HelperError(f"not allowed: renice {increment} {pattern}")
+    reniced = 0
+    for pid in matching_pids(re.escape(pattern), full=False):
+        try:
+            priority = os.getpriority(os.PRIO_PROCESS, pid)
+            os.setpriority(os.PRIO_PROCESS, pid, min(19, priority + increment))
+            reniced += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return str(reniced)
+
+def op_clean_tmp():
+    """Remove the content of /tmp (sudo rm -rf /tmp/*), keeping dot files as the glob did."""
+    for entry in os.scandir("/tmp"):
+        if entry.name.startswith("."):
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.unlink(entry.path)
+        except OSError:
+            pass
+    return ""
+
+def op_truncate(path):
+    if path not in ALLOWED_TRUNCATE:
+        raise HelperError(f"not allowed: truncate {path}")
+    os.truncate(path, 0)
+    return ""
+
+def op_restart(service):
+    if service not in ALLOWED_RESTART:
+        raise HelperError(f"not allowed: restart {service}")
+    subprocess.run(["systemctl", "restart", service], check=True)
+    return ""
+
+OPERATIONS = {
+    "write": op_write,
+    "read": op_read,
+    "pkill": op_pkill,
+    "renice": op_renice,
+    "clean_tmp": op_clean_tmp,
+    "truncate": op_truncate,
+    "restart": op_restart,
+}
+
+def execute(line):
+    """Run one request line ("op\\targ\\t...") and return its response line."""
+    op, *args = line.split("\t")
+    try:
+        if op not in OPERATIONS:
+            raise HelperError(f"unknown operation: {op}")
+        return "ok\t" + OPERATIONS[op](*args)
+    except (HelperError, OSError, ValueError, TypeError, subprocess.CalledProcessError) as e:
+        return "err\t" + " ".join(str(e).split())
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        """
+        Serve pipelined requests: every complete line received is executed in order and
+        the responses to one recv are sent back together.
+        """
+        if not self.server.peer_allowed(self.request):
+            return
+        pending = b""
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            *lines, pending = (pending + data).split(b"\n")
+            if lines:
+                responses = [execute(line.decode()) for line in lines]
+                self.request.sendall(("\n".join(responses) + "\n").encode())
+
+class TuningHelperServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET_PATH, owner=None):
+        """
+        Listen on a Unix socket only root and owner (default: the user who ran sudo) may use.
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, RequestHandler)
+        self.owner = int(os.environ.get("SUDO_UID", os.getuid())) if owner is None else owner
+        os.chown(path, self.owner, -1)
+        os.chmod(path, 0o600)
+
+    def peer_allowed(self, connection):
+        creds = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", creds)
+        return uid in (0, self.owner)
+
+class HelperClient:
+    def __init__(self, path=SOCKET_PATH):
+        """Persistent connection to the tuning helper, shareable between threads."""
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile("r")
+        # A pipeline's requests and responses must not interleave with another thread's
+        self.lock = threading.Lock()
+
+    def pipeline(self, requests):
+        """
+        Send every (op, *args) request at once and return their results in order.
+        A failed request gives a HelperError in its place instead of raising; a lost
+        connection (helper stopped or restarted) raises ConnectionError.
+        """
+        if not requests:
+            return []
+        payload = "".join("\t".join(str(x) for x in request) + "\n" for request in requests)
+        with self.lock:
+            self.sock.sendall(payload.encode())
+            results = []
+            for _ in requests:
+                line = self.rfile.readline()
+                if not line:
+                    raise ConnectionError("tuning helper closed the connection")
+                status, _, result = line.rstrip("\n").partition("\t")
+                results.append(result if status == "ok" else HelperError(result))
+        return results
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+class SudoClient:
+    """Same interface as HelperClient when no helper runs: one sudo sh -c per pipeline."""
+
+    COMMANDS = {
+        "write": lambda path, value: f"printf '%s\\n' {shlex.quote(str(value))} > {shlex.quote(path)}",
+        "pkill": lambda pattern: f"pkill -f {shlex.quote(pattern)}",
+        "renice": lambda increment, pattern: f"renice +{int(increment)} -p $(pgrep {shlex.quote(pattern)})",
+        "clean_tmp": lambda: "rm -rf /tmp/*",
+        "truncate": lambda path: f"truncate -s 0 {shlex.quote(path)}",
+        "restart": lambda service: f"systemctl restart {shlex.quote(service)}",
+    }
+
+    def pipeline(self, requests):
+        if not requests:
+            return []
+        script = "; ".join(self.COMMANDS[op](*args) for op, *args in requests)
+        result = subprocess.run(["sudo", "sh", "-c", script])
+        if result.returncode != 0:
+            return [HelperError(f"sudo exited with {result.returncode}")] * len(requests)
+        return [""] * len(requests)
+
+    def close(self):
+        pass
+
+_client = None
+_client_lock = threading.Lock()
+
+def privileged_client():
+    """
+    Return the process-wide connection to the tuning helper, or a SudoClient falling back
+    to sudo when the helper is not running.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                _client = HelperClient()
+            except OSError:
+                print(f"Tuning helper not found at {SOCKET_PATH}, falling back to sudo.")
+                _client = SudoClient()
+        return _client
+
+def drop_client(client):
+    """Close client and forget it if it is still the process-wide one, so the next call reconnects."""
+    global _client
+    with _client_lock:
+        if _client is client:
+            _client = None
+    try:
+        client.close()
+    except OSError:
+        pass
+
+def run_privileged(requests):
+    """
+    Pipeline (op, *args) requests through privileged_client(), printing failures. If the
+    connection to the helper is lost, reconnect (or fall back to sudo) and retry once.
+    """
+    client = privileged_client()
+    try:
+        results = client.pipeline(requests)
+    except OSError as e:
+        print(f"Lost the tuning helper connection ({e}), reconnecting.")
+        drop_client(client)
+        results = privileged_client().pipeline(requests)
+    for request, result in zip(requests, results):
+        if isinstance(result, HelperError):
+            print(f"Error running {request[0]} {' '.join(map(str, request[1:]))}: {result}")
+    return results
+
+def benchmark(num_requests=1000):
+    """Round-trip latency of a helper read, pipelined and not, against one sudo sysctl process."""
+    client = HelperClient()
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        client.pipeline([("read", "/proc/sys/vm/swappiness")])
+    single = (time.perf_counter() - start) / num_requests
+    start = time.perf_counter()
+    client.pipeline([("read", "/proc/sys/vm/swappiness")] * num_requests)
+    pipelined = (time.perf_counter() - start) / num_requests
+    command = (["sudo"] if shutil.which("sudo") else []) + ["sysctl", "-n", "vm.swappiness"]
+    start = time.perf_counter()
+    subprocess.run(command, stdout=subprocess.DEVNULL)
+    spawn = time.perf_counter() - start
+    print(f"helper: {single * 1e3:.3f} ms/request, pipelined: {pipelined * 1e3:.3f} ms/request, "
+          f"{' '.join(command[:2])}: {spawn * 1e3:.1f} ms")
+    client.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark()
+    else:
+        if os.geteuid() != 0:
+            sys.exit("The tuning helper must be started as root (sudo python common/tuning_helper.py).")
+        server = TuningHelperServer()
+        print(f"Tuning helper listening on {SOCKET_PATH} for uid {server.owner}")
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(SOCKET_PATH)
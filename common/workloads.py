@@ -0,0 +1,326 @@
+import mmap
+import multiprocessing as mp
+import os
+import socket
+import threading
+import time
+
+DEFAULT_DURATION = 8.0
+BLOCK_SIZE = 1 << 20
+
+# Workloads started and not stopped yet, so that clean_resources and the reactions can reach them
+_running = []
+_running_lock = threading.Lock()
+
+def _cpu_worker(deadline, stop, ready, counter, intensity, slice_s=0.1):
+    """Spin for intensity of every slice_s seconds; counts the CPU seconds actually used."""
+    ready.wait()
+    while not stop.is_set() and time.monotonic() < deadline:
+        used = time.process_time()
+        busy_until = time.perf_counter() + slice_s * intensity
+        while time.perf_counter() < busy_until:
+            pass
+        with counter.get_lock():
+            counter.value += time.process_time() - used
+        if intensity < 1:
+            stop.wait(slice_s * (1 - intensity))
+
+def _memory_worker(deadline, stop, ready, counter, size, pageout):
+    """Touch every page of an anonymous mapping in a loop; counts bytes touched."""
+    buffer = mmap.mmap(-1, size)
+    page = mmap.PAGESIZE
+    ready.wait()
+    value = 0
+    while not stop.is_set() and time.monotonic() < deadline:
+        value = (value + 1) % 256
+        for offset in range(0, size, page):
+            buffer[offset] = value
+        with counter.get_lock():
+            counter.value += size
+        if pageout and hasattr(mmap, "MADV_PAGEOUT"):
+            # Push the pages to swap so the next pass faults them back in
+            buffer.madvise(mmap.MADV_PAGEOUT)
+    buffer.close()
+
+def _open_for_writes(path, direct):
+    """Open path for writing, with O_DIRECT when asked and the filesystem supports it."""
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    if direct and hasattr(os, "O_DIRECT"):
+        try:
+            return os.open(path, flags | os.O_DIRECT, 0o644)
+        except OSError:
+            # tmpfs and some filesystems reject O_DIRECT
+            pass
+    return os.open(path, flags, 0o644)
+
+def _disk_worker(deadline, stop, ready, counter, path, size, direct, repeat):
+    """
+    Write size bytes of zeros to path (like dd), then stop, or rewrite them until the
+    deadline when repeat (like stress-ng --hdd). Counts bytes written.
+    """
+    # mmap memory is page aligned, as O_DIRECT requires
+    block = mmap.mmap(-1, BLOCK_SIZE)
+    fd = _open_for_writes(path, direct)
+    ready.wait()
+    written = 0
+    try:
+        while not stop.is_set() and time.monotonic() < deadline:
+            try:
+                n = os.write(fd, block)
+            except OSError:
+                # e.g. ENOSPC: the disk is as full as it gets
+                break
+            written += n
+            with counter.get_lock():
+                counter.value += n
+            if written >= size:
+                os.fsync(fd)
+                if not repeat:
+                    break
+                os.lseek(fd, 0, os.SEEK_SET)
+                written = 0
+    finally:
+        os.close(fd)
+        block.close()
+        if repeat:
+            os.unlink(path)
+
+def _net_receiver(deadline, stop, ready, counter, listener):
+    """Accept the sender on the loopback listener and drain it; counts bytes received."""
+    ready.wait()
+    listener.settimeout(5)
+    connection, _ = listener.accept()
+    connection.settimeout(0.5)
+    buffer = bytearray(BLOCK_SIZE)
+    with connection:
+        while not stop.is_set() and time.monotonic() < deadline:
+            try:
+                n = connection.recv_into(buffer)
+            except socket.timeout:
+                continue
+            if n == 0:
+                break
+            with counter.get_lock():
+                counter.value += n
+
+def _net_sender(deadline, stop, ready, counter, port, rate):
+    """Send to the receiver over TCP loopback, at most rate bytes/s if given."""
+    chunk = bytes(64 * 1024)
+    ready.wait()
+    start = time.monotonic()
+    sent = 0
+    with socket.create_connection(("127.0.0.1", port)) as connection:
+        connection.settimeout(0.5)
+        while not stop.is_set() and time.monotonic() < deadline:
+            if rate is not None:
+                ahead = sent / rate - (time.monotonic() - start)
+                if ahead > 0:
+                    stop.wait(ahead)
+                    continue
+            try:
+                sent += connection.send(chunk)
+            except socket.timeout:
+                continue
+            with counter.get_lock():
+                counter.value = sent
+
+def _run_worker(target, deadline, stop, ready, counter, *args):
+    """Run a worker; if it fails, break the start barrier so the parent does not wait for it."""
+    try:
+        target(deadline, stop, ready, counter, *args)
+    except threading.BrokenBarrierError:
+        # Another worker failed, or the parent gave up: nothing to report
+        pass
+    except BaseException:
+        ready.abort()
+        raise
+
+class Workload:
+    def __init__(self, name, specs, duration=DEFAULT_DURATION):
+        """
+        A set of worker processes generating load for at most duration seconds.
+        specs is a list of (worker function, args, metric, scale): each worker gets its own
+        counter, and report() divides the sum of a metric's counters by scale and elapsed time.
+        """
+        self.name = name
+        self.specs = specs
+        self.duration = duration
+        self.processes = []
+        self.counters = []
+        self.started = None
+        self.stopped = None
+        self.error = None
+
+    def start(self):
+        """
+        Start every worker and return once all of them are ready to generate load. If a
+        worker fails to set up (e.g. its file cannot be created) or they are not ready
+        within 30 s, every worker is stopped and the workload is returned already stopped,
+        with error set and a report of the load achieved, none.
+        """
+        ready = mp.Barrier(len(self.specs) + 1)
+        self.stop_event = mp.Event()
+        self.started = time.monotonic()
+        deadline = self.started + self.duration + 5
+        try:
+            for target, args, _, _ in self.specs:
+                counter = mp.Value("d", 0.0)
+                self.counters.append(counter)
+                process = mp.Process(target=_run_worker, daemon=True,
+                                     args=(target, deadline, self.stop_event, ready, counter) + args)
+                process.start()
+                self.processes.append(process)
+                # The workers own their copy of sockets such as the loopback listener
+                for arg in args:
+                    if isinstance(arg, socket.socket):
+                        arg.close()
+            ready.wait(timeout=30)
+        except (threading.BrokenBarrierError, OSError) as e:
+            ready.abort()
+            self.error = e if isinstance(e, OSError) else RuntimeError("a worker failed to set up or start in time")
+            print(f"Workload {self.name} failed to start: {self.error}")
+            self.started = self.deadline = time.monotonic()
+            self._stop_workers()
+            self.stopped = self.started
+            return self
+        # The load starts now; workers were given 5 s of slack to get ready
+        self.started = time.monotonic()
+        self.deadline = self.started + self.duration
+        with _running_lock:
+            _running.append(self)
+        return self
+
+    def pids(self):
+        """Pids of the workers still alive."""
+        return [p.pid for p in self.processes if p.is_alive()]
+
+    def has_metric(self, metric):
+        """Whether a worker of this workload reports metric, e.g. "disk_MB/s"."""
+        return any(spec_metric == metric for _, _, spec_metric, _ in self.specs)
+
+    def poll(self):
+        """None while some worker still runs, like subprocess.Popen.poll."""
+        return None if any(p.is_alive() for p in self.processes) else 0
+
+    def wait(self):
+        """Wait for the end of the workload (its duration, or all workers done) and return report()."""
+        for process in self.processes:
+            process.join(max(0.0, self.deadline - time.monotonic()))
+        return self.terminate()
+
+    def terminate(self):
+        """Stop every worker now and return report()."""
+        if self.stopped is None:
+            self._stop_workers()
+            self.stopped = time.monotonic()
+            with _running_lock:
+                if self in _running:
+                    _running.remove(self)
+        return self.report()
+
+    def _stop_workers(self):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    def report(self):
+        """
+        Return the load actually achieved: {metric: value} averaged over the elapsed time,
+        e.g. {"cpu_cores": 1.98} or {"disk_MB/s": 412.0}, plus "elapsed" in seconds.
+        """
+        elapsed = (self.stopped or time.monotonic()) - self.started
+        report = {"elapsed": round(elapsed, 2)}
+        for (_, _, metric, scale), counter in zip(self.specs, self.counters):
+            report[metric] = report.get(metric, 0.0) + counter.value / scale
+        for metric in report:
+            if metric != "elapsed":
+                report[metric] = round(report[metric] / max(elapsed, 1e-9), 2)
+        return report
+
+def cpu_specs(workers, intensity):
+    return [(_cpu_worker, (intensity,), "cpu_cores", 1.0)] * workers
+
+def memory_specs(workers, size_mb, pageout=False):
+    return [(_memory_worker, (int(size_mb) << 20, pageout), "memory_touched_MB/s", 1e6)] * workers
+
+def disk_specs(paths, size_mb, direct=True, repeat=False):
+    return [(_disk_worker, (path, int(size_mb) << 20, direct, repeat), "disk_MB/s", 1e6) for path in paths]
+
+def network_specs(rate=None):
+    """A loopback TCP sender/receiver pair (the listener is created here and inherited)."""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    return [
+        (_net_receiver, (listener,), "network_MB/s", 1e6),
+        (_net_sender, (port, rate), "network_sent_MB/s", 1e6),
+    ]
+
+# Builders of the negative actions, with the sizes of the stress-ng/dd/iperf3/vlc commands they
+# replace at intensity 1. intensity scales the duty cycle, the size or the rate.
+WORKLOADS = {
+    "simulate_cpu_stress": lambda i: cpu_specs(2, i),
+    "simulate_memory_stress": lambda i: memory_specs(2, 1024 * i),
+    "simulate_disk_fill": lambda i: disk_specs(["/tmp/fillfile"], 2048 * i),
+    "simulate_disk_latency": lambda i: disk_specs(["/tmp/rl_hdd_0", "/tmp/rl_hdd_1"], 1024 * i, repeat=True),
+    "stress_tmpfs": lambda i: disk_specs(["/dev/shm/tmpfs_stress"], 1024 * i, direct=False),
+    # Decoding (one core at half duty) plus a ~8 Mbit/s stream
+    "play_streaming_video": lambda i: cpu_specs(1, 0.5 * i) + network_specs(1e6 * i),
+    "simulate_network_stress": lambda i: network_specs(None if i >= 1 else 1e9 * i),
+    "simulate_swap_stress": lambda i: memory_specs(2, 512 * i, pageout=True),
+    "simulate_high_load": lambda i: cpu_specs(1, i),
+    "simulate_temp_increase": lambda i: cpu_specs(4, i),
+}
+
+def start_workload(action, intensity=1.0, duration=DEFAULT_DURATION):
+    """
+    Start the workload of a negative action and return it (None for no_op or unknown
+    actions). Its wait() / terminate() return the load actually achieved.
+    """
+    if action not in WORKLOADS:
+        return None
+    return Workload(action, WORKLOADS[action](intensity), duration).start()
+
+def running_workloads(metric=None):
+    """Workloads still running, only those with a worker reporting metric if given."""
+    with _running_lock:
+        workloads = list(_running)
+    return [w for w in workloads if metric is None or w.has_metric(metric)]
+
+def stop_all_workloads(metric=None):
+    """
+    Stop every workload still running (only those with a worker reporting metric if given,
+    e.g. "disk_MB/s" for the I/O ones) and return how many were stopped.
+    """
+    workloads = running_workloads(metric)
+    for workload in workloads:
+        workload.terminate()
+    return len(workloads)
+
+def renice_workloads(increment):
+    """
+    Lower the priority of every running worker by increment (renice +increment), capped
+    at 19. The workers are our children, so this needs no privileges. Return how many.
+    """
+    reniced = 0
+    for workload in running_workloads():
+        for pid in workload.pids():
+            try:
+                priority = os.getpriority(os.PRIO_PROCESS, pid)
+                os.setpriority(os.PRIO_PROCESS, pid, min(19, priority + increment))
+                reniced += 1
+            except (ProcessLookupError, PermissionError):
+                pass
+    return reniced
+
+if __name__ == "__main__":
+    for action in WORKLOADS:
+        workload = start_workload(action, intensity=0.25, duration=1.0)
+        print(f"{action}: {workload.wait()}")
+    for path in ["/tmp/fillfile", "/dev/shm/tmpfs_stress"]:
+        if os.path.exists(path):
+            os.remove(path)